@@ -1,21 +1,28 @@
 import gzip
 import numpy as np
 from numpy import typing as npt
-import re
+import os
 from typing import List
-from zipfile import ZipFile
 
 import annotation
+import bundle
 
 
 def get_input_zip_path(data_path: str, ancestry: str) -> str:
     return f'{data_path}/inputs/annotation_inputs.{ancestry}.zip'
 
 
-def get_version(data_path: str, ancestry: str) -> str:
-    with ZipFile(get_input_zip_path(data_path, ancestry)) as input_zip:
-        with input_zip.open('version', 'r') as f:
-            return f.readline().decode().strip()
+def open_bundle(data_path: str, ancestry: str) -> bundle.InputBundle:
+    return bundle.InputBundle(get_input_zip_path(data_path, ancestry))
+
+
+# The input path the bundle was opened from, the frq files are read from next to it
+def get_input_path(input_bundle: bundle.InputBundle) -> str:
+    return os.path.dirname(os.path.dirname(input_bundle.zip_path))
+
+
+def get_version(input_bundle: bundle.InputBundle) -> str:
+    return input_bundle.read_line('version')
 
 
 def baseline_annot_path() -> str:
@@ -54,62 +61,44 @@ def idxs_path(phenotype: str) -> str:
     return f'phenotypes/{phenotype}/idxs.npy'
 
 
-def get_all_phenotypes(data_path: str, ancestry: str) -> List[str]:
-    with ZipFile(get_input_zip_path(data_path, ancestry)) as input_zip:
-        return [phenotype for file in input_zip.filelist
-                for phenotype in re.findall(r'phenotypes/([^/]*)/y.npy', file.filename)]
+def get_all_phenotypes(input_bundle: bundle.InputBundle) -> List[str]:
+    return [phenotype for phenotype, members in input_bundle.index.phenotypes.items() if y_path(phenotype) in members]
 
 
-def get_weights(data_path: str, ancestry: str, phenotype: str) -> npt.NDArray:
-    with ZipFile(get_input_zip_path(data_path, ancestry)) as input_zip:
-        with input_zip.open(weights_path(phenotype), 'r') as f:
-            return np.load(f)
+def get_weights(input_bundle: bundle.InputBundle, phenotype: str) -> npt.NDArray:
+    return input_bundle.load_npy(weights_path(phenotype))
 
 
-def get_sample_size(data_path: str, ancestry: str, phenotype: str) -> npt.NDArray:
-    with ZipFile(get_input_zip_path(data_path, ancestry)) as input_zip:
-        with input_zip.open(sample_size_path(phenotype), 'r') as f:
-            return np.load(f)
+def get_sample_size(input_bundle: bundle.InputBundle, phenotype: str) -> npt.NDArray:
+    return input_bundle.load_npy(sample_size_path(phenotype))
 
 
-def get_y(data_path: str, ancestry: str, phenotype: str) -> npt.NDArray:
-    with ZipFile(get_input_zip_path(data_path, ancestry)) as input_zip:
-        with input_zip.open(y_path(phenotype), 'r') as f:
-            return np.load(f)
+def get_y(input_bundle: bundle.InputBundle, phenotype: str) -> npt.NDArray:
+    return input_bundle.load_npy(y_path(phenotype))
 
 
-def get_idxs(data_path: str, ancestry: str, phenotype: str) -> npt.NDArray:
-    with ZipFile(get_input_zip_path(data_path, ancestry)) as input_zip:
-        with input_zip.open(idxs_path(phenotype), 'r') as f:
-            return np.load(f)
+def get_idxs(input_bundle: bundle.InputBundle, phenotype: str) -> npt.NDArray:
+    return input_bundle.load_npy(idxs_path(phenotype))
 
 
-def get_baseline_ld(data_path: str, ancestry: str) -> npt.NDArray:
-    with ZipFile(get_input_zip_path(data_path, ancestry)) as input_zip:
-        with input_zip.open(baseline_ld_path(), 'r') as f:
-            return np.load(f)
+def get_baseline_ld(input_bundle: bundle.InputBundle) -> npt.NDArray:
+    return input_bundle.load_npy(baseline_ld_path())
 
 
-def get_baseline_variables(data_path: str, ancestry: str) -> List[str]:
-    with ZipFile(get_input_zip_path(data_path, ancestry)) as input_zip:
-        with input_zip.open(baseline_variable_path(), 'r') as f:
-            return f.readline().decode().strip().split('\t')
+def get_baseline_variables(input_bundle: bundle.InputBundle) -> List[str]:
+    return input_bundle.read_line(baseline_variable_path()).split('\t')
 
 
-def get_baseline_parameter_snps(data_path: str, ancestry: str) -> npt.NDArray:
-    with ZipFile(get_input_zip_path(data_path, ancestry)) as input_zip:
-        with input_zip.open(baseline_parameter_snps_path(), 'r') as f:
-            return np.load(f)
+def get_baseline_parameter_snps(input_bundle: bundle.InputBundle) -> npt.NDArray:
+    return input_bundle.load_npy(baseline_parameter_snps_path())
 
 
-def get_overlap(input_path: str, data_path: str, ancestry: str) -> npt.NDArray:
-    with ZipFile(get_input_zip_path(input_path, ancestry)) as input_zip:
-        with input_zip.open(baseline_annot_path(), 'r') as f:
-            baseline_annot = np.load(f)
+def get_overlap(input_bundle: bundle.InputBundle, data_path: str, ancestry: str) -> npt.NDArray:
+    baseline_annot = input_bundle.load_npy(baseline_annot_path())
     out = []
     for chromosome in range(1, 23):
         with gzip.open(annotation.annotation_path(data_path, chromosome), 'rt') as annot_file, \
-                open(frq_path(input_path, ancestry, chromosome), 'r') as frq_file:
+                open(frq_path(get_input_path(input_bundle), ancestry, chromosome), 'r') as frq_file:
             annot_file.readline(), frq_file.readline()
             for annot_line, frq_line in zip(annot_file, frq_file):
                 frq = float(frq_line.strip().split('\t')[4])
@@ -42,46 +42,43 @@ def annot_sldsc(data_path: str, metadata: Dict) -> Dict:
     check_inputs(ancestry)
     check_frq(ancestry)
 
-    overlap_matrix = annot_inputs.get_overlap(input_path, data_path, ancestry)
-    total_snps = overlap_matrix[0][0]
-
-    baseline_variables = annot_inputs.get_baseline_variables(input_path, ancestry)
-    baseline_ld = annot_inputs.get_baseline_ld(input_path, ancestry)
-    baseline_parameter_snps = annot_inputs.get_baseline_parameter_snps(input_path, ancestry)
-    annotation_variable = ['custom___annotation']
-    annotation_ld = annotation.get_ld(data_path)
-    annotation_parameter_snps = annotation.get_parameter_snps(data_path)
-
-    variables = baseline_variables + annotation_variable
-    parameter_snps = np.vstack((baseline_parameter_snps, annotation_parameter_snps))
-
-    output = {}
-    phenotypes = annot_inputs.get_all_phenotypes(input_path, ancestry)
-    for i, phenotype in enumerate(phenotypes):
-        baseline_weights = annot_inputs.get_weights(input_path, ancestry, phenotype)
-        sample_size = annot_inputs.get_sample_size(input_path, ancestry, phenotype)
-        y = annot_inputs.get_y(input_path, ancestry, phenotype)
-        idxs = annot_inputs.get_idxs(input_path, ancestry, phenotype)
-        mean_sample_size = float(np.mean(sample_size))
-
-        baseline_x = xtx_xty.get_x(baseline_ld[idxs, :], baseline_weights, sample_size)
-        annotation_x = xtx_xty.get_x(annotation_ld[idxs, :], baseline_weights, sample_size)
-        x = np.hstack((baseline_x, annotation_x, baseline_weights))
-
-        separators = xtx_xty.get_separators(x.shape[0], MAX_BLOCKS)
-        xtx = xtx_xty.get_xtx(x, separators)
-        xty = xtx_xty.get_xty(x, y, separators)
-
-        values = ldsc.get_h2(xtx, xty, overlap_matrix, parameter_snps, total_snps, mean_sample_size)
-        for variable, value in zip(variables, values):
-            variable_type, variable_name = variable.split('___')
-            if variable_type not in output:
-                output[variable_type] = []
-            line = f'{phenotype}\t{ancestry}\t{variable_name}\t{value["enrichment"]}\t{value["pValue"]}\n'
-            output[variable_type].append(line)
-            if variable_type == 'custom':
-                print(i, line.strip())
-    save_data(output, data_path)
-
-    metadata['version'] = annot_inputs.get_version(input_path, metadata['ancestry'])
+    with annot_inputs.open_bundle(input_path, ancestry) as input_bundle:
+        overlap_matrix = annot_inputs.get_overlap(input_bundle, data_path, ancestry)
+        total_snps = overlap_matrix[0][0]
+
+        baseline_variables = annot_inputs.get_baseline_variables(input_bundle)
+        baseline_ld = annot_inputs.get_baseline_ld(input_bundle)
+        baseline_parameter_snps = annot_inputs.get_baseline_parameter_snps(input_bundle)
+        annotation_variable = ['custom___annotation']
+        annotation_ld = annotation.get_ld(data_path)
+        annotation_parameter_snps = annotation.get_parameter_snps(data_path)
+
+        variables = baseline_variables + annotation_variable
+        parameter_snps = np.vstack((baseline_parameter_snps, annotation_parameter_snps))
+
+        output = {}
+        phenotypes = annot_inputs.get_all_phenotypes(input_bundle)
+        for i, phenotype in enumerate(phenotypes):
+            baseline_weights = annot_inputs.get_weights(input_bundle, phenotype)
+            sample_size = annot_inputs.get_sample_size(input_bundle, phenotype)
+            y = annot_inputs.get_y(input_bundle, phenotype)
+            idxs = annot_inputs.get_idxs(input_bundle, phenotype)
+            mean_sample_size = float(np.mean(sample_size))
+
+            separators = xtx_xty.get_separators(len(idxs), MAX_BLOCKS)
+            xtx, xty = xtx_xty.get_streamed_xtx_xty([baseline_ld, annotation_ld], idxs, baseline_weights, sample_size, y,
+                                                    separators, dtype=xtx_xty.LD_DTYPE)
+
+            values = ldsc.get_h2(xtx, xty, overlap_matrix, parameter_snps, total_snps, mean_sample_size)
+            for variable, value in zip(variables, values):
+                variable_type, variable_name = variable.split('___')
+                if variable_type not in output:
+                    output[variable_type] = []
+                line = f'{phenotype}\t{ancestry}\t{variable_name}\t{value["enrichment"]}\t{value["pValue"]}\n'
+                output[variable_type].append(line)
+                if variable_type == 'custom':
+                    print(i, line.strip())
+        save_data(output, data_path)
+
+        metadata['version'] = annot_inputs.get_version(input_bundle)
     return metadata
@@ -1,8 +1,9 @@
-import gzip
 import numpy as np
 from numpy import typing as npt
 from typing import List
 
+import tsv
+
 
 def annotation_path(data_path: str, chromosome: int) -> str:
     return f'{data_path}/sldsc/annot-ld/ld.{chromosome}.annot.gz'
@@ -17,13 +18,8 @@ def annotation_m_path(data_path: str, chromosome: int) -> str:
 
 
 def get_ld(data_path: str) -> npt.NDArray:
-    output = []
-    for chromosome in range(1, 23):
-        with gzip.open(annotation_ld_path(data_path, chromosome), 'rt') as f:
-            _ = f.readline()
-            for line in f:
-                output.append(float(line.strip().split('\t')[3]))
-    return np.array([output]).T
+    output = [tsv.read_columns(annotation_ld_path(data_path, chromosome), [3], [float])[0] for chromosome in range(1, 23)]
+    return np.concatenate(output).reshape(-1, 1)
 
 
 def get_parameter_snps(ancestry: str) -> List[str]:
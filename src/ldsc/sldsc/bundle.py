@@ -0,0 +1,116 @@
+from collections import OrderedDict
+import numpy as np
+from numpy import typing as npt
+import re
+import struct
+import threading
+from typing import Dict, List, NamedTuple
+from zipfile import ZipFile, ZipInfo, ZIP_STORED
+
+ZIP_LOCAL_HEADER = struct.Struct('<4s2B4HL2L2H')  # as zipfile.structFileHeader, ends with the name and extra lengths
+ZIP_LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+ARRAY_CACHE_SIZE = 1 << 26  # bytes of inflated arrays kept by an InputBundle, memory mapped arrays count as 0
+TISSUE_MEMBER = re.compile(r'tissue/tissue_[a-z_]+\.(.+)\.[^.]+\.(?:npy|txt)')  # tissue_<kind>.<tissue>.<ancestry>
+PHENOTYPE_MEMBER = re.compile(r'phenotypes/([^/]+)/[^/]+')
+
+
+# Start of the member's data in the zip file, after its local header (which can differ from the central directory one)
+def get_data_offset(input_zip: ZipFile, member: str) -> int:
+    info = input_zip.getinfo(member)
+    input_zip.fp.seek(info.header_offset)
+    header = ZIP_LOCAL_HEADER.unpack(input_zip.fp.read(ZIP_LOCAL_HEADER.size))
+    if header[0] != ZIP_LOCAL_HEADER_SIGNATURE:
+        raise ValueError(f'Bad local header for {member}')
+    return info.header_offset + ZIP_LOCAL_HEADER.size + header[-2] + header[-1]
+
+
+# Uncompressed (ZIP_STORED) .npy members are memory mapped in place, so the pages are shared through the page cache by
+# every process reading the bundle, compressed members are inflated into memory
+def load_npy(input_zip: ZipFile, member: str) -> npt.NDArray:
+    info = input_zip.getinfo(member)
+    if info.compress_type == ZIP_STORED and input_zip.filename is not None:
+        offset = get_data_offset(input_zip, member)
+        input_zip.fp.seek(offset)
+        version = np.lib.format.read_magic(input_zip.fp)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(input_zip.fp)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(input_zip.fp)
+        if not dtype.hasobject and np.prod(shape) > 0:
+            return np.memmap(input_zip.filename, dtype=dtype, mode='r', offset=input_zip.fp.tell(), shape=shape,
+                             order='F' if fortran_order else 'C')
+    with input_zip.open(member, 'r') as f:
+        return np.load(f)
+
+
+class MemberIndex(NamedTuple):
+    baseline: List[str]
+    overlap: List[str]
+    tissues: Dict[str, List[str]]  # tissue -> its tissue/ members, in archive order
+    phenotypes: Dict[str, List[str]]  # phenotype -> its phenotypes/<phenotype>/ members, in archive order
+
+
+def get_member_index(members: List[str]) -> MemberIndex:
+    index = MemberIndex([], [], {}, {})
+    for member in members:
+        tissue, phenotype = TISSUE_MEMBER.fullmatch(member), PHENOTYPE_MEMBER.fullmatch(member)
+        if tissue is not None:
+            index.tissues.setdefault(tissue.group(1), []).append(member)
+        elif phenotype is not None:
+            index.phenotypes.setdefault(phenotype.group(1), []).append(member)
+        elif member.startswith('baseline/'):
+            index.baseline.append(member)
+        elif member.startswith('overlap/'):
+            index.overlap.append(member)
+    return index
+
+
+# An input zip opened once per job, with its members indexed and the most recently loaded arrays cached (read only, as
+# they are shared between callers). Reads are serialized so the bundle can be used from a prefetch thread, and it is
+# pickled as its path so worker processes reopen it
+class InputBundle:
+    def __init__(self, zip_path: str, cache_size: int = ARRAY_CACHE_SIZE):
+        self.zip_path = zip_path
+        self.cache_size = cache_size
+        self.input_zip = ZipFile(zip_path)
+        self.members: Dict[str, ZipInfo] = {info.filename: info for info in self.input_zip.infolist()}
+        self.index = get_member_index(list(self.members))
+        self.cache: OrderedDict = OrderedDict()  # member -> (array, size)
+        self.cached_size = 0
+        self.lock = threading.Lock()
+
+    def __getstate__(self) -> Dict:
+        return {'zip_path': self.zip_path, 'cache_size': self.cache_size}
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__init__(state['zip_path'], state['cache_size'])
+
+    def __enter__(self) -> 'InputBundle':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.input_zip.close()
+        self.cache.clear()
+        self.cached_size = 0
+
+    def read_line(self, member: str) -> str:
+        with self.lock, self.input_zip.open(member, 'r') as f:
+            return f.readline().decode().strip()
+
+    def load_npy(self, member: str) -> npt.NDArray:
+        with self.lock:
+            if member in self.cache:
+                self.cache.move_to_end(member)
+                return self.cache[member][0]
+            array = load_npy(self.input_zip, member)
+            array.flags.writeable = False
+            size = 0 if isinstance(array, np.memmap) else array.nbytes
+            if size <= self.cache_size:
+                self.cache[member] = (array, size)
+                self.cached_size += size
+                while self.cached_size > self.cache_size:
+                    self.cached_size -= self.cache.popitem(last=False)[1][1]
+            return array
@@ -1,28 +1,24 @@
 import numpy as np
 from numpy import typing as npt
-import re
 from typing import List
-from zipfile import ZipFile
+
+import bundle
 
 
 def get_input_zip_path(data_path: str, ancestry: str) -> str:
     return f'{data_path}/inputs/sldsc_inputs.{ancestry}.zip'
 
 
-def get_version(data_path: str, ancestry: str) -> str:
-    with ZipFile(get_input_zip_path(data_path, ancestry)) as input_zip:
-        with input_zip.open('version', 'r') as f:
-            return f.readline().decode().strip()
+def open_bundle(data_path: str, ancestry: str) -> bundle.InputBundle:
+    return bundle.InputBundle(get_input_zip_path(data_path, ancestry))
+
+
+def get_version(input_bundle: bundle.InputBundle) -> str:
+    return input_bundle.read_line('version')
 
 
-def get_all_tissues(data_path: str, ancestry: str) -> List[str]:
-    tissues = set()
-    with ZipFile(get_input_zip_path(data_path, ancestry)) as input_zip:
-        for tissue_path in input_zip.namelist():
-            maybe_tissue = re.findall(f'tissue/tissue_ld.(.*).{ancestry}.npy', tissue_path)
-            if len(maybe_tissue) > 0:
-                tissues |= {maybe_tissue[0]}
-    return sorted(tissues)
+def get_all_tissues(input_bundle: bundle.InputBundle, ancestry: str) -> List[str]:
+    return sorted(tissue for tissue, members in input_bundle.index.tissues.items() if tissue_ld_path(tissue, ancestry) in members)
 
 
 def baseline_ld_path(ancestry: str) -> str:
@@ -61,51 +57,35 @@ def overlap_tissue_baseline_path(tissue: str, ancestry: str) -> str:
     return f'overlap/overlap.baseline.{tissue}.{ancestry}.npy'
 
 
-def get_baseline_ld(data_path: str, ancestry: str) -> npt.NDArray:
-    with ZipFile(get_input_zip_path(data_path, ancestry)) as input_zip:
-        with input_zip.open(baseline_ld_path(ancestry), 'r') as f:
-            return np.load(f)
+def get_baseline_ld(input_bundle: bundle.InputBundle, ancestry: str) -> npt.NDArray:
+    return input_bundle.load_npy(baseline_ld_path(ancestry))
 
 
-def get_baseline_variables(data_path: str, ancestry: str) -> List[str]:
-    with ZipFile(get_input_zip_path(data_path, ancestry)) as input_zip:
-        with input_zip.open(baseline_variable_path(ancestry), 'r') as f:
-            return f.readline().decode().strip().split('\t')
+def get_baseline_variables(input_bundle: bundle.InputBundle, ancestry: str) -> List[str]:
+    return input_bundle.read_line(baseline_variable_path(ancestry)).split('\t')
 
 
-def get_baseline_parameter_snps(data_path: str, ancestry: str) -> npt.NDArray:
-    with ZipFile(get_input_zip_path(data_path, ancestry)) as input_zip:
-        with input_zip.open(baseline_parameter_snps_path(ancestry), 'r') as f:
-            return np.load(f)
+def get_baseline_parameter_snps(input_bundle: bundle.InputBundle, ancestry: str) -> npt.NDArray:
+    return input_bundle.load_npy(baseline_parameter_snps_path(ancestry))
 
 
-def get_tissue_ld(data_path: str, tissue: str, ancestry: str) -> npt.NDArray:
-    with ZipFile(get_input_zip_path(data_path, ancestry)) as input_zip:
-        with input_zip.open(tissue_ld_path(tissue, ancestry), 'r') as f:
-            return np.load(f)
+def get_tissue_ld(input_bundle: bundle.InputBundle, tissue: str, ancestry: str) -> npt.NDArray:
+    return input_bundle.load_npy(tissue_ld_path(tissue, ancestry))
 
 
-def get_tissue_variables(data_path: str, tissue: str, ancestry: str) -> List[str]:
-    with ZipFile(get_input_zip_path(data_path, ancestry)) as input_zip:
-        with input_zip.open(tissue_variable_path(tissue, ancestry), 'r') as f:
-            return f.readline().decode().strip().split('\t')
+def get_tissue_variables(input_bundle: bundle.InputBundle, tissue: str, ancestry: str) -> List[str]:
+    return input_bundle.read_line(tissue_variable_path(tissue, ancestry)).split('\t')
 
 
-def get_tissue_parameter_snps(data_path: str, tissue: str, ancestry: str) -> npt.NDArray:
-    with ZipFile(get_input_zip_path(data_path, ancestry)) as input_zip:
-        with input_zip.open(tissue_parameter_snps_path(tissue, ancestry), 'r') as f:
-            return np.load(f)
+def get_tissue_parameter_snps(input_bundle: bundle.InputBundle, tissue: str, ancestry: str) -> npt.NDArray:
+    return input_bundle.load_npy(tissue_parameter_snps_path(tissue, ancestry))
 
 
-def get_overlap(data_path: str, tissue: str, ancestry: str) -> npt.NDArray:
-    with ZipFile(get_input_zip_path(data_path, ancestry)) as input_zip:
-        with input_zip.open(overlap_path(ancestry), 'r') as f:
-            baseline_overlap = np.load(f)
-        with input_zip.open(overlap_tissue_path(tissue, ancestry), 'r') as f:
-            tissue_overlap = np.load(f)
-        with input_zip.open(overlap_tissue_baseline_path(tissue, ancestry), 'r') as f:
-            baseline_tissue_overlap = np.load(f)
-        return np.vstack((
-            np.hstack((baseline_overlap, baseline_tissue_overlap)),
-            np.hstack((baseline_tissue_overlap.T, tissue_overlap))
-        ))
+def get_overlap(input_bundle: bundle.InputBundle, tissue: str, ancestry: str) -> npt.NDArray:
+    baseline_overlap = input_bundle.load_npy(overlap_path(ancestry))  # cached across tissues
+    tissue_overlap = input_bundle.load_npy(overlap_tissue_path(tissue, ancestry))
+    baseline_tissue_overlap = input_bundle.load_npy(overlap_tissue_baseline_path(tissue, ancestry))
+    return np.vstack((
+        np.hstack((baseline_overlap, baseline_tissue_overlap)),
+        np.hstack((baseline_tissue_overlap.T, tissue_overlap))
+    ))
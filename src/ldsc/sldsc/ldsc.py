@@ -1,7 +1,10 @@
 import numpy as np
 from numpy import typing as npt
 from scipy.stats import t as tdist
-from typing import Dict, List, Optional
+from typing import Dict, List, NamedTuple
+
+
+# Every input may have a leading tissues axis (tissues sharing the baseline parameters), shapes below are per tissue
 
 
 # In:  xtx (blocks, parameters + intercept, parameters + intercept)
@@ -9,7 +12,7 @@ from typing import Dict, List, Optional
 #      mean_sample_size (scalar)
 # Out: per_snp_heritability (parameters, 1) NOTE: intercept removed
 def get_per_snp_heritability(xtx: npt.NDArray, xty: npt.NDArray, mean_sample_size: float) -> npt.NDArray:
-    return np.linalg.solve(np.sum(xtx, axis=0), np.sum(xty, axis=0))[:-1, :] / mean_sample_size
+    return np.linalg.solve(np.sum(xtx, axis=-3), np.sum(xty, axis=-3))[..., :-1, :] / mean_sample_size
 
 
 # In:  xtx (blocks, parameters + intercept, parameters + intercept)
@@ -17,29 +20,26 @@ def get_per_snp_heritability(xtx: npt.NDArray, xty: npt.NDArray, mean_sample_siz
 #      mean_sample_size (scalar)
 # Out: biased_block_per_snp_heritability (blocks, parameters, 1) NOTE: intercept removed
 def get_biased_block_per_snp_heritability(xtx: npt.NDArray, xty: npt.NDArray, mean_sample_size: float) -> npt.NDArray:
-    blocks, parameters, _ = xtx.shape
-    biased_block_per_snp_heritability = np.zeros((blocks, parameters, 1))
-    xty_tot = np.sum(xty, axis=0)
-    xtx_tot = np.sum(xtx, axis=0)
-    for j in range(blocks):
-        # undo conditioning
-        biased_block_per_snp_heritability[j, :, :] = \
-            np.linalg.solve(xtx_tot - xtx[j], xty_tot - xty[j]) / mean_sample_size
-    return biased_block_per_snp_heritability[:, :-1, :]  # remove intercept
+    # every leave-one-block-out system in one stacked solve, undoing the conditioning
+    biased_block_per_snp_heritability = \
+        np.linalg.solve(np.sum(xtx, axis=-3, keepdims=True) - xtx, np.sum(xty, axis=-3, keepdims=True) - xty) / mean_sample_size
+    return biased_block_per_snp_heritability[..., :-1, :]  # remove intercept
 
 
 # In:  values (parameters, 1)
 #      biased_block_values (blocks, parameters, 1)
 # Out: unbiased_block_values (blocks, parameters, 1)
 def get_unbiased_block_values(values: npt.NDArray, biased_block_values: npt.NDArray) -> npt.NDArray:
-    blocks = biased_block_values.shape[0]
-    return blocks * values - (blocks - 1) * biased_block_values
+    blocks = biased_block_values.shape[-3]
+    return blocks * np.expand_dims(values, -3) - (blocks - 1) * biased_block_values
 
 
 # In:  unbiased_block_values (blocks, parameters, 1)
 # Out: covariance (parameters, parameters)
 def jackknife_covariance(unbiased_block_values: npt.NDArray) -> npt.NDArray:
-    return np.cov(unbiased_block_values[:, :, 0].T, ddof=1) / unbiased_block_values.shape[0]
+    blocks = unbiased_block_values.shape[-3]
+    centered = unbiased_block_values[..., 0] - np.mean(unbiased_block_values[..., 0], axis=-2, keepdims=True)
+    return np.matmul(np.swapaxes(centered, -1, -2), centered) / (blocks - 1) / blocks
 
 
 # In:  values (parameters, 1)
@@ -55,45 +55,46 @@ def get_covariance(values: npt.NDArray, biased_block_values: npt.NDArray) -> npt
 # Out: heritability_proportion (parameters, 1)
 def get_heritability_proportion(per_snp_heritability: npt.NDArray, parameter_snps: npt.NDArray) -> npt.NDArray:
     heritability = parameter_snps * per_snp_heritability
-    return heritability / np.sum(heritability)
+    return heritability / np.sum(heritability, axis=-2, keepdims=True)
 
 
 # In:  biased_block_per_snp_heritability (blocks, parameters, 1)
 #      parameter_snps (parameters, 1)
 # Out: biased_block_heritability_proportion (blocks, parameters, 1)
 def get_biased_block_heritability_proportion(biased_block_per_snp_heritability: npt.NDArray, parameter_snps: npt.NDArray) -> npt.NDArray:
-    biased_block_heritability_proportion = np.zeros(biased_block_per_snp_heritability.shape)
-    for j in range(biased_block_per_snp_heritability.shape[0]):
-        mult = np.multiply(parameter_snps, biased_block_per_snp_heritability[j, :, :])
-        biased_block_heritability_proportion[j, :, :] = mult / np.sum(mult)
-    return biased_block_heritability_proportion
+    mult = np.multiply(np.expand_dims(parameter_snps, -3), biased_block_per_snp_heritability)
+    return mult / np.sum(mult, axis=-2, keepdims=True)
 
 
 # In:  covariance_matrix (parameters, parameters)
 #      correction_matrix (parameters, parameters)
 # Out: corrected_se (parameters, 1)
 def get_corrected_se(covariance_matrix: npt.NDArray, correction_matrix: npt.NDArray) -> npt.NDArray:
-    variances = correction_matrix.dot(covariance_matrix).dot(correction_matrix.T).diagonal()
-    return np.vstack(np.sqrt(np.maximum(0, variances)))
-
-
-# Student-T survival function (1 - cdf) with blocks = dof
-def get_p_value(mu: float, se: float, blocks: int) -> Optional[float]:
-    if se != 0:
-        return 2 * tdist.sf(abs(mu / se), blocks)
-
-
-def get_h2(xtx: npt.NDArray,  # (blocks, parameters + intercept, parameters + intercept)
-           xty: npt.NDArray,  # (blocks, parameters + intercept, 1)
-           overlap_matrix: npt.NDArray,  # (parameters, parameters)
-           parameter_snps: npt.NDArray,  # (parameters, 1)
-           total_snps: float,  # (scalar)
-           mean_sample_size: float  # (scalar)
-           ) -> List[Dict]:  # list(json)
-    blocks = xtx.shape[0]
+    variances = np.sum(np.matmul(correction_matrix, covariance_matrix) * correction_matrix, axis=-1, keepdims=True)
+    return np.sqrt(np.maximum(0, variances))
+
+
+# Student-T survival function (1 - cdf) with blocks = dof, nan where se is 0
+def get_p_values(mu: npt.NDArray, se: npt.NDArray, blocks: int) -> npt.NDArray:
+    p_values = np.full(mu.shape, np.nan)
+    nonzero_se = se != 0
+    p_values[nonzero_se] = 2 * tdist.sf(np.abs(mu[nonzero_se] / se[nonzero_se]), blocks)
+    return p_values
+
+
+# Enrichment and p-values from the per SNP heritability estimates, only for the parameters from first_row on
+def get_h2_values(per_snp_heritability: npt.NDArray,  # (tissues, parameters, 1)
+                  biased_block_per_snp_heritability: npt.NDArray,  # (tissues, blocks, parameters, 1)
+                  overlap_matrix: npt.NDArray,  # (tissues, parameters, parameters)
+                  parameter_snps: npt.NDArray,  # (tissues, parameters, 1)
+                  total_snps: npt.NDArray,  # (tissues)
+                  first_row: int = 0
+                  ) -> List[List[Dict]]:  # list(list(json)) per tissue
+    blocks = biased_block_per_snp_heritability.shape[-3]
+    rows = slice(first_row, None)
+    total_snps = np.reshape(total_snps, (-1, 1, 1))
+    parameter_snps_t = np.swapaxes(parameter_snps, -1, -2)
 
-    per_snp_heritability = get_per_snp_heritability(xtx, xty, mean_sample_size)
-    biased_block_per_snp_heritability = get_biased_block_per_snp_heritability(xtx, xty, mean_sample_size)
     per_snp_heritability_covariance = get_covariance(per_snp_heritability, biased_block_per_snp_heritability)
 
     heritability_proportion = get_heritability_proportion(per_snp_heritability, parameter_snps)
@@ -101,30 +102,111 @@ def get_h2(xtx: npt.NDArray,  # (blocks, parameters + intercept, parameters + in
     heritability_proportion_covariance = get_covariance(heritability_proportion, biased_block_heritability_proportion)
 
     # adjust based on overlap (equation 3: https://www.ncbi.nlm.nih.gov/pmc/articles/PMC4626285/)
-    attenuation_correction = np.multiply(overlap_matrix, 1 / parameter_snps.T)
-    corrected_heritability_proportion = attenuation_correction.dot(heritability_proportion)
+    attenuation_correction = np.multiply(overlap_matrix[..., rows, :], 1 / parameter_snps_t)
+    corrected_heritability_proportion = np.matmul(attenuation_correction, heritability_proportion)
     corrected_heritability_proportion_se = get_corrected_se(heritability_proportion_covariance, attenuation_correction)
 
-    expected_heritability_proportion = parameter_snps / total_snps
+    expected_heritability_proportion = parameter_snps[..., rows, :] / total_snps
     enrichment = corrected_heritability_proportion / expected_heritability_proportion
     enrichment_se = corrected_heritability_proportion_se / expected_heritability_proportion
 
-    parameter_snp_difference = total_snps - parameter_snps
-    attenuation_correction = np.multiply(overlap_matrix, total_snps / parameter_snps / parameter_snp_difference) - \
-                             parameter_snps.T / parameter_snp_difference
-    corrected_per_snp_heritability = attenuation_correction.dot(per_snp_heritability)
+    parameter_snp_difference = total_snps - parameter_snps[..., rows, :]
+    attenuation_correction = np.multiply(overlap_matrix[..., rows, :], total_snps / parameter_snps[..., rows, :] / parameter_snp_difference) - \
+                             parameter_snps_t / parameter_snp_difference
+    corrected_per_snp_heritability = np.matmul(attenuation_correction, per_snp_heritability)
     corrected_per_snp_heritability_se = get_corrected_se(per_snp_heritability_covariance, attenuation_correction)
 
-    p_value = [
-        get_p_value(corrected_per_snp_heritability[i][0], corrected_per_snp_heritability_se[i][0], blocks)
-        for i in range(len(corrected_per_snp_heritability_se))
-    ]
-
-    return [{
-        'expHeritability': expected_heritability_proportion[i][0],
-        'heritability': corrected_heritability_proportion[i][0],
-        'heritabilitySE': corrected_heritability_proportion_se[i][0],
-        'enrichment': enrichment[i][0],
-        'enrichmentSE': enrichment_se[i][0],
-        'pValue': p_value[i] if p_value[i] is not None else 'NA'
-    } for i in range(len(enrichment))]
+    p_value = get_p_values(corrected_per_snp_heritability[..., 0], corrected_per_snp_heritability_se[..., 0], blocks)
+
+    return [[{
+        'expHeritability': expected_heritability_proportion[k][i][0],
+        'heritability': corrected_heritability_proportion[k][i][0],
+        'heritabilitySE': corrected_heritability_proportion_se[k][i][0],
+        'enrichment': enrichment[k][i][0],
+        'enrichmentSE': enrichment_se[k][i][0],
+        'pValue': p_value[k][i] if corrected_per_snp_heritability_se[k][i][0] != 0 else 'NA'
+    } for i in range(enrichment.shape[1])] for k in range(enrichment.shape[0])]
+
+
+def get_h2_batch(xtx: npt.NDArray,  # (tissues, blocks, parameters + intercept, parameters + intercept)
+                 xty: npt.NDArray,  # (tissues, blocks, parameters + intercept, 1)
+                 overlap_matrix: npt.NDArray,  # (tissues, parameters, parameters)
+                 parameter_snps: npt.NDArray,  # (tissues, parameters, 1)
+                 total_snps: npt.NDArray,  # (tissues)
+                 mean_sample_size: float  # (scalar)
+                 ) -> List[List[Dict]]:  # list(list(json)) per tissue
+    per_snp_heritability = get_per_snp_heritability(xtx, xty, mean_sample_size)
+    biased_block_per_snp_heritability = get_biased_block_per_snp_heritability(xtx, xty, mean_sample_size)
+    return get_h2_values(per_snp_heritability, biased_block_per_snp_heritability, overlap_matrix, parameter_snps, total_snps)
+
+
+# In:  block_values (blocks, rows, columns)
+# Out: jackknife_sums (blocks + 1, rows, columns) the sum over all blocks, then the sum without each block
+def get_jackknife_sums(block_values: npt.NDArray) -> npt.NDArray:
+    total = np.sum(block_values, axis=-3, keepdims=True)
+    return np.concatenate((total, total - block_values), axis=-3)
+
+
+class BaselineSolves(NamedTuple):
+    inverses: npt.NDArray  # (blocks + 1, baseline + intercept, baseline + intercept) inverse jackknife sums of XtX
+    solutions: npt.NDArray  # (blocks + 1, baseline + intercept, 1) baseline only regression of every jackknife sum
+
+
+# In:  base_xtx (blocks, baseline + intercept, baseline + intercept)
+#      base_xty (blocks, baseline + intercept, 1)
+# Out: baseline_solves, shared by every tissue regressed on the same trait
+def get_baseline_solves(base_xtx: npt.NDArray, base_xty: npt.NDArray) -> BaselineSolves:
+    xtx, xty = get_jackknife_sums(base_xtx), get_jackknife_sums(base_xty)
+    return BaselineSolves(np.linalg.inv(xtx), np.linalg.solve(xtx, xty))
+
+
+# Partitioned solve of [[B, U], [U.T, T]] [b, t] = [c_b, c_t] for every jackknife sum, B being the baseline system:
+# t = S^-1 (c_t - U.T B^-1 c_b) with the Schur complement S = T - U.T B^-1 U, then b = B^-1 c_b - B^-1 U t
+# In:  baseline_solves
+#      base_tissue_xtx (tissues, blocks, baseline + intercept, tissue parameters)
+#      tissue_xtx (tissues, blocks, tissue parameters, tissue parameters)
+#      tissue_xty (tissues, blocks, tissue parameters, 1)
+#      mean_sample_size (scalar)
+# Out: per_snp_heritability (tissues, parameters, 1), biased_block_per_snp_heritability (tissues, blocks, parameters, 1)
+#      NOTE: intercept removed, parameters are the baseline then the tissue parameters as in get_h2
+def get_schur_per_snp_heritability(baseline_solves: BaselineSolves, base_tissue_xtx: npt.NDArray, tissue_xtx: npt.NDArray,
+                                   tissue_xty: npt.NDArray, mean_sample_size: float) -> (npt.NDArray, npt.NDArray):
+    base_tissue_xtx = get_jackknife_sums(base_tissue_xtx)
+    base_tissue_xtx_t = np.swapaxes(base_tissue_xtx, -1, -2)
+    projection = np.matmul(baseline_solves.inverses, base_tissue_xtx)  # B^-1 U
+    schur_complement = get_jackknife_sums(tissue_xtx) - np.matmul(base_tissue_xtx_t, projection)
+    tissue_solutions = np.linalg.solve(schur_complement,
+                                       get_jackknife_sums(tissue_xty) - np.matmul(base_tissue_xtx_t, baseline_solves.solutions))
+    base_solutions = baseline_solves.solutions - np.matmul(projection, tissue_solutions)
+    solutions = np.concatenate((base_solutions[..., :-1, :], tissue_solutions), axis=-2) / mean_sample_size  # remove intercept
+    return solutions[..., 0, :, :], solutions[..., 1:, :, :]
+
+
+# Same values as get_h2_batch for tissues regressed on the same baseline, from the baseline solves and the tissue terms
+# (see xtx_xty.get_group_xtx_xty), with only the tissue rows if baseline_rows is False
+def get_h2_schur(baseline_solves: BaselineSolves,
+                 base_tissue_xtx: npt.NDArray,  # (tissues, blocks, baseline + intercept, tissue parameters)
+                 tissue_xtx: npt.NDArray,  # (tissues, blocks, tissue parameters, tissue parameters)
+                 tissue_xty: npt.NDArray,  # (tissues, blocks, tissue parameters, 1)
+                 overlap_matrix: npt.NDArray,  # (tissues, parameters, parameters)
+                 parameter_snps: npt.NDArray,  # (tissues, parameters, 1)
+                 total_snps: npt.NDArray,  # (tissues)
+                 mean_sample_size: float,  # (scalar)
+                 baseline_rows: bool = True
+                 ) -> List[List[Dict]]:  # list(list(json)) per tissue
+    per_snp_heritability, biased_block_per_snp_heritability = \
+        get_schur_per_snp_heritability(baseline_solves, base_tissue_xtx, tissue_xtx, tissue_xty, mean_sample_size)
+    first_row = 0 if baseline_rows else baseline_solves.solutions.shape[-2] - 1
+    return get_h2_values(per_snp_heritability, biased_block_per_snp_heritability, overlap_matrix, parameter_snps,
+                         total_snps, first_row)
+
+
+def get_h2(xtx: npt.NDArray,  # (blocks, parameters + intercept, parameters + intercept)
+           xty: npt.NDArray,  # (blocks, parameters + intercept, 1)
+           overlap_matrix: npt.NDArray,  # (parameters, parameters)
+           parameter_snps: npt.NDArray,  # (parameters, 1)
+           total_snps: float,  # (scalar)
+           mean_sample_size: float  # (scalar)
+           ) -> List[Dict]:  # list(json)
+    return get_h2_batch(xtx[np.newaxis], xty[np.newaxis], overlap_matrix[np.newaxis], parameter_snps[np.newaxis],
+                        np.array([total_snps]), mean_sample_size)[0]
@@ -1,5 +1,6 @@
 import argparse
 import json
+import os
 from typing import Dict
 
 import sldsc, annot_sldsc, make_annot, make_ld, make_sumstats
@@ -12,6 +13,7 @@ def get_metadata(data_path: str) -> Dict:
 
 
 def save_metadata(data_path: str, method: str, metadata: Dict) -> None:
+    os.makedirs(f'{data_path}/sldsc/{method}', exist_ok=True)
     with open(f'{data_path}/sldsc/{method}/metadata', 'w') as f:
         json.dump(metadata, f)
 
@@ -22,11 +24,20 @@ def main():
     parser.add_argument('--method', default=None, required=True, type=str)
     args = parser.parse_args()
 
+    if args.method == 'sldsc-batch':  # --dir holds a directory per dataset, each with its munged sldsc/sumstats
+        data_paths = sorted(f'{args.dir}/{name}' for name in os.listdir(args.dir)
+                            if os.path.exists(f'{args.dir}/{name}/sldsc/sumstats/metadata'))
+        metadatas = sldsc.sldsc_batch(data_paths, [sldsc.get_metadata(data_path) for data_path in data_paths])
+        for data_path, metadata in zip(data_paths, metadatas):
+            save_metadata(data_path, 'sldsc', metadata)
+        return
+
     metadata = get_metadata(args.dir)
 
     if args.method == 'sldsc':
         metadata = make_sumstats.sumstats(args.dir, metadata)
-        metadata = sldsc.sldsc(args.dir, metadata)
+        if metadata['preflight']['passed']:
+            metadata = sldsc.sldsc(args.dir, metadata)
     elif args.method == 'annot-sldsc':
         make_annot.annotation(args.dir, metadata)
         make_ld.ld(args.dir, metadata)
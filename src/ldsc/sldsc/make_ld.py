@@ -7,6 +7,8 @@ import subprocess
 from typing import Dict, List, Tuple
 from numpy import typing as npt
 
+import tsv
+
 input_path = os.environ.get('INPUT_PATH')
 s3_path = os.environ.get('S3_BUCKET')
 
@@ -36,21 +38,14 @@ def annotation_path(data_path: str, chromosome: str) -> str:
 
 
 def get_bim_data(ancestry: str, chromosome: str) -> Tuple[List[int], List[float], List[Tuple[str, int]]]:
-    hm3_out = []
-    all_cm = []
-    rsids = []
     hm_set = set()
     with open(hapmap_path(chromosome), 'r') as f:
         for line in f.readlines():
             hm_set |= {line.strip()}
-    with open(g1000_path(ancestry, chromosome, 'bim'), 'r') as f:
-        for idx, line in enumerate(f.readlines()):
-            split_line = line.strip().split('\t')
-            rsid = split_line[1]
-            all_cm.append(float(split_line[2]))
-            if rsid in hm_set:
-                hm3_out.append(idx)
-                rsids.append((rsid, int(split_line[3])))
+    bim_rsids, bim_cm, bim_bp = tsv.read_columns(g1000_path(ancestry, chromosome, 'bim'), [1, 2, 3], [str, float, int], header=False)
+    hm3_out = np.flatnonzero(np.isin(bim_rsids, list(hm_set))).tolist()
+    all_cm = bim_cm.tolist()
+    rsids = list(zip(bim_rsids[hm3_out].tolist(), bim_bp[hm3_out].tolist()))
     return hm3_out, all_cm, rsids
 
 
@@ -1,18 +1,46 @@
+from collections import deque
 import gzip
+from itertools import compress, islice
 import math
+import multiprocessing
 import numpy as np
+from numpy import typing as npt
 import os
-from scipy.stats import chi2
+from scipy.special import log_ndtr
+from scipy.stats import chi2, norm
+import struct
 import subprocess
-from typing import List, Dict, Optional
+import tempfile
+from typing import List, Dict, Iterator, NamedTuple, Optional, TextIO, Tuple, Union
 
+import reader, weights
+from sumstats import SUMSTATS_HEADER, SUMSTATS_MAGIC, SUMSTATS_VERSION
+
+CHUNK_SIZE = 500000
+MUNGE_PROCESSES = int(os.environ.get('MUNGE_PROCESSES', 1))  # opt in, chunks are munged on spawned worker processes
+LOG_P_THRESHOLD = math.log(1E-300)
+LOG_P_NEWTON_STEPS = 6
+PREFLIGHT_ROWS = 100000
+PREFLIGHT_MIN_PARSE_RATE = 0.5
+PREFLIGHT_MIN_PROBED = 100
+PREFLIGHT_MIN_HIT_RATE = 0.01
 var_id_columns = ['chromosome', 'position', 'reference', 'alt']
+CHROMOSOME_CODES = {**{str(chromosome): chromosome for chromosome in range(1, 23)}, 'X': 23, 'Y': 24, 'MT': 25}
+ALLELE_CODES = {'A': 0, 'C': 1, 'G': 2, 'T': 3}
+SNPMAP_MAGIC = b'SNPMAP\x00\x00'
+SNPMAP_VERSION = 1
+SNPMAP_HEADER = struct.Struct('<8sIIQQ')
+PROBE_MODULUS = 64  # the probe snpmap only holds the keys with a position divisible by this
 input_path = os.environ.get('INPUT_PATH')
 s3_path = os.environ.get('S3_BUCKET')
 
 
+def snpmap_path(ancestry: str, genome_build: str, build_type: str) -> str:
+    return f'{input_path}/snpmap/sumstats.{build_type}.{genome_build}.{ancestry}.snpmap'
+
+
 def check_snpmap(ancestry: str, genome_build: str, build_type: str) -> None:
-    if not os.path.exists(f'{input_path}/snpmap/sumstats.{build_type}.{genome_build}.{ancestry}.snpmap'):
+    if not os.path.exists(snpmap_path(ancestry, genome_build, build_type)):
         cmd = f'./bootstrap/snpmap.bootstrap.sh {s3_path} {input_path} {build_type} {genome_build} {ancestry}'
         subprocess.check_call(cmd, shell=True)
 
@@ -26,14 +54,154 @@ def check_weights(ancestry: str) -> None:
         subprocess.check_call(f'./bootstrap/weights.bootstrap.sh {s3_path} {input_path} {ancestry}', shell=True)
 
 
-def get_var_to_rs_map(ancestry: str, genome_build: str, build_type: str) -> Dict:
-    var_to_rs = {}
-    check_snpmap(ancestry, genome_build, build_type)
-    with open(f'{input_path}/snpmap/sumstats.{build_type}.{genome_build}.{ancestry}.snpmap', 'r') as f:
-        for full_row in f.readlines():
-            var_id, rs_id = full_row.strip().split('\t')
-            var_to_rs[var_id] = rs_id
-    return var_to_rs
+class VariantIndex(NamedTuple):
+    keys: npt.NDArray  # sorted packed variant keys (uint64)
+    rs_idxs: npt.NDArray  # index into rs_ids for each key
+    flipped: npt.NDArray  # whether each key has the reference and alt alleles flipped
+    rs_ids: npt.NDArray
+
+
+# Packs chromosome:position:reference:alt into chromosome (5 bits) | position (32 bits) | reference (2 bits) | alt (2 bits)
+# Anything the snpmap can't contain (non-ACGT alleles, non-canonical positions or chromosomes) is not encodable
+def encode_variants(chromosomes: List[str], positions: List[str], references: List[str], alts: List[str]) -> (npt.NDArray, npt.NDArray):
+    size = len(chromosomes)
+    chromosome_codes = np.fromiter((CHROMOSOME_CODES.get(c, -1) for c in chromosomes), dtype=np.int64, count=size)
+    position_values = np.fromiter(
+        (int(p) if p.isascii() and p.isdigit() and (p[0] != '0' or p == '0') and len(p) < 11 else -1 for p in positions),
+        dtype=np.int64, count=size
+    )
+    reference_codes = np.fromiter((ALLELE_CODES.get(r.upper(), -1) for r in references), dtype=np.int64, count=size)
+    alt_codes = np.fromiter((ALLELE_CODES.get(a.upper(), -1) for a in alts), dtype=np.int64, count=size)
+    encodable = (chromosome_codes >= 0) & (position_values >= 0) & (position_values < 2**32) & \
+        (reference_codes >= 0) & (alt_codes >= 0)
+    keys = (chromosome_codes << 36) | (position_values << 4) | (reference_codes << 2) | alt_codes
+    return np.where(encodable, keys, 0).astype(np.uint64), encodable
+
+
+def encode_var_ids(var_ids: List[str]) -> (npt.NDArray, npt.NDArray):
+    split_var_ids = [var_id.split(':') for var_id in var_ids]
+    split_var_ids = [split_var_id if len(split_var_id) == 4 else ['', '', '', ''] for split_var_id in split_var_ids]
+    return encode_variants(*(list(column) for column in zip(*split_var_ids))) if len(var_ids) > 0 else \
+        (np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=bool))
+
+
+def flip_alleles(keys: npt.NDArray) -> npt.NDArray:
+    return (keys & ~np.uint64(0xF)) | ((keys & np.uint64(0x3)) << np.uint64(2)) | ((keys >> np.uint64(2)) & np.uint64(0x3))
+
+
+# Flipped keys are added after the standard ones so that a key in both resolves to the flipped rsID
+def make_var_to_rs_index(keys: npt.NDArray, rs_ids: npt.NDArray, flipped: npt.NDArray) -> VariantIndex:
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    last = np.append(sorted_keys[1:] != sorted_keys[:-1], True)  # the last duplicate wins, as with a dict
+    unique_rs_ids, rs_idxs = np.unique(rs_ids[order][last], return_inverse=True)
+    return VariantIndex(sorted_keys[last], rs_idxs.astype(np.uint32), flipped[order][last], unique_rs_ids)
+
+
+def var_to_rs_index_from(var_to_rs: Dict, var_to_rs_flipped: Dict) -> VariantIndex:
+    keys, encodable = encode_var_ids(list(var_to_rs.keys()) + list(var_to_rs_flipped.keys()))
+    rs_ids = np.array(list(var_to_rs.values()) + list(var_to_rs_flipped.values()), dtype=str)
+    flipped = np.arange(len(keys)) >= len(var_to_rs)
+    return make_var_to_rs_index(keys[encodable], rs_ids[encodable], flipped[encodable])
+
+
+# The flipped snpmap is the standard snpmap with reference and alt swapped, so only the standard one is read
+def load_var_to_rs_index(ancestry: str, genome_build: str) -> VariantIndex:
+    check_snpmap(ancestry, genome_build, 'standard')
+    keys, rs_ids = [], []
+    with open(snpmap_path(ancestry, genome_build, 'standard'), 'r') as f:
+        lines = list(islice(f, CHUNK_SIZE))
+        while len(lines) > 0:
+            var_ids, chunk_rs_ids = zip(*(line.strip().split('\t') for line in lines))
+            chunk_keys, encodable = encode_var_ids(var_ids)
+            keys.append(chunk_keys[encodable])
+            rs_ids.append(np.array(chunk_rs_ids, dtype=str)[encodable])
+            lines = list(islice(f, CHUNK_SIZE))
+    keys, rs_ids = np.concatenate(keys), np.concatenate(rs_ids)
+    flipped = np.repeat([False, True], len(keys))
+    return make_var_to_rs_index(np.concatenate((keys, flip_alleles(keys))), np.concatenate((rs_ids, rs_ids)), flipped)
+
+
+# Binary snpmap layout (little endian): header (magic, version, rsID width, keys, rsIDs), then keys (uint64),
+# rs_idxs (uint32), flipped (uint8), zero padding to a multiple of 8 bytes and the fixed width rsID table
+def binary_snpmap_offsets(keys: int) -> (int, int, int, int):
+    rs_idxs_offset = SNPMAP_HEADER.size + 8 * keys
+    flipped_offset = rs_idxs_offset + 4 * keys
+    rs_ids_offset = flipped_offset + keys + (-(flipped_offset + keys) % 8)
+    return SNPMAP_HEADER.size, rs_idxs_offset, flipped_offset, rs_ids_offset
+
+
+def save_var_to_rs_index(file_path: str, index: VariantIndex) -> None:
+    rs_ids = np.char.encode(index.rs_ids.astype(str), 'ascii')
+    _, _, flipped_offset, rs_ids_offset = binary_snpmap_offsets(len(index.keys))
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path))  # unique per job, so concurrent builds don't interleave
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(SNPMAP_HEADER.pack(SNPMAP_MAGIC, SNPMAP_VERSION, rs_ids.itemsize, len(index.keys), len(rs_ids)))
+            f.write(index.keys.astype('<u8').tobytes())
+            f.write(index.rs_idxs.astype('<u4').tobytes())
+            f.write(index.flipped.astype(np.uint8).tobytes())
+            f.write(bytes(rs_ids_offset - flipped_offset - len(index.keys)))
+            f.write(rs_ids.tobytes())
+        os.replace(tmp_path, file_path)  # concurrent jobs never see a partial file
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def open_var_to_rs_index(file_path: str) -> VariantIndex:
+    with open(file_path, 'rb') as f:
+        magic, version, rs_id_width, keys, rs_ids = SNPMAP_HEADER.unpack(f.read(SNPMAP_HEADER.size))
+    if magic != SNPMAP_MAGIC or version != SNPMAP_VERSION:
+        raise ValueError(f'{file_path} is not a version {SNPMAP_VERSION} binary snpmap')
+    keys_offset, rs_idxs_offset, flipped_offset, rs_ids_offset = binary_snpmap_offsets(keys)
+    return VariantIndex(
+        np.memmap(file_path, dtype='<u8', mode='r', offset=keys_offset, shape=(keys,)),
+        np.memmap(file_path, dtype='<u4', mode='r', offset=rs_idxs_offset, shape=(keys,)),
+        np.memmap(file_path, dtype=np.bool_, mode='r', offset=flipped_offset, shape=(keys,)),
+        np.memmap(file_path, dtype=f'S{rs_id_width}', mode='r', offset=rs_ids_offset, shape=(rs_ids,))
+    )
+
+
+# Memory maps the prebuilt binary snpmap, building it from the text snpmap and caching it if it isn't available
+def get_var_to_rs_index(ancestry: str, genome_build: str) -> VariantIndex:
+    try:
+        check_snpmap(ancestry, genome_build, 'binary')
+        return open_var_to_rs_index(snpmap_path(ancestry, genome_build, 'binary'))
+    except (subprocess.CalledProcessError, ValueError):
+        index = load_var_to_rs_index(ancestry, genome_build)
+        save_var_to_rs_index(snpmap_path(ancestry, genome_build, 'binary'), index)
+        save_var_to_rs_index(snpmap_path(ancestry, genome_build, 'probe'), make_probe_index(index))
+        return index
+
+
+def in_probe(keys: npt.NDArray) -> npt.NDArray:
+    return ((keys >> np.uint64(4)) & np.uint64(0xFFFFFFFF)) % np.uint64(PROBE_MODULUS) == 0
+
+
+def make_probe_index(index: VariantIndex) -> VariantIndex:
+    probe = in_probe(index.keys)
+    rs_idxs, probe_rs_idxs = np.unique(index.rs_idxs[probe], return_inverse=True)
+    return VariantIndex(np.asarray(index.keys[probe]), probe_rs_idxs.astype(np.uint32), np.asarray(index.flipped[probe]),
+                        np.asarray(index.rs_ids[rs_idxs]))
+
+
+# The probe snpmap is a small download, None if it isn't available (the snpmap hit rate is then not checked)
+def get_probe_index(ancestry: str, genome_build: str) -> Optional[VariantIndex]:
+    try:
+        check_snpmap(ancestry, genome_build, 'probe')
+        return open_var_to_rs_index(snpmap_path(ancestry, genome_build, 'probe'))
+    except (subprocess.CalledProcessError, ValueError):
+        return None
+
+
+# Returns the position in index.rs_ids for each key (-1 if not in the index) and whether the key is flipped
+def lookup_rs_idxs(index: VariantIndex, keys: npt.NDArray, encodable: npt.NDArray) -> (npt.NDArray, npt.NDArray):
+    if len(index.keys) == 0:
+        return np.full(len(keys), -1, dtype=np.int64), np.zeros(len(keys), dtype=bool)
+    positions = np.minimum(np.searchsorted(index.keys, keys), len(index.keys) - 1)
+    found = encodable & (index.keys[positions] == keys)
+    return np.where(found, index.rs_idxs[positions].astype(np.int64), -1), found & index.flipped[positions]
 
 
 def get_p_value(line: Dict, col_map: Dict) -> float:
@@ -58,6 +226,45 @@ def p_to_z(p: float, beta: float) -> float:
     return np.sqrt(chi2.isf(p, 1)) * (-1)**(beta < 0)
 
 
+# Two-sided p-value to |z| solving log(sf(z)) = log(p / 2) by Newton's method, for p-values too small for chi2.isf
+def log_p_to_abs_z(log_p_values: npt.NDArray) -> npt.NDArray:
+    target = log_p_values - np.log(2)
+    t = -2 * target
+    z = np.sqrt(t - np.log(t) - np.log(2 * np.pi))  # asymptotic starting point
+    for _ in range(LOG_P_NEWTON_STEPS):
+        log_sf = log_ndtr(-z)
+        z = z + (log_sf - target) * np.exp(log_sf - norm.logpdf(z))
+    return z
+
+
+def p_to_z_batch(p_values: npt.NDArray, betas: npt.NDArray, log_p_values: Optional[npt.NDArray] = None) -> npt.NDArray:
+    if log_p_values is None:
+        with np.errstate(divide='ignore'):
+            log_p_values = np.log(p_values)
+    extreme = log_p_values < LOG_P_THRESHOLD
+    abs_z = np.empty(len(p_values))
+    abs_z[~extreme] = np.sqrt(chi2.isf(p_values[~extreme], 1))
+    abs_z[extreme] = log_p_to_abs_z(log_p_values[extreme])
+    return abs_z * np.where(betas < 0, -1.0, 1.0)
+
+
+# Recovers p-values that underflow a float (e.g. 1E-400) from the mantissa and exponent, -inf if not positive
+def parse_log_p(value: str) -> float:
+    mantissa, _, exponent = value.strip().lower().partition('e')
+    try:
+        return math.log(float(mantissa)) + int(exponent or 0) * math.log(10)
+    except ValueError:
+        return -math.inf
+
+
+def get_log_p_values(p_value_column: List[Optional[str]], p_values: npt.NDArray) -> npt.NDArray:
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_p_values = np.log(p_values)
+        for idx in np.flatnonzero(p_values < np.finfo(float).tiny).tolist():
+            log_p_values[idx] = parse_log_p(p_value_column[idx])
+    return log_p_values
+
+
 def valid_line(line: Dict, col_map: Dict, effective_n: Optional[float]) -> bool:
     return all([line.get(col_map[column]) is not None for column in var_id_columns]) and \
         col_map['pValue'] in line and line[col_map['pValue']] != '' and \
@@ -66,63 +273,315 @@ def valid_line(line: Dict, col_map: Dict, effective_n: Optional[float]) -> bool:
         0 < float(line[col_map['pValue']]) <= 1
 
 
-def stream_to_data(file_path: str, var_to_rs_map: Dict, var_to_rs_flipped: Dict, metadata: Dict) -> (List, Dict):
+def get_column_idxs(header: List[str], col_map: Dict) -> Dict[str, int]:
+    header_idxs = {column: idx for idx, column in enumerate(header)}  # last duplicate wins, as with dict(zip(...))
+    return {key: header_idxs[column] for key, column in col_map.items() if column in header_idxs}
+
+
+def read_lines(f_in: TextIO) -> Iterator[List[str]]:
+    lines = list(islice(f_in, CHUNK_SIZE))
+    while len(lines) > 0:
+        yield lines
+        lines = list(islice(f_in, CHUNK_SIZE))
+
+
+# (rows, columns) where columns only holds the col_map columns, None where a row is too short to have a value
+def split_lines(lines: List[str], separator: str, column_idxs: Dict[str, int]) -> Tuple[int, Dict[str, List]]:
+    width = max(column_idxs.values(), default=-1) + 1
+    rows = [line.strip().split(separator) for line in lines]
+    if min(map(len, rows)) < width:
+        padding = [None] * width
+        rows = [row if len(row) >= width else row + padding[len(row):] for row in rows]
+    return len(rows), {key: [row[idx] for row in rows] for key, idx in column_idxs.items()}
+
+
+def read_chunks(f_in: TextIO, separator: str, column_idxs: Dict[str, int]) -> Iterator[Tuple[int, Dict[str, List]]]:
+    for lines in read_lines(f_in):
+        yield split_lines(lines, separator, column_idxs)
+
+
+def to_float(values: List[Optional[str]]) -> (npt.NDArray, npt.NDArray):
+    if None not in values:
+        try:
+            return np.array(values, dtype=float), np.ones(len(values), dtype=bool)
+        except ValueError:
+            pass
+    floats = np.full(len(values), np.nan)
+    parsed = np.zeros(len(values), dtype=bool)
+    for i, value in enumerate(values):
+        try:
+            floats[i] = float(value)
+            parsed[i] = True
+        except (ValueError, TypeError):
+            pass
+    return floats, parsed
+
+
+def get_column(columns: Dict, key: str, size: int) -> List[Optional[str]]:
+    return columns[key] if key in columns else [None] * size
+
+
+def present(columns: Dict, key: str, size: int) -> npt.NDArray:
+    return np.fromiter((value is not None for value in get_column(columns, key, size)), dtype=bool, count=size)
+
+
+def get_betas(columns: Dict, col_map: Dict, size: int) -> (npt.NDArray, npt.NDArray):
+    if 'beta' in col_map:
+        return to_float(get_column(columns, 'beta', size))
+    odds_ratios, parsed = to_float(get_column(columns, 'oddsRatio', size))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.log(odds_ratios), parsed & ~(odds_ratios <= 0)  # math.log domain error on non-positive values
+
+
+def get_ns(columns: Dict, effective_n: Optional[float], size: int) -> (npt.NDArray, npt.NDArray):
+    if effective_n is not None:
+        return np.full(size, effective_n), np.ones(size, dtype=bool)  # an integer effective_n is written as one
+    return to_float(get_column(columns, 'n', size))
+
+
+# vectorized valid_line, also returns the rows with a pValue that can't be converted to a float and the parsed pValues
+def valid_mask(columns: Dict, col_map: Dict, effective_n: Optional[float], size: int) -> (npt.NDArray, npt.NDArray, npt.NDArray, npt.NDArray):
+    valid = np.ones(size, dtype=bool)
+    for column in var_id_columns:
+        valid &= present(columns, column, size)
+    p_value_column = get_column(columns, 'pValue', size)
+    valid &= np.fromiter((value is not None and value != '' for value in p_value_column), dtype=bool, count=size)
+    valid &= ('beta' in col_map and present(columns, 'beta', size)) | \
+        ('oddsRatio' in col_map and present(columns, 'oddsRatio', size))
+    valid &= effective_n is not None or ('n' in col_map and present(columns, 'n', size))
+
+    p_values, parsed = to_float(p_value_column)
+    log_p_values = get_log_p_values(p_value_column, p_values)
+    with np.errstate(invalid='ignore'):
+        return valid & parsed & (log_p_values > -np.inf) & (p_values <= 1), valid & ~parsed, p_values, log_p_values
+
+
+def get_rs_ids(columns: Dict, idxs: npt.NDArray, var_to_rs_index: VariantIndex) -> (List, npt.NDArray):
+    chromosomes, positions, references, alts = ([column[idx] for idx in idxs.tolist()] for column in
+                                                (get_column(columns, c, 0) for c in var_id_columns))
+    keys, encodable = encode_variants(chromosomes, positions, references, alts)
+    rs_idxs, flipped = lookup_rs_idxs(var_to_rs_index, keys, encodable)
+    rs_ids = np.full(len(idxs), None, dtype=object)
+    rs_ids[rs_idxs >= 0] = var_to_rs_index.rs_ids[rs_idxs[rs_idxs >= 0]].astype(str)
+    return rs_ids.tolist(), flipped
+
+
+# (rsID, Z, N) for the rows of a chunk that map to an rsID, counts are updated in place
+def get_chunk_data(columns: Dict, col_map: Dict, effective_n: Optional[float], size: int,
+                   var_to_rs_index: VariantIndex, counts: Dict) -> List:
+    counts['all'] += size
+    valid, error, p_values, log_p_values = valid_mask(columns, col_map, effective_n, size)
+    valid_idxs = np.flatnonzero(valid)
+    rs_ids, flipped = get_rs_ids(columns, valid_idxs, var_to_rs_index)
+    mapped = np.array([rs_id is not None for rs_id in rs_ids], dtype=bool)
+
+    betas, beta_parsed = get_betas(columns, col_map, size)
+    ns, n_parsed = get_ns(columns, effective_n, size)
+    converted = beta_parsed[valid_idxs] & n_parsed[valid_idxs]
+    keep = mapped & converted
+    counts['error'] += int(np.sum(error)) + int(np.sum(mapped & ~converted))  # not a value that can be converted to a float, skip
+    counts['flipped'] += int(np.sum(flipped & keep))
+
+    idxs = valid_idxs[keep]
+    signed_betas = betas[idxs] * (1 - 2 * flipped[keep])
+    zs = p_to_z_batch(p_values[idxs], signed_betas, log_p_values[idxs])
+    return list(zip(compress(rs_ids, keep), zs.tolist(), ns[idxs].tolist()))
+
+
+# Set in each worker process by init_worker, inherited without a copy when the pool forks
+worker_state = {}
+
+
+# A memory mapped index is sent as its file path and mapped again by each worker, rather than pickled
+def init_worker(var_to_rs_index: Union[str, VariantIndex], metadata: Dict) -> None:
+    worker_state['var_to_rs_index'] = open_var_to_rs_index(var_to_rs_index) if isinstance(var_to_rs_index, str) else \
+        var_to_rs_index
+    worker_state['metadata'] = metadata
+
+
+def get_lines_data(lines: List[str], column_idxs: Dict[str, int]) -> (List, Dict):
+    metadata = worker_state['metadata']
+    counts = {'all': 0, 'flipped': 0, 'error': 0}
+    size, columns = split_lines(lines, metadata['separator'], column_idxs)
+    data = get_chunk_data(columns, metadata['col_map'], metadata.get('effective_n'), size, worker_state['var_to_rs_index'], counts)
+    return data, counts
+
+
+def stream_to_data(file_path: str, var_to_rs_index: VariantIndex, metadata: Dict, processes: int = 1) -> (List, Dict):
+    if processes > 1:
+        return stream_to_data_parallel(file_path, var_to_rs_index, metadata, processes)
     out = []
     counts = {'all': 0, 'flipped': 0, 'error': 0}
     effective_n = metadata.get('effective_n')
     col_map = metadata['col_map']
     separator = metadata['separator']
-    with gzip.open(file_path, 'rt') as f_in:
-        header = f_in.readline().strip().split(separator)
-        for json_string in f_in:
-            line = dict(zip(header, json_string.strip().split(separator)))
-            counts['all'] += 1
-            try:
-                if valid_line(line, col_map, effective_n):
-                    chromosome, position, reference, alt = (line[col_map[c]] for c in var_id_columns)
-                    var_id = f'{chromosome}:{position}:{reference.upper()}:{alt.upper()}'
-                    if var_id in var_to_rs_map or var_id in var_to_rs_flipped:
-                        flipped = var_id in var_to_rs_flipped
-                        rs_id = var_to_rs_flipped[var_id] if flipped else var_to_rs_map[var_id]
-                        p_value = float(line[col_map['pValue']])
-                        beta = get_beta(line, col_map) * (1 - 2 * flipped)
-                        n = get_n(line, col_map, effective_n)
-                        out.append((rs_id, p_to_z(p_value, beta), n))
-                        counts['flipped'] += flipped
-            except ValueError:  # pValue, beta, or n not a value that can be converted to a float, skip
-                counts['error'] += 1
+    with reader.open_gzip(file_path) as f_in:
+        column_idxs = get_column_idxs(f_in.readline().strip().split(separator), col_map)
+        for size, columns in read_chunks(f_in, separator, column_idxs):
+            out.extend(get_chunk_data(columns, col_map, effective_n, size, var_to_rs_index, counts))
+    counts['translated'] = len(out)
+    return out, counts
+
+
+# Chunks of lines are validated, mapped and converted in a pool of spawned processes (spawned, as the reader's
+# decompression threads are running) and merged back in file order, so the data (and the last duplicate rsID winning in
+# filter_data_to_dict) and counts are the same as for a serial run
+def stream_to_data_parallel(file_path: str, var_to_rs_index: VariantIndex, metadata: Dict, processes: int) -> (List, Dict):
+    out = []
+    counts = {'all': 0, 'flipped': 0, 'error': 0}
+    separator = metadata['separator']
+    index_source = var_to_rs_index.keys.filename if isinstance(var_to_rs_index.keys, np.memmap) else var_to_rs_index
+    with multiprocessing.get_context('spawn').Pool(processes, initializer=init_worker,
+                                                   initargs=(index_source, metadata)) as pool, \
+            reader.open_gzip(file_path) as f_in:
+        column_idxs = get_column_idxs(f_in.readline().strip().split(separator), metadata['col_map'])
+        results = deque()
+        for lines in read_lines(f_in):
+            results.append(pool.apply_async(get_lines_data, (lines, column_idxs)))
+            while len(results) > processes:
+                merge_lines_data(out, counts, *results.popleft().get())
+        while len(results) > 0:
+            merge_lines_data(out, counts, *results.popleft().get())
     counts['translated'] = len(out)
     return out, counts
 
 
+def merge_lines_data(out: List, counts: Dict, data: List, chunk_counts: Dict) -> None:
+    out.extend(data)
+    for key, value in chunk_counts.items():
+        counts[key] += value
+
+
+def get_preflight_columns(col_map: Dict, effective_n: Optional[float]) -> List[str]:
+    effect_column = 'beta' if 'beta' in col_map or 'oddsRatio' not in col_map else 'oddsRatio'
+    return var_id_columns + ['pValue', effect_column] + (['n'] if effective_n is None else [])
+
+
+def get_parse_rates(columns: Dict, col_map: Dict, effective_n: Optional[float], size: int) -> Dict:
+    p_value_column = get_column(columns, 'pValue', size)
+    p_values, parsed = to_float(p_value_column)
+    with np.errstate(invalid='ignore'):
+        p_valid = parsed & (get_log_p_values(p_value_column, p_values) > -np.inf) & (p_values <= 1)
+    rates = {'pValue': float(np.mean(p_valid)), 'beta' if 'beta' in col_map else 'oddsRatio': float(np.mean(get_betas(columns, col_map, size)[1]))}
+    if effective_n is None:
+        rates['n'] = float(np.mean(get_ns(columns, effective_n, size)[1]))
+    return rates
+
+
+# Rows sampled at probe positions that are in the probe snpmap, a sample of the full snpmap hit rate
+def get_probe_hits(columns: Dict, col_map: Dict, effective_n: Optional[float], size: int,
+                   probe_index: VariantIndex) -> (int, int):
+    valid_idxs = np.flatnonzero(valid_mask(columns, col_map, effective_n, size)[0])
+    chromosomes, positions, references, alts = ([column[idx] for idx in valid_idxs.tolist()] for column in
+                                                (get_column(columns, c, 0) for c in var_id_columns))
+    position_values = to_float(positions)[0]
+    with np.errstate(invalid='ignore'):
+        probed = position_values % PROBE_MODULUS == 0
+    keys, encodable = encode_variants(chromosomes, positions, references, alts)
+    rs_idxs, _ = lookup_rs_idxs(probe_index, keys[probed], encodable[probed])
+    return int(np.sum(probed)), int(np.sum(rs_idxs >= 0))
+
+
+# Checks the columns, parse rates and snpmap hit rate of the first PREFLIGHT_ROWS rows of the raw file before any
+# reference data is loaded or the whole file is read, reason is None if munging should go ahead
+def preflight(file_path: str, metadata: Dict, probe_index: Optional[VariantIndex]) -> Dict:
+    col_map = metadata['col_map']
+    separator = metadata['separator']
+    effective_n = metadata.get('effective_n')
+    with reader.open_gzip(file_path) as f_in:
+        header = f_in.readline().strip().split(separator)
+        lines = list(islice(f_in, PREFLIGHT_ROWS))
+    result = {'passed': False, 'reason': None, 'rows': len(lines)}
+
+    required_columns = get_preflight_columns(col_map, effective_n)
+    result['missing_columns'] = [column for column in required_columns if col_map.get(column) not in header]
+    if len(result['missing_columns']) > 0:
+        result['reason'] = 'separator' if len(header) == 1 and len(required_columns) > 1 else 'missing_columns'
+        return result
+    if len(lines) == 0:
+        result['reason'] = 'no_rows'
+        return result
+
+    size, columns = split_lines(lines, separator, get_column_idxs(header, col_map))
+    result['parse_rates'] = get_parse_rates(columns, col_map, effective_n, size)
+    if any(rate < PREFLIGHT_MIN_PARSE_RATE for rate in result['parse_rates'].values()):
+        result['reason'] = 'unparseable_columns'
+        return result
+
+    if probe_index is not None:
+        probed, hits = get_probe_hits(columns, col_map, effective_n, size, probe_index)
+        result['snpmap_probed'] = probed
+        result['snpmap_hit_rate'] = hits / probed if probed > 0 else None
+        if probed >= PREFLIGHT_MIN_PROBED and hits / probed < PREFLIGHT_MIN_HIT_RATE:
+            result['reason'] = 'snpmap_hit_rate'
+            return result
+    result['passed'] = True
+    return result
+
+
 def filter_data_to_dict(data: List) -> Dict:
     N90 = np.quantile([a[2] for a in data], 0.9)
     return {d[0]: (d[1], d[2]) for d in data if d[2] >= N90 / 1.5}
 
 
+# Scatters Z and N into LD weights row order, has_data marks the rows with a value. N keeps the type of the data's N
+# values (integers for an integer effective_n), so only the rows with data are meaningful
+def get_aligned_data(index: weights.WeightsIndex, data: Dict) -> (npt.NDArray, npt.NDArray, npt.NDArray):
+    rows = weights.get_rows(index, list(data.keys()))
+    zs = np.array([value[0] for value in data.values()], dtype=float)
+    ns = np.array([value[1] for value in data.values()])
+    z = np.full(len(index.rs_ids), np.nan)
+    n = np.zeros(len(index.rs_ids), dtype=ns.dtype)
+    has_data = np.zeros(len(index.rs_ids), dtype=bool)
+    z[rows[rows >= 0]] = zs[rows >= 0]
+    n[rows[rows >= 0]] = ns[rows >= 0]
+    has_data[rows[rows >= 0]] = True
+    return z, n, has_data
+
+
+# Z is rounded as in the gzipped sumstats so that both formats load the same values
+def get_rounded_z(z: npt.NDArray, has_data: npt.NDArray) -> npt.NDArray:
+    rounded_z = np.full(len(z), np.nan)
+    rounded_z[has_data] = [round(z_value, 3) for z_value in z[has_data].tolist()]
+    return rounded_z
+
+
+# In the binary sumstats layout of sumstats.py, read back by sumstats.load_binary_sumstats_from
+def write_binary_sumstats(out_file: str, z: npt.NDArray, n: npt.NDArray, has_data: npt.NDArray) -> None:
+    with open(out_file, 'wb') as f:
+        f.write(SUMSTATS_HEADER.pack(SUMSTATS_MAGIC, SUMSTATS_VERSION, len(z)))
+        f.write(z.astype('<f8').tobytes())
+        f.write(np.where(has_data, n, np.nan).astype('<f8').tobytes())
+        f.write(has_data.astype(np.uint8).tobytes())
+
+
+def write_sumstats(out_file: str, rs_ids: npt.NDArray, z: npt.NDArray, n: npt.NDArray, has_data: npt.NDArray) -> None:
+    with gzip.open(out_file, 'wt') as f:
+        f.write('SNP\tZ\tN\n')
+        for start in range(0, len(rs_ids), CHUNK_SIZE):
+            end = start + CHUNK_SIZE
+            f.write(''.join(
+                f'{rs_id}\t{z_value}\t{n_value}\n' if with_data else f'{rs_id}\t\t\n'
+                for rs_id, z_value, n_value, with_data in
+                zip(rs_ids[start:end].astype(str).tolist(), z[start:end].tolist(), n[start:end].tolist(), has_data[start:end].tolist())
+            ))
+
+
 def save_to_file(data_path: str, ancestry: str, data: Dict, metadata: Dict) -> Dict:
     os.makedirs(f'{data_path}/sldsc/sumstats/', exist_ok=True)
     out_file = f'{data_path}/sldsc/sumstats/sldsc.sumstats.gz'
-    with_data = 0
-    with gzip.open(out_file, 'wt') as f:
-        f.write('SNP\tZ\tN\n')
-        for rs_id in ld_rs_iter(ancestry):
-            if rs_id in data:
-                with_data += 1
-                f.write('{}\t{}\t{}\n'.format(rs_id, round(data[rs_id][0], 3), data[rs_id][1]))
-            else:
-                f.write(f'{rs_id}\t\t\n')
-    metadata['counts']['final'] = with_data
+    weights_index = get_weights_index(ancestry)
+    z, n, has_data = get_aligned_data(weights_index, data)
+    z = get_rounded_z(z, has_data)
+    write_sumstats(out_file, weights_index.rs_ids, z, n, has_data)
+    write_binary_sumstats(f'{data_path}/sldsc/sumstats/sldsc.sumstats.bin', z, n, has_data)
+    metadata['counts']['final'] = int(np.sum(has_data))
     return metadata
 
 
-def ld_rs_iter(ancestry: str) -> str:
+def get_weights_index(ancestry: str) -> weights.WeightsIndex:
     check_weights(ancestry)
-    for chromosome in range(1, 23):
-        with gzip.open(weights_path(ancestry, chromosome), 'rt') as f:
-            _ = f.readline()
-            for line in f:
-                yield line.strip().split('\t')[1]
+    return weights.get_weights_index(input_path, ancestry)
 
 
 def sumstats(data_path: str, metadata: Dict) -> Dict:
@@ -130,9 +589,12 @@ def sumstats(data_path: str, metadata: Dict) -> Dict:
     ancestry = metadata['ancestry']
     genome_build = metadata['genome_build']
 
-    var_to_rs_map = get_var_to_rs_map(ancestry, genome_build, 'standard')
-    var_to_rs_flipped = get_var_to_rs_map(ancestry, genome_build, 'flipped')
-    data, counts = stream_to_data(f'{data_path}/raw/{file}', var_to_rs_map, var_to_rs_flipped, metadata)
+    metadata['preflight'] = preflight(f'{data_path}/raw/{file}', metadata, get_probe_index(ancestry, genome_build))
+    if not metadata['preflight']['passed']:
+        return metadata
+
+    var_to_rs_index = get_var_to_rs_index(ancestry, genome_build)
+    data, counts = stream_to_data(f'{data_path}/raw/{file}', var_to_rs_index, metadata, MUNGE_PROCESSES)
     metadata['counts'] = counts
     if len(data) > 0:
         data_dict = filter_data_to_dict(data)
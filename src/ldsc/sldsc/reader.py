@@ -0,0 +1,146 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import io
+import os
+import queue
+import struct
+import threading
+from typing import BinaryIO, Iterator, List, Optional, TextIO
+import zlib
+
+READ_SIZE = 1 << 20  # compressed bytes per read for plain gzip
+BGZF_BATCH_BLOCKS = 64  # ~4MB of decompressed data per thread pool task
+QUEUE_SIZE = 16  # decompressed batches held in memory ahead of the parser
+DECOMPRESS_THREADS = os.cpu_count() or 1
+
+
+def is_bgzf(file_path: str) -> bool:
+    with open(file_path, 'rb') as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b'\x1f\x8b\x08\x04':  # gzip magic, deflate, FEXTRA
+            return False
+        return get_bgzf_block_size(f.read(struct.unpack('<H', header[10:12])[0])) is not None
+
+
+# BSIZE (total block size - 1) from the BC subfield of the gzip extra field
+def get_bgzf_block_size(extra: bytes) -> Optional[int]:
+    idx = 0
+    while idx + 4 <= len(extra):
+        subfield_id, subfield_length = extra[idx:idx + 2], struct.unpack('<H', extra[idx + 2:idx + 4])[0]
+        if subfield_id == b'BC' and subfield_length == 2:
+            return struct.unpack('<H', extra[idx + 4:idx + 6])[0]
+        idx += 4 + subfield_length
+    return None
+
+
+def bgzf_blocks(f: BinaryIO) -> Iterator[bytes]:
+    header = f.read(12)
+    while len(header) == 12:
+        extra = f.read(struct.unpack('<H', header[10:12])[0])
+        block_size = get_bgzf_block_size(extra)
+        if block_size is None:
+            raise ValueError('Not a BGZF block')
+        yield header + extra + f.read(block_size + 1 - len(header) - len(extra))
+        header = f.read(12)
+
+
+def inflate_bgzf_batch(blocks: List[bytes]) -> bytes:
+    return b''.join(zlib.decompress(block, 31) for block in blocks)  # zlib releases the GIL
+
+
+# Batches of blocks are inflated on a thread pool, in order, with at most QUEUE_SIZE batches in flight
+def inflate_bgzf(file_path: str, put) -> None:
+    with open(file_path, 'rb') as f, ThreadPoolExecutor(DECOMPRESS_THREADS) as executor:
+        futures = deque()
+        batch = []
+        for block in bgzf_blocks(f):
+            batch.append(block)
+            if len(batch) == BGZF_BATCH_BLOCKS:
+                futures.append(executor.submit(inflate_bgzf_batch, batch))
+                batch = []
+            if len(futures) >= QUEUE_SIZE:
+                put(futures.popleft().result())
+        if len(batch) > 0:
+            futures.append(executor.submit(inflate_bgzf_batch, batch))
+        while len(futures) > 0:
+            put(futures.popleft().result())
+
+
+# Single stream inflater for plain (possibly multi-member) gzip, run ahead of the parser on its own thread
+def inflate_gzip(file_path: str, put) -> None:
+    with open(file_path, 'rb') as f:
+        decompressor = zlib.decompressobj(31)
+        data = f.read(READ_SIZE)
+        while len(data) > 0:
+            put(decompressor.decompress(data))
+            while decompressor.eof and len(decompressor.unused_data.lstrip(b'\x00')) > 0:
+                data = decompressor.unused_data.lstrip(b'\x00')
+                decompressor = zlib.decompressobj(31)
+                put(decompressor.decompress(data))
+            data = f.read(READ_SIZE)
+        if not decompressor.eof:
+            raise EOFError('Compressed file ended before the end-of-stream marker was reached')
+
+
+class DecompressedStream(io.RawIOBase):
+    def __init__(self, file_path: str):
+        super().__init__()
+        self.queue = queue.Queue(QUEUE_SIZE)
+        self.stop = threading.Event()
+        self.buffer = memoryview(b'')
+        self.done = False
+        inflate = inflate_bgzf if is_bgzf(file_path) else inflate_gzip
+        self.thread = threading.Thread(target=self.produce, args=(inflate, file_path), daemon=True)
+        self.thread.start()
+
+    def put(self, data: bytes) -> None:
+        while not self.stop.is_set():
+            try:
+                self.queue.put(data, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+        raise InterruptedError('Reader closed')
+
+    def produce(self, inflate, file_path: str) -> None:
+        try:
+            inflate(file_path, self.put)
+            self.put(None)
+        except InterruptedError:
+            pass
+        except Exception as e:  # raised to the parser in readinto
+            try:
+                self.put(e)
+            except InterruptedError:
+                pass
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while len(self.buffer) == 0:
+            if self.done:
+                return 0
+            data = self.queue.get()
+            if data is None:
+                self.done = True
+            elif isinstance(data, Exception):
+                self.done = True
+                raise data
+            else:
+                self.buffer = memoryview(data)
+        size = min(len(b), len(self.buffer))
+        b[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
+    def close(self) -> None:
+        if not self.closed:
+            self.stop.set()
+            self.thread.join()
+        super().close()
+
+
+# Drop in replacement for gzip.open(file_path, 'rt') that decompresses off the parsing thread
+def open_gzip(file_path: str) -> TextIO:
+    return io.TextIOWrapper(io.BufferedReader(DecompressedStream(file_path), READ_SIZE))
@@ -1,12 +1,29 @@
+from collections import deque
+from contextlib import closing, contextmanager
+from itertools import groupby
 import json
+import multiprocessing
 import numpy as np
+from numpy import typing as npt
 import os
+import shutil
 import subprocess
-from typing import Dict
+import tempfile
+import threading
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
 
-import inputs, ldsc, sumstats, weights, xtx_xty
+import bundle, inputs, ldsc, sumstats, weights, xtx_xty
 
 MAX_BLOCKS = 200
+SCHUR_H2 = True  # tissues share the factored baseline system, False solves each full system as get_h2 does
+BASELINE_ROWS = True  # False only outputs the tissue variables (with SCHUR_H2)
+TISSUE_BATCH = 16  # tissues multiplied and regressed together, ~16 x 200 x 100 x 100 doubles of stacked XtX
+TISSUE_PROCESSES = int(os.environ.get('TISSUE_PROCESSES', 1))  # opt in, the workers map a shared copy of the trait design
+BLAS_THREAD_VARIABLES = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS']
+SHARED_MEMORY_PATH = '/dev/shm'
+PREFETCH_MEMORY = 1 << 28  # bytes of loaded tissue LD (~27 single annotation tissues of 1.2M SNPs) queued per process
+TRAIT_BATCH = 8  # trait designs held together by sldsc_batch, each ~1GB for 1.2M SNPs x 100 float64 columns
+SPOT_CHECK_BLOCKS = 4  # jackknife blocks of the base design recomputed in float64 when LD_DTYPE is float32
 input_path = os.environ.get('INPUT_PATH')
 s3_path = os.environ.get('S3_BUCKET')
 
@@ -41,6 +58,290 @@ def save_data(output: Dict, data_path: str) -> None:
                 f.write(line)
 
 
+class TraitDesign(NamedTuple):
+    base_x: npt.NDArray  # weighted [baseline, intercept] design (snps, baseline parameters + 1)
+    base_xtx: npt.NDArray  # (blocks, baseline parameters + 1, baseline parameters + 1)
+    base_xty: npt.NDArray  # (blocks, baseline parameters + 1, 1)
+    y: npt.NDArray  # weighted chisq (snps, 1)
+    weights: npt.NDArray  # regression weights (snps, 1)
+    sample_size: npt.NDArray  # (snps, 1)
+    separators: List[int]  # jackknife block boundaries
+    mean_sample_size: float
+    baseline_solves: ldsc.BaselineSolves
+
+
+class TissueInputs(NamedTuple):
+    tissue: str
+    variables: List[str]  # baseline and tissue variables
+    ld: npt.NDArray  # tissue LD of the sumstats SNPs (snps, tissue parameters)
+    overlap_matrix: npt.NDArray  # (parameters, parameters)
+    parameter_snps: npt.NDArray  # (parameters, 1)
+    total_snps: float
+
+
+# Everything in the regression that doesn't depend on the tissue. base_x is gathered from the (memory mapped) baseline
+# LD and weighted in place, the weights come from the row sums of the gathered LD before it is weighted
+def get_trait_design(baseline_ld: npt.NDArray, idxs: npt.NDArray, sumstats_weights: npt.NDArray, chisq: npt.NDArray,
+                     sample_size: npt.NDArray, baseline_parameter_snps: npt.NDArray) -> TraitDesign:
+    separators = xtx_xty.get_separators(len(idxs), MAX_BLOCKS)
+    base_x = np.empty((len(idxs), baseline_ld.shape[1] + 1), dtype=xtx_xty.LD_DTYPE)
+    xtx_xty.gather_ld(base_x, [baseline_ld], idxs)
+    baseline_ld_sum = np.sum(base_x[:, :-1], axis=1, keepdims=True, dtype=np.float64)
+    baseline_weights = xtx_xty.get_weight_from_ld_sum(baseline_ld_sum, sumstats_weights, sample_size, chisq, baseline_parameter_snps)
+    xtx_xty.scale_x(base_x, baseline_weights, sample_size, np.mean(sample_size))
+    y = xtx_xty.get_y(chisq, baseline_weights)
+
+    base_xtx = xtx_xty.get_xtx(base_x, separators)
+    base_xty = xtx_xty.get_xty(base_x, y, separators)
+    return TraitDesign(base_x, base_xtx, base_xty, y, baseline_weights, sample_size, separators, float(np.mean(sample_size)),
+                       ldsc.get_baseline_solves(base_xtx, base_xty))
+
+
+class TraitInputs(NamedTuple):
+    input_bundle: bundle.InputBundle  # reopened by each worker process
+    ancestry: str
+    idxs: npt.NDArray  # LD rows of the sumstats SNPs
+    baseline_variables: List[str]
+    baseline_parameter_snps: npt.NDArray  # (baseline parameters, 1)
+
+
+# The tissue inputs shared by every trait of the ancestry, ld is the tissue LD of all LD SNPs (memory mapped when the
+# bundle stores it uncompressed)
+def load_tissue_inputs(tissue: str, trait_inputs: TraitInputs) -> TissueInputs:
+    input_bundle, ancestry = trait_inputs.input_bundle, trait_inputs.ancestry
+    overlap_matrix = inputs.get_overlap(input_bundle, tissue, ancestry)
+    variables = trait_inputs.baseline_variables + inputs.get_tissue_variables(input_bundle, tissue, ancestry)
+    tissue_ld = inputs.get_tissue_ld(input_bundle, tissue, ancestry)
+    parameter_snps = np.vstack((trait_inputs.baseline_parameter_snps, inputs.get_tissue_parameter_snps(input_bundle, tissue, ancestry)))
+    return TissueInputs(tissue, variables, tissue_ld, overlap_matrix, parameter_snps, overlap_matrix[0][0])
+
+
+def gather_tissue_inputs(tissue_inputs: TissueInputs, idxs: npt.NDArray) -> TissueInputs:
+    tissue_sumstats_ld = np.empty((len(idxs), tissue_inputs.ld.shape[1]), dtype=xtx_xty.LD_DTYPE)
+    xtx_xty.gather_ld(tissue_sumstats_ld, [tissue_inputs.ld], idxs)
+    return tissue_inputs._replace(ld=tissue_sumstats_ld)
+
+
+def get_tissue_inputs(tissue: str, trait_inputs: TraitInputs) -> TissueInputs:
+    return gather_tissue_inputs(load_tissue_inputs(tissue, trait_inputs), trait_inputs.idxs)
+
+
+# The tissue LD of the whole batch is weighted and multiplied against the baseline design in one pass, then runs of
+# tissues with the same number of parameters are regressed together
+def regress_tissues(design: TraitDesign, batch: List[TissueInputs]) -> List[List[Dict]]:
+    bounds = np.cumsum([0] + [tissue_inputs.ld.shape[1] for tissue_inputs in batch]).tolist()
+    group_products = xtx_xty.get_group_xtx_xty(design.base_x, design.y, [tissue_inputs.ld for tissue_inputs in batch],
+                                               design.weights, design.sample_size, design.separators)
+    tissue_terms = list(xtx_xty.split_group_xtx_xty(*group_products, list(zip(bounds[:-1], bounds[1:]))))
+    values = []
+    for _, run in groupby(range(len(batch)), key=lambda i: batch[i].ld.shape[1]):
+        run = list(run)
+        overlap_matrix = np.stack([batch[i].overlap_matrix for i in run])
+        parameter_snps = np.stack([batch[i].parameter_snps for i in run])
+        total_snps = np.array([batch[i].total_snps for i in run])
+        if SCHUR_H2:
+            base_tissue_xtx, tissue_xtx, tissue_xty = [np.stack(terms) for terms in zip(*[tissue_terms[i] for i in run])]
+            values += ldsc.get_h2_schur(design.baseline_solves, base_tissue_xtx, tissue_xtx, tissue_xty, overlap_matrix,
+                                        parameter_snps, total_snps, design.mean_sample_size, BASELINE_ROWS)
+        else:
+            xtx, xty = zip(*[xtx_xty.assemble_tissue_xtx_xty(design.base_xtx, design.base_xty, *tissue_terms[i]) for i in run])
+            values += ldsc.get_h2_batch(np.stack(xtx), np.stack(xty), overlap_matrix, parameter_snps, total_snps,
+                                        design.mean_sample_size)
+    return values
+
+
+# Bytes of memory held by loaded tissue inputs, memory mapped LD counts as 0 (as in the InputBundle cache)
+def get_loaded_size(tissue_inputs: TissueInputs) -> int:
+    return 0 if isinstance(tissue_inputs.ld, np.memmap) else tissue_inputs.ld.nbytes
+
+
+# Tissue inputs are loaded (get_inputs(tissue)) on a background thread while the previous tissues are regressed. The
+# loader waits while the tissue LD already queued and the next tissue's would exceed PREFETCH_MEMORY bytes, so the budget
+# holds whatever the number of tissue parameters (one tissue is always let through)
+def prefetch_tissues(get_inputs: Callable[[str], TissueInputs], tissues: List[str]) -> Iterator[TissueInputs]:
+    loaded = deque()  # (item, size)
+    condition = threading.Condition()
+    queued_size, stop = 0, False
+
+    def put(item, size: int) -> bool:
+        nonlocal queued_size
+        with condition:
+            condition.wait_for(lambda: stop or len(loaded) == 0 or queued_size + size <= PREFETCH_MEMORY)
+            if stop:
+                return False
+            loaded.append((item, size))
+            queued_size += size
+            condition.notify_all()
+            return True
+
+    def get():
+        nonlocal queued_size
+        with condition:
+            condition.wait_for(lambda: len(loaded) > 0)
+            item, size = loaded.popleft()
+            queued_size -= size
+            condition.notify_all()
+            return item
+
+    def load() -> None:
+        try:
+            for tissue in tissues:
+                tissue_inputs = get_inputs(tissue)
+                if not put(tissue_inputs, get_loaded_size(tissue_inputs)):
+                    return
+            put(None, 0)
+        except Exception as e:  # raised to the consumer
+            put(e, 0)
+
+    thread = threading.Thread(target=load, daemon=True)
+    thread.start()
+    try:
+        item = get()
+        while item is not None:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+            item = get()
+    finally:
+        with condition:
+            stop = True
+            condition.notify_all()
+        thread.join()
+
+
+# Inflated from the zip and gathered to the sumstats rows of the trait
+def prefetch_tissue_inputs(tissues: List[str], trait_inputs: TraitInputs) -> Iterator[TissueInputs]:
+    return prefetch_tissues(lambda tissue: get_tissue_inputs(tissue, trait_inputs), tissues)
+
+
+# (tissue, output variables, values) for each tissue of each batch
+def regress_tissue_batches(design: TraitDesign, trait_inputs: TraitInputs,
+                           batches: List[List[str]]) -> List[List[Tuple[str, List[str], List[Dict]]]]:
+    results = []
+    with closing(prefetch_tissue_inputs([tissue for tissues in batches for tissue in tissues], trait_inputs)) as loaded:
+        for tissues in batches:
+            batch = [next(loaded) for _ in tissues]
+            results.append([(tissue_inputs.tissue, tissue_inputs.variables[-len(values):], values)
+                            for tissue_inputs, values in zip(batch, regress_tissues(design, batch))])
+    return results
+
+
+# Tissue-major regressions of several traits of one ancestry: each batch of tissues is loaded once, then gathered to the
+# sumstats rows of each trait in turn and regressed against its design. Per trait results as regress_tissue_batches
+def regress_trait_batches(designs: List[TraitDesign], trait_inputs: List[TraitInputs],
+                          batches: List[List[str]]) -> List[List[List[Tuple[str, List[str], List[Dict]]]]]:
+    results = [[] for _ in designs]
+    tissues = [tissue for batch_tissues in batches for tissue in batch_tissues]
+    with closing(prefetch_tissues(lambda tissue: load_tissue_inputs(tissue, trait_inputs[0]), tissues)) as loaded:
+        for batch_tissues in batches:
+            loaded_batch = [next(loaded) for _ in batch_tissues]
+            for design, trait, trait_results in zip(designs, trait_inputs, results):
+                batch = [gather_tissue_inputs(tissue_inputs, trait.idxs) for tissue_inputs in loaded_batch]
+                trait_results.append([(tissue_inputs.tissue, tissue_inputs.variables[-len(values):], values)
+                                      for tissue_inputs, values in zip(batch, regress_tissues(design, batch))])
+    return results
+
+
+worker_state = {}
+
+
+# The large trait arrays are memory mapped from shared_dir, so all workers read the same pages
+def init_worker(shared_dir: str, separators: List[int], mean_sample_size: float, trait_inputs: TraitInputs) -> None:
+    arrays = {file[:-len('.npy')]: np.load(f'{shared_dir}/{file}', mmap_mode='r') for file in os.listdir(shared_dir)}
+    worker_state['design'] = TraitDesign(arrays['base_x'], arrays['base_xtx'], arrays['base_xty'], arrays['y'],
+                                         arrays['weights'], arrays['sample_size'], separators, mean_sample_size,
+                                         ldsc.BaselineSolves(arrays['inverses'], arrays['solutions']))
+    worker_state['trait_inputs'] = trait_inputs
+
+
+def regress_worker_batches(batches: List[List[str]]) -> List[List[Tuple[str, List[str], List[Dict]]]]:
+    return regress_tissue_batches(worker_state['design'], worker_state['trait_inputs'], batches)
+
+
+# /dev/shm if it has room for the arrays (it can be as small as 64MB in a container, and its pages are memory held on top
+# of the parent's copy), else the data directory if it has room, else None
+def make_shared_dir(data_path: str, size: int) -> Optional[str]:
+    if os.path.isdir(SHARED_MEMORY_PATH) and shutil.disk_usage(SHARED_MEMORY_PATH).free > 2 * size:
+        return tempfile.mkdtemp(prefix='sldsc.', dir=SHARED_MEMORY_PATH)
+    os.makedirs(f'{data_path}/sldsc', exist_ok=True)
+    if shutil.disk_usage(f'{data_path}/sldsc').free > 2 * size:
+        return tempfile.mkdtemp(prefix='shared.', dir=f'{data_path}/sldsc')
+    return None
+
+
+# Processes started in this context load BLAS with the given number of threads
+@contextmanager
+def blas_threads(threads: int) -> Iterator[None]:
+    previous = {variable: os.environ.get(variable) for variable in BLAS_THREAD_VARIABLES}
+    os.environ.update({variable: str(threads) for variable in BLAS_THREAD_VARIABLES})
+    try:
+        yield
+    finally:
+        for variable, value in previous.items():
+            if value is None:
+                os.environ.pop(variable)
+            else:
+                os.environ[variable] = value
+
+
+# Batches of tissues are regressed on a pool of spawned workers (spawned so each loads BLAS with its share of the
+# cores), each taking a contiguous run of batches so it can prefetch its next batch. Results come back in batch order
+def regress_batches_parallel(data_path: str, design: TraitDesign, trait_inputs: TraitInputs, batches: List[List[str]],
+                             processes: int) -> List[List[Tuple[str, List[str], List[Dict]]]]:
+    arrays = {
+        'base_x': design.base_x, 'base_xtx': design.base_xtx, 'base_xty': design.base_xty, 'y': design.y,
+        'weights': design.weights, 'sample_size': design.sample_size,
+        'inverses': design.baseline_solves.inverses, 'solutions': design.baseline_solves.solutions
+    }
+    shared_dir = make_shared_dir(data_path, sum(array.nbytes for array in arrays.values()))
+    if shared_dir is None:  # nowhere to share the design, regressed in this process
+        return regress_tissue_batches(design, trait_inputs, batches)
+    try:
+        for name, array in arrays.items():
+            np.save(f'{shared_dir}/{name}.npy', array)
+        with blas_threads(max(1, (os.cpu_count() or 1) // processes)):
+            pool = multiprocessing.get_context('spawn').Pool(
+                processes, initializer=init_worker,
+                initargs=(shared_dir, design.separators, design.mean_sample_size, trait_inputs))
+        with pool:
+            bounds = np.linspace(0, len(batches), processes + 1).astype(int)
+            runs = [batches[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+            return [results for run_results in pool.imap(regress_worker_batches, runs) for results in run_results]
+    finally:
+        shutil.rmtree(shared_dir, ignore_errors=True)
+
+
+# Condition number of the baseline system and a float64 spot check of a few blocks of the base design, to tell whether
+# float32 LD is accurate enough for a trait (the solution error is roughly their product)
+def get_precision_report(design: TraitDesign, baseline_ld: npt.NDArray, idxs: npt.NDArray) -> Dict:
+    blocks = sorted(set(np.linspace(0, len(design.separators) - 2, SPOT_CHECK_BLOCKS).astype(int).tolist()))
+    difference = xtx_xty.get_spot_check_difference([baseline_ld], idxs, design.weights, design.sample_size, design.y,
+                                                   design.base_xtx, design.base_xty, design.separators, blocks)
+    return {
+        'ldDtype': xtx_xty.LD_DTYPE.name,
+        'conditionNumber': float(np.linalg.cond(np.sum(design.base_xtx, axis=0))),
+        'spotCheckDifference': difference
+    }
+
+
+def add_tissue_output(output: Dict, tissue: str, variables: List[str], values: List[Dict]) -> None:
+    annotation, tissue_name = tissue.split('___')
+    for variable, value in zip(variables, values):
+        variable_type, variable_name = variable.split('___')
+        if variable_type not in output:
+            output[variable_type] = []
+        line = f'{annotation}\t{tissue_name}\t{variable_name}\t{value["enrichment"]}\t{value["pValue"]}\n'
+        output[variable_type].append(line)
+
+
+def save_results(results: List[List[Tuple[str, List[str], List[Dict]]]], data_path: str) -> None:
+    output = {}
+    for batch_results in results:
+        for tissue, variables, values in batch_results:
+            add_tissue_output(output, tissue, variables, values)
+    save_data(output, data_path)
+
+
 def sldsc(data_path: str, metadata: Dict) -> Dict:
     ancestry = metadata['ancestry']
 
@@ -49,46 +350,87 @@ def sldsc(data_path: str, metadata: Dict) -> Dict:
 
     chisq, sample_size, idxs = sumstats.load_sumstats(data_path)
     chisq, sample_size, idxs = sumstats.filter_sumstats(chisq, sample_size, idxs)
-    mean_sample_size = float(np.mean(sample_size))
-
-    baseline_ld = inputs.get_baseline_ld(input_path, ancestry)
-    baseline_variables = inputs.get_baseline_variables(input_path, ancestry)
-    baseline_parameter_snps = inputs.get_baseline_parameter_snps(input_path, ancestry)
-    input_weights = weights.get_input_weights(input_path, ancestry)
 
-    sumstats_weights = input_weights[idxs]
-    baseline_sumstats_ld = baseline_ld[idxs, :]
-    separators = xtx_xty.get_separators(baseline_sumstats_ld.shape[0], MAX_BLOCKS)
+    with inputs.open_bundle(input_path, ancestry) as input_bundle:
+        baseline_ld = inputs.get_baseline_ld(input_bundle, ancestry)
+        baseline_variables = inputs.get_baseline_variables(input_bundle, ancestry)
+        baseline_parameter_snps = inputs.get_baseline_parameter_snps(input_bundle, ancestry)
+        input_weights = weights.get_input_weights(input_path, ancestry)
 
-    baseline_weights = xtx_xty.get_weight(baseline_sumstats_ld, sumstats_weights, sample_size, chisq, baseline_parameter_snps)
-    baseline_x = xtx_xty.get_x(baseline_sumstats_ld, baseline_weights, sample_size)
-    intercept = xtx_xty.get_intercept(baseline_sumstats_ld.shape[0], baseline_weights)
-    y = xtx_xty.get_y(chisq, baseline_weights)
+        design = get_trait_design(baseline_ld, idxs, input_weights[idxs], chisq, sample_size, baseline_parameter_snps)
+        trait_inputs = TraitInputs(input_bundle, ancestry, idxs, baseline_variables, baseline_parameter_snps)
+        if xtx_xty.LD_DTYPE != np.float64:
+            metadata['precision'] = get_precision_report(design, baseline_ld, idxs)
+        del baseline_ld
 
-    output = {}
-    for tissue in inputs.get_all_tissues(input_path, ancestry):
-        overlap_matrix = inputs.get_overlap(input_path, tissue, ancestry)
-        total_snps = overlap_matrix[0][0]
-
-        variables = baseline_variables + inputs.get_tissue_variables(input_path, tissue, ancestry)
-        tissue_sumstats_ld = inputs.get_tissue_ld(input_path, tissue, ancestry)[idxs, :]
-        parameter_snps = np.vstack((baseline_parameter_snps, inputs.get_tissue_parameter_snps(input_path, tissue, ancestry)))
-
-        tissue_x = xtx_xty.get_x(tissue_sumstats_ld, baseline_weights, sample_size)
-
-        x = np.hstack((baseline_x, tissue_x, intercept))
-        xtx = xtx_xty.get_xtx(x, separators)
-        xty = xtx_xty.get_xty(x, y, separators)
-
-        values = ldsc.get_h2(xtx, xty, overlap_matrix, parameter_snps, total_snps, mean_sample_size)
-        annotation, tissue_name = tissue.split('___')
-        for variable, value in zip(variables, values):
-            variable_type, variable_name = variable.split('___')
-            if variable_type not in output:
-                output[variable_type] = []
-            line = f'{annotation}\t{tissue_name}\t{variable_name}\t{value["enrichment"]}\t{value["pValue"]}\n'
-            output[variable_type].append(line)
-    save_data(output, data_path)
+        tissues = inputs.get_all_tissues(input_bundle, ancestry)
+        batches = [tissues[start:start + TISSUE_BATCH] for start in range(0, len(tissues), TISSUE_BATCH)]
+        processes = min(TISSUE_PROCESSES, len(batches))
+        if processes > 1:
+            results = regress_batches_parallel(data_path, design, trait_inputs, batches, processes)
+        else:
+            results = regress_tissue_batches(design, trait_inputs, batches)
+        metadata['version'] = inputs.get_version(input_bundle)
 
-    metadata['version'] = inputs.get_version(input_path, metadata['ancestry'])
+    save_results(results, data_path)
     return metadata
+
+
+# Why a munged trait can't be regressed in a batch, or None: a trait whose preflight failed has sumstats metadata but no
+# sumstats (as the single trait path checks), and one that lost every variant in munging has neither
+def get_batch_skip_reason(data_path: str, metadata: Dict) -> Optional[str]:
+    if not metadata.get('preflight', {}).get('passed', True):
+        return 'preflight failed'
+    if not os.path.exists(sumstats.binary_dataset_path(data_path)) and not os.path.exists(sumstats.dataset_path(data_path)):
+        return 'no sumstats'
+    return None
+
+
+# Batch mode for backfills: many munged traits of one ancestry share the baseline, and the tissues are loaded once for
+# every TRAIT_BATCH traits (tissue-major) instead of once per trait. Each trait is written to its data_path as sldsc does,
+# traits that can't be regressed are skipped with the reason in their metadata
+def sldsc_batch(data_paths: List[str], metadatas: List[Dict]) -> List[Dict]:
+    ancestries = sorted({metadata['ancestry'] for metadata in metadatas})
+    if len(ancestries) != 1:
+        raise ValueError(f'sldsc_batch needs traits of a single ancestry, got {ancestries}')
+
+    runnable_paths, runnable_metadatas = [], []
+    for data_path, metadata in zip(data_paths, metadatas):
+        skip_reason = get_batch_skip_reason(data_path, metadata)
+        if skip_reason is None:
+            runnable_paths.append(data_path)
+            runnable_metadatas.append(metadata)
+        else:
+            metadata['skipped'] = skip_reason
+    if len(runnable_paths) > 0:
+        regress_batch_traits(ancestries[0], runnable_paths, runnable_metadatas)
+    return metadatas
+
+
+def regress_batch_traits(ancestry: str, data_paths: List[str], metadatas: List[Dict]) -> None:
+    check_sldsc_inputs(ancestry)
+    check_weights(ancestry)
+
+    with inputs.open_bundle(input_path, ancestry) as input_bundle:
+        baseline_ld = inputs.get_baseline_ld(input_bundle, ancestry)
+        baseline_variables = inputs.get_baseline_variables(input_bundle, ancestry)
+        baseline_parameter_snps = inputs.get_baseline_parameter_snps(input_bundle, ancestry)
+        input_weights = weights.get_input_weights(input_path, ancestry)
+        tissues = inputs.get_all_tissues(input_bundle, ancestry)
+        batches = [tissues[start:start + TISSUE_BATCH] for start in range(0, len(tissues), TISSUE_BATCH)]
+        version = inputs.get_version(input_bundle)
+
+        for start in range(0, len(data_paths), TRAIT_BATCH):
+            designs, trait_inputs = [], []
+            for data_path, metadata in zip(data_paths[start:start + TRAIT_BATCH], metadatas[start:start + TRAIT_BATCH]):
+                chisq, sample_size, idxs = sumstats.filter_sumstats(*sumstats.load_sumstats(data_path))
+                designs.append(get_trait_design(baseline_ld, idxs, input_weights[idxs], chisq, sample_size, baseline_parameter_snps))
+                trait_inputs.append(TraitInputs(input_bundle, ancestry, idxs, baseline_variables, baseline_parameter_snps))
+                if xtx_xty.LD_DTYPE != np.float64:
+                    metadata['precision'] = get_precision_report(designs[-1], baseline_ld, idxs)
+            results = regress_trait_batches(designs, trait_inputs, batches)
+            for data_path, trait_results in zip(data_paths[start:start + TRAIT_BATCH], results):
+                save_results(trait_results, data_path)
+
+    for metadata in metadatas:
+        metadata['version'] = version
@@ -1,31 +1,49 @@
-import gzip
 import numpy as np
 from numpy import typing as npt
+import os
+import struct
+
+import tsv
+
+# Binary sumstats layout (little endian): header (magic, version, snps), then Z (float64), N (float64) and
+# has_data (uint8) in LD weights row order, written by make_sumstats.write_binary_sumstats
+SUMSTATS_MAGIC = b'SUMSTATS'
+SUMSTATS_VERSION = 1
+SUMSTATS_HEADER = struct.Struct('<8sI4xQ')
 
 
 def dataset_path(data_path: str) -> str:
     return f'{data_path}/sldsc/sumstats/sldsc.sumstats.gz'
 
 
+def binary_dataset_path(data_path: str) -> str:
+    return f'{data_path}/sldsc/sumstats/sldsc.sumstats.bin'
+
+
 def load_sumstats(data_path: str) -> (npt.NDArray, npt.NDArray, npt.NDArray):
+    if os.path.exists(binary_dataset_path(data_path)):
+        return load_binary_sumstats_from(binary_dataset_path(data_path))
     return load_sumstats_from(dataset_path(data_path))
 
 
+# Rows without data (an rsID with empty Z and N) are read as nan
 def load_sumstats_from(data_path: str) -> (npt.NDArray, npt.NDArray, npt.NDArray):
-    idxs = []
-    z = []
-    n = []
-    snps = []
-    with gzip.open(data_path, 'rt') as f:
-        _ = f.readline()  # header
-        for i, line in enumerate(f):
-            split_line = line.strip().split('\t')
-            if len(split_line) == 3:
-                snps.append(split_line[0])
-                z.append(float(split_line[1]))
-                n.append(float(split_line[2]))
-                idxs.append(i)
-    return np.array([z]).T**2, np.array([n]).T, np.array(idxs)
+    z, n = tsv.read_columns(data_path, [1, 2], [float, float])
+    idxs = np.flatnonzero(~np.isnan(z) & ~np.isnan(n))
+    return z[idxs].reshape(-1, 1)**2, n[idxs].reshape(-1, 1), idxs
+
+
+# Z, N and has_data are memory mapped, only the rows with data are gathered
+def load_binary_sumstats_from(data_path: str) -> (npt.NDArray, npt.NDArray, npt.NDArray):
+    with open(data_path, 'rb') as f:
+        magic, version, snps = SUMSTATS_HEADER.unpack(f.read(SUMSTATS_HEADER.size))
+    if magic != SUMSTATS_MAGIC or version != SUMSTATS_VERSION:
+        raise ValueError(f'{data_path} is not a version {SUMSTATS_VERSION} binary sumstats file')
+    z = np.memmap(data_path, dtype='<f8', mode='r', offset=SUMSTATS_HEADER.size, shape=(snps,))
+    n = np.memmap(data_path, dtype='<f8', mode='r', offset=SUMSTATS_HEADER.size + 8 * snps, shape=(snps,))
+    has_data = np.memmap(data_path, dtype=np.bool_, mode='r', offset=SUMSTATS_HEADER.size + 16 * snps, shape=(snps,))
+    idxs = np.flatnonzero(has_data)
+    return np.array([z[idxs]]).T**2, np.array([n[idxs]]).T, idxs
 
 
 def get_filter_idxs(chisq: npt.NDArray, n: npt.NDArray) -> npt.NDArray:
@@ -0,0 +1,128 @@
+import gzip
+import numpy as np
+from numpy import typing as npt
+from typing import Any, BinaryIO, Iterator, List, Optional, Sequence
+import warnings
+
+READ_SIZE = 1 << 24  # decompressed bytes parsed at a time
+
+
+def open_binary(file_path: str) -> BinaryIO:
+    with open(file_path, 'rb') as f:
+        is_gzip = f.read(2) == b'\x1f\x8b'
+    return gzip.open(file_path, 'rb') if is_gzip else open(file_path, 'rb')
+
+
+def read_header(file_path: str, separator: str = '\t') -> List[str]:
+    with open_binary(file_path) as f:
+        return f.readline().decode().strip().split(separator)
+
+
+# Blocks of whole lines, each ending in a newline
+def read_blocks(f: BinaryIO) -> Iterator[bytes]:
+    rest = b''
+    data = f.read(READ_SIZE)
+    while len(data) > 0:
+        block = rest + data
+        end = block.rfind(b'\n') + 1
+        if end > 0:
+            yield block[:end].replace(b'\r\n', b'\n') if b'\r' in block else block[:end]
+        rest = block[end:]
+        data = f.read(READ_SIZE)
+    if len(rest.strip()) > 0:
+        yield rest + b'\n'
+
+
+# Positions of the separators and newlines in the block, and the number of fields per line if it is the same for every
+# line (None otherwise, the block then has to be split line by line)
+def get_delimiters(block: bytes, separator: bytes) -> (npt.NDArray, Optional[int]):
+    data = np.frombuffer(block, dtype=np.uint8)
+    delimiters = np.flatnonzero((data == ord(separator)) | (data == ord('\n')))
+    is_line_end = data[delimiters] == ord('\n')
+    width = int(np.argmax(is_line_end)) + 1
+    if len(is_line_end) % width != 0 or not np.all(is_line_end.reshape(-1, width) == (np.arange(width) == width - 1)):
+        return delimiters, None
+    return delimiters, width
+
+
+# All fields of an aligned block in one split, column j is fields[j::width]
+def split_block(block: bytes, separator: bytes) -> List[bytes]:
+    return block.replace(b'\n', separator).split(separator)[:-1]
+
+
+# The fields from first_column on of an aligned block, parsed in C after cutting out the leading fields of each line,
+# None if any of them is empty or not a number
+def parse_tail(block: bytes, delimiters: npt.NDArray, width: int, first_column: int, dtype: Any) -> Optional[npt.NDArray]:
+    data = np.frombuffer(block, dtype=np.uint8)
+    if first_column > 0:
+        marks = np.zeros(len(data), dtype=np.int8)
+        marks[np.concatenate(([0], delimiters[width - 1:-1:width] + 1))] += 1  # line starts
+        marks[delimiters[first_column - 1::width] + 1] -= 1  # starts of the first_column field
+        data = data[np.cumsum(marks, dtype=np.int8) == 0]
+    count = len(delimiters) // width * (width - first_column)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')  # older numpy warns and stops at a value it can't parse, newer numpy raises
+            values = np.fromstring(data.tobytes(), dtype=dtype, sep=' ')  # any run of whitespace separates values
+    except ValueError:
+        return None
+    return values if len(values) == count else None
+
+
+def split_lines(block: bytes, separator: bytes, max_split: int, min_fields: int) -> List[List[bytes]]:
+    rows = [line.strip().split(separator, max_split) for line in block.split(b'\n')[:-1]]
+    return [row + [b''] * (max_split - len(row)) for row in rows if len(row) >= min_fields]
+
+
+# Empty (or missing) numeric fields are set to fill_value, anything else that doesn't convert to dtype raises a ValueError
+def to_array(values: List[bytes], dtype: Any, fill_value: Any) -> npt.NDArray:
+    if np.dtype(dtype).kind in 'SU':
+        return np.array(values, dtype='S').astype(dtype)
+    try:
+        return np.array(values, dtype=dtype)  # a flat list of byte strings converts in C
+    except ValueError:
+        pass
+    values = np.array(values, dtype='S')
+    empty = values == b''
+    output = np.full(values.shape, fill_value, dtype=dtype)
+    output[~empty] = values[~empty].astype(dtype)
+    return output
+
+
+# One typed array per selected column, e.g. read_columns(path, [1, 3], ['S', float]) for rsIDs and L2s
+# Rows with fewer than min_fields fields are dropped, fields missing from the remaining rows are empty
+def read_columns(file_path: str, columns: Sequence[int], dtypes: Sequence[Any], fill_value: Any = np.nan,
+                 header: bool = True, min_fields: int = 1, separator: str = '\t') -> List[npt.NDArray]:
+    chunks = [[] for _ in columns]
+    max_split = max(max(columns) + 1, min_fields)
+    with open_binary(file_path) as f:
+        if header:
+            _ = f.readline()
+        for block in read_blocks(f):
+            _, width = get_delimiters(block, separator.encode())
+            if width is not None and width >= max_split:
+                fields = split_block(block, separator.encode())
+                values = [fields[column::width] for column in columns]
+            else:
+                rows = split_lines(block, separator.encode(), max_split, min_fields)
+                values = [[row[column] for row in rows] for column in columns]
+            for chunk, column_values, dtype in zip(chunks, values, dtypes):
+                chunk.append(to_array(column_values, dtype, fill_value))
+    return [np.concatenate(chunk) if len(chunk) > 0 else np.zeros(0, dtype=dtype) for chunk, dtype in zip(chunks, dtypes)]
+
+
+# A (rows, columns) array of every column from first_column on, e.g. the annotation columns of an LD score file
+def read_matrix(file_path: str, first_column: int, dtype: Any = float, fill_value: Any = np.nan,
+                separator: str = '\t') -> npt.NDArray:
+    chunks = []
+    with open_binary(file_path) as f:
+        width = len(f.readline().strip().split(separator.encode()))
+        for block in read_blocks(f):
+            delimiters, block_width = get_delimiters(block, separator.encode())
+            values = parse_tail(block, delimiters, width, first_column, dtype) if block_width == width else None
+            if values is None:
+                rows = split_lines(block, separator.encode(), width, 1)
+                values = np.column_stack([to_array([row[column] for row in rows], dtype, fill_value)
+                                          for column in range(first_column, width)])
+            chunks.append(values.reshape(-1, width - first_column))
+    return np.concatenate(chunks) if len(chunks) > 0 else np.zeros((0, width - first_column), dtype=dtype)
@@ -1,19 +1,97 @@
-import gzip
 import numpy as np
 from numpy import typing as npt
+import os
+import struct
+import tempfile
+from typing import List, NamedTuple
+
+import tsv
+
+WEIGHTS_MAGIC = b'LDWEIGHT'
+WEIGHTS_VERSION = 1
+WEIGHTS_HEADER = struct.Struct('<8sIIQ')
+
+
+class WeightsIndex(NamedTuple):
+    weights: npt.NDArray  # L2 weight per LD SNP (float64)
+    rs_ids: npt.NDArray  # rsID per LD SNP
+    sorted_rs_ids: npt.NDArray  # rsIDs sorted for searchsorted
+    rows: npt.NDArray  # LD row of each sorted rsID (uint32)
 
 
 def weights_path(data_path: str, ancestry: str, chromosome: int) -> str:
     return f'{data_path}/weights/{ancestry}/weights.{chromosome}.l2.ldscore.gz'
 
 
-def get_input_weights(data_path: str, ancestry: str) -> npt.NDArray:
+def weights_index_path(data_path: str, ancestry: str) -> str:
+    return f'{data_path}/weights/{ancestry}/weights.{ancestry}.ldweights'
+
+
+def load_text_weights(data_path: str, ancestry: str) -> (npt.NDArray, npt.NDArray):
+    rs_ids = []
     output = []
     for chromosome in range(1, 23):
-        with gzip.open(weights_path(data_path, ancestry, chromosome), 'rt') as f:
-            _ = f.readline()
-            line = f.readline().strip().split('\t')
-            while len(line) > 1:
-                output.append(float(line[3]))
-                line = f.readline().strip().split('\t')
-    return np.array([output]).T
+        chromosome_rs_ids, chromosome_weights = tsv.read_columns(weights_path(data_path, ancestry, chromosome), [1, 3], ['S', float], min_fields=2)
+        rs_ids.append(chromosome_rs_ids)
+        output.append(chromosome_weights)
+    return np.concatenate(rs_ids), np.concatenate(output)
+
+
+# Binary weights layout (little endian): header (magic, version, rsID width, snps), then weights (float64),
+# rows (uint32), sorted rsIDs and rsIDs in LD order (both fixed width)
+def weights_index_offsets(snps: int, rs_id_width: int) -> (int, int, int, int):
+    rows_offset = WEIGHTS_HEADER.size + 8 * snps
+    sorted_rs_ids_offset = rows_offset + 4 * snps
+    return WEIGHTS_HEADER.size, rows_offset, sorted_rs_ids_offset, sorted_rs_ids_offset + rs_id_width * snps
+
+
+def save_weights_index(file_path: str, rs_ids: npt.NDArray, weights: npt.NDArray) -> None:
+    rows = np.argsort(rs_ids, kind='stable')
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path))  # unique per job, so concurrent builds don't interleave
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(WEIGHTS_HEADER.pack(WEIGHTS_MAGIC, WEIGHTS_VERSION, rs_ids.itemsize, len(rs_ids)))
+            f.write(weights.astype('<f8').tobytes())
+            f.write(rows.astype('<u4').tobytes())
+            f.write(rs_ids[rows].tobytes())
+            f.write(rs_ids.tobytes())
+        os.replace(tmp_path, file_path)  # concurrent jobs never see a partial file
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def open_weights_index(file_path: str) -> WeightsIndex:
+    with open(file_path, 'rb') as f:
+        magic, version, rs_id_width, snps = WEIGHTS_HEADER.unpack(f.read(WEIGHTS_HEADER.size))
+    if magic != WEIGHTS_MAGIC or version != WEIGHTS_VERSION:
+        raise ValueError(f'{file_path} is not a version {WEIGHTS_VERSION} weights file')
+    weights_offset, rows_offset, sorted_rs_ids_offset, rs_ids_offset = weights_index_offsets(snps, rs_id_width)
+    return WeightsIndex(
+        np.memmap(file_path, dtype='<f8', mode='r', offset=weights_offset, shape=(snps,)),
+        np.memmap(file_path, dtype=f'S{rs_id_width}', mode='r', offset=rs_ids_offset, shape=(snps,)),
+        np.memmap(file_path, dtype=f'S{rs_id_width}', mode='r', offset=sorted_rs_ids_offset, shape=(snps,)),
+        np.memmap(file_path, dtype='<u4', mode='r', offset=rows_offset, shape=(snps,))
+    )
+
+
+# Built from the 22 gzipped weights files once and cached next to them
+def get_weights_index(data_path: str, ancestry: str) -> WeightsIndex:
+    file_path = weights_index_path(data_path, ancestry)
+    try:
+        return open_weights_index(file_path)
+    except (FileNotFoundError, ValueError):
+        save_weights_index(file_path, *load_text_weights(data_path, ancestry))
+        return open_weights_index(file_path)
+
+
+# LD row of each rsID, -1 if it has no LD weight
+def get_rows(index: WeightsIndex, rs_ids: List[str]) -> npt.NDArray:
+    query = np.char.encode(np.array(rs_ids, dtype=str), 'ascii') if len(rs_ids) > 0 else np.zeros(0, dtype='S1')
+    positions = np.minimum(np.searchsorted(index.sorted_rs_ids, query), len(index.sorted_rs_ids) - 1)
+    found = index.sorted_rs_ids[positions] == query
+    return np.where(found, index.rows[positions].astype(np.int64), -1)
+
+
+def get_input_weights(data_path: str, ancestry: str) -> npt.NDArray:
+    return get_weights_index(data_path, ancestry).weights.reshape(-1, 1)
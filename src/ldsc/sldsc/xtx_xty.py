@@ -1,10 +1,19 @@
 import numpy as np
 from numpy import typing as npt
-from typing import List
+import os
+from typing import Iterator, List, Sequence, Tuple
+
+CHUNK_ROWS = 1 << 14  # rows gathered and scaled at a time when a design is filled in place, or upcast by dot_into
+# float32 (opt in) halves the memory and bandwidth of the LD designs, block products are accumulated in float64
+LD_DTYPE = np.dtype(os.environ.get('LD_DTYPE', 'float64'))
 
 
 def get_weight(g1000_ld: npt.NDArray, l_hm3: npt.NDArray, sample_size: npt.NDArray, chisq: npt.NDArray, parameter_snps: npt.NDArray) -> npt.NDArray:
-    g1000_ld_sum = np.sum(g1000_ld, axis=1, keepdims=True)
+    return get_weight_from_ld_sum(np.sum(g1000_ld, axis=1, keepdims=True), l_hm3, sample_size, chisq, parameter_snps)
+
+
+def get_weight_from_ld_sum(g1000_ld_sum: npt.NDArray, l_hm3: npt.NDArray, sample_size: npt.NDArray, chisq: npt.NDArray,
+                           parameter_snps: npt.NDArray) -> npt.NDArray:
     tau = (np.mean(chisq) - 1) / np.mean(np.multiply(g1000_ld_sum, sample_size))
 
     safe_g1000_ld_sum = np.fmax(g1000_ld_sum, 1.0)
@@ -17,11 +26,24 @@ def get_weight(g1000_ld: npt.NDArray, l_hm3: npt.NDArray, sample_size: npt.NDArr
     return unnormalized_weight / np.sum(unnormalized_weight)
 
 
+# np.dot into a float64 out. float32 operands are upcast CHUNK_ROWS rows (of the summed dimension) at a time, so the sums
+# over the rows of a block are accumulated in float64 while only a chunk is ever held in float64
+def dot_into(a: npt.NDArray, b: npt.NDArray, out: npt.NDArray) -> None:
+    if np.result_type(a, b) == out.dtype:
+        np.dot(a, b, out=out)
+    else:
+        out[...] = 0.0
+        for start in range(0, a.shape[1], CHUNK_ROWS):
+            rows = slice(start, start + CHUNK_ROWS)
+            out += np.dot(a[:, rows].astype(out.dtype), b[rows].astype(out.dtype))
+
+
+# Each block is one BLAS call on views of x1 and x2 written straight into xtx_blocks, so neither is copied (numpy uses
+# syrk for a block of x.T.dot(x))
 def get_general_xtx(x1: npt.NDArray, x2: npt.NDArray, separators: List[int]) -> npt.NDArray:
-    blocks = len(separators) - 1
-    xtx_blocks = np.zeros((blocks, x1.shape[1], x2.shape[1]))
-    for i in range(blocks):
-        xtx_blocks[i, :, :] = x1[separators[i]:separators[i + 1], :].T.dot(x2[separators[i]:separators[i + 1], :])
+    xtx_blocks = np.zeros((len(separators) - 1, x1.shape[1], x2.shape[1]))
+    for i in range(xtx_blocks.shape[0]):
+        dot_into(x1[separators[i]:separators[i + 1], :].T, x2[separators[i]:separators[i + 1], :], xtx_blocks[i])
     return xtx_blocks
 
 
@@ -39,6 +61,63 @@ def get_y(chisq: npt.NDArray, weights: npt.NDArray) -> npt.NDArray:
     return np.multiply(chisq, weights)
 
 
+# The LD rows idxs of each (possibly memory mapped) LD array side by side in the leading columns of out, gathered a
+# chunk of rows at a time straight into out, so there is no fancy indexed copy to hstack
+def gather_ld(out: npt.NDArray, ld_matrices: Sequence[npt.NDArray], idxs: npt.NDArray) -> None:
+    bounds = np.cumsum([0] + [ld_matrix.shape[1] for ld_matrix in ld_matrices]).tolist()
+    for start in range(0, len(idxs), CHUNK_ROWS):
+        rows = slice(start, start + CHUNK_ROWS)
+        for ld_matrix, first, last in zip(ld_matrices, bounds[:-1], bounds[1:]):
+            out[rows, first:last] = ld_matrix[idxs[rows], :]
+
+
+# Turns [ld, anything] in place into the design [get_x(ld, weights, n), intercept], the same operations as get_x and
+# get_intercept applied a chunk of rows at a time
+def scale_x(x: npt.NDArray, weights: npt.NDArray, n: npt.NDArray, mean_n: float) -> None:
+    for start in range(0, x.shape[0], CHUNK_ROWS):
+        rows = slice(start, start + CHUNK_ROWS)
+        ld = x[rows, :-1]
+        np.multiply(n[rows], ld, out=ld)
+        np.divide(ld, mean_n, out=ld)
+        np.multiply(ld, weights[rows], out=ld)
+        x[rows, -1:] = weights[rows]
+
+
+# get_xtx and get_xty of x = [get_x(ld_matrices[0][idxs]), ..., intercept] without building x: each jackknife block of
+# rows is gathered from the LD arrays and scaled in a block sized buffer, so memory is bounded by the block size
+def get_streamed_xtx_xty(ld_matrices: Sequence[npt.NDArray], idxs: npt.NDArray, weights: npt.NDArray, n: npt.NDArray,
+                         y: npt.NDArray, separators: List[int], dtype: np.dtype = np.dtype(np.float64)) -> (npt.NDArray, npt.NDArray):
+    blocks, parameters = len(separators) - 1, sum(ld_matrix.shape[1] for ld_matrix in ld_matrices) + 1
+    mean_n = np.mean(n)
+    xtx = np.zeros((blocks, parameters, parameters))
+    xty = np.zeros((blocks, parameters, y.shape[1]))
+    for i in range(blocks):
+        rows = slice(separators[i], separators[i + 1])
+        x = np.empty((rows.stop - rows.start, parameters), dtype=dtype)
+        gather_ld(x, ld_matrices, idxs[rows])
+        scale_x(x, weights[rows], n[rows], mean_n)
+        dot_into(x.T, x, xtx[i])
+        dot_into(x.T, y[rows, :], xty[i])
+    return xtx, xty
+
+
+# Largest difference, relative to the largest entry, between the given blocks of xtx and xty (of a design built with
+# gather_ld and scale_x, in any precision) and the same blocks recomputed in float64 from the LD arrays
+def get_spot_check_difference(ld_matrices: Sequence[npt.NDArray], idxs: npt.NDArray, weights: npt.NDArray,
+                              n: npt.NDArray, y: npt.NDArray, xtx: npt.NDArray, xty: npt.NDArray,
+                              separators: List[int], blocks: List[int]) -> float:
+    mean_n = np.mean(n)
+    difference = 0.0
+    for i in blocks:
+        rows = slice(separators[i], separators[i + 1])
+        x = np.empty((rows.stop - rows.start, xtx.shape[1]))
+        gather_ld(x, ld_matrices, idxs[rows])
+        scale_x(x, weights[rows], n[rows], mean_n)
+        for actual, expected in [(xtx[i], x.T.dot(x)), (xty[i], x.T.dot(y[rows, :]))]:
+            difference = max(difference, float(np.max(np.abs(actual - expected)) / np.max(np.abs(expected))))
+    return difference
+
+
 def get_xtx(x: npt.NDArray, separators: List[int]) -> npt.NDArray:
     return get_general_xtx(x, x, separators)
 
@@ -47,5 +126,66 @@ def get_xty(x: npt.NDArray, y: npt.NDArray, separators: List[int]) -> npt.NDArra
     return get_general_xtx(x, y, separators)
 
 
+# Block statistics of x = [baseline, tissue, intercept] from those of base_x = [baseline, intercept], computed once per
+# trait, and the tissue terms (base_tissue_xtx is base_x.T tissue_x), so x itself is never built
+def assemble_tissue_xtx_xty(base_xtx: npt.NDArray, base_xty: npt.NDArray, base_tissue_xtx: npt.NDArray,
+                            tissue_xtx: npt.NDArray, tissue_xty: npt.NDArray) -> (npt.NDArray, npt.NDArray):
+    blocks, base_parameters, _ = base_xtx.shape
+    parameters = base_parameters + tissue_xtx.shape[1]
+    baseline, tissue = slice(0, base_parameters - 1), slice(base_parameters - 1, parameters - 1)
+
+    xtx = np.empty((blocks, parameters, parameters))
+    xtx[:, baseline, baseline] = base_xtx[:, :-1, :-1]
+    xtx[:, baseline, -1] = base_xtx[:, :-1, -1]
+    xtx[:, -1, baseline] = base_xtx[:, -1, :-1]
+    xtx[:, -1, -1] = base_xtx[:, -1, -1]
+    xtx[:, baseline, tissue] = base_tissue_xtx[:, :-1, :]
+    xtx[:, -1, tissue] = base_tissue_xtx[:, -1, :]
+    xtx[:, tissue, baseline] = base_tissue_xtx[:, :-1, :].transpose((0, 2, 1))
+    xtx[:, tissue, -1] = base_tissue_xtx[:, -1, :]
+    xtx[:, tissue, tissue] = tissue_xtx
+
+    xty = np.empty((blocks, parameters, base_xty.shape[2]))
+    xty[:, baseline, :] = base_xty[:, :-1, :]
+    xty[:, -1, :] = base_xty[:, -1, :]
+    xty[:, tissue, :] = tissue_xty
+    return xtx, xty
+
+
+# Block products of a group of tissues (the tissue LD of the sumstats SNPs of each) with base_x and with y, and of each
+# tissue with itself. Each jackknife block of rows of the tissue LD is gathered side by side into a block sized buffer and
+# weighted (as in get_x), as get_streamed_xtx_xty does, so the group design is never built. The base_x and y products
+# are one wide BLAS call per block, the cross-tissue products (which no regression uses) are never computed
+def get_group_xtx_xty(base_x: npt.NDArray, y: npt.NDArray, tissue_lds: Sequence[npt.NDArray], weights: npt.NDArray,
+                      n: npt.NDArray, separators: List[int]) -> (npt.NDArray, List[npt.NDArray], npt.NDArray):
+    blocks = len(separators) - 1
+    bounds = np.cumsum([0] + [tissue_ld.shape[1] for tissue_ld in tissue_lds]).tolist()
+    mean_n = np.mean(n)
+    base_group_xtx = np.zeros((blocks, base_x.shape[1], bounds[-1]))
+    tissue_xtxs = [np.zeros((blocks, tissue_ld.shape[1], tissue_ld.shape[1])) for tissue_ld in tissue_lds]
+    group_xty = np.zeros((blocks, bounds[-1], y.shape[1]))
+    for i in range(blocks):
+        rows = slice(separators[i], separators[i + 1])
+        group_x = np.empty((rows.stop - rows.start, bounds[-1]), dtype=base_x.dtype, order='F')  # tissues contiguous
+        for tissue_ld, start, end in zip(tissue_lds, bounds[:-1], bounds[1:]):
+            group_x[:, start:end] = tissue_ld[rows, :]
+        np.multiply(n[rows], group_x, out=group_x)
+        np.divide(group_x, mean_n, out=group_x)
+        np.multiply(group_x, weights[rows], out=group_x)
+        dot_into(base_x[rows, :].T, group_x, base_group_xtx[i])
+        for tissue_xtx, start, end in zip(tissue_xtxs, bounds[:-1], bounds[1:]):
+            dot_into(group_x[:, start:end].T, group_x[:, start:end], tissue_xtx[i])
+        dot_into(group_x.T, y[rows, :], group_xty[i])
+    return base_group_xtx, tissue_xtxs, group_xty
+
+
+# The base_tissue_xtx, tissue_xtx and tissue_xty terms of each tissue in a group, columns are the [start, end) group
+# columns of each tissue
+def split_group_xtx_xty(base_group_xtx: npt.NDArray, tissue_xtxs: List[npt.NDArray], group_xty: npt.NDArray,
+                        columns: List[Tuple[int, int]]) -> Iterator[Tuple[npt.NDArray, npt.NDArray, npt.NDArray]]:
+    for (start, end), tissue_xtx in zip(columns, tissue_xtxs):
+        yield base_group_xtx[:, :, start:end], tissue_xtx, group_xty[:, start:end, :]
+
+
 def get_separators(snps: int, max_blocks: int) -> List[int]:
     return list(map(int, np.floor(np.linspace(0, snps, min(max_blocks, snps) + 1))))
@@ -0,0 +1 @@
+../../../magma/genes/bootstrap/magma_snpmap.bootstrap.sh
\ No newline at end of file
@@ -0,0 +1 @@
+../../magma/genes/magma_snpmap.py
\ No newline at end of file
@@ -1,14 +1,14 @@
 import argparse
 import gzip
+from itertools import compress
 import json
-import math
 import numpy as np
+from numpy import typing as npt
 import os
-from scipy.stats import chi2
-import subprocess
 from typing import List, Dict, Optional
 
-var_id_columns = ['chromosome', 'position', 'reference', 'alt']
+import magma_snpmap, make_sumstats, reader
+
 input_path = os.environ.get('INPUT_PATH')
 s3_path = os.environ.get('S3_BUCKET')
 
@@ -18,125 +18,112 @@ def check_envvars():
     assert s3_path is not None
 
 
-def check_snpmap(ancestry: str, genome_build: str, build_type: str) -> None:
-    if not os.path.exists(f'{input_path}/snpmap/sumstats.{build_type}.{genome_build}.{ancestry}.snpmap'):
-        cmd = f'./bootstrap/snpmap.bootstrap.sh {s3_path} {input_path} {build_type} {genome_build} {ancestry}'
-        subprocess.check_call(cmd, shell=True)
-
-
-def weights_path(ancestry: str, chromosome: int) -> str:
-    return f'{input_path}/weights/{ancestry}/weights.{chromosome}.l2.ldscore.gz'
-
-
-def check_weights(ancestry: str) -> None:
-    if not os.path.exists(weights_path(ancestry, 1)):
-        subprocess.check_call(f'./bootstrap/weights.bootstrap.sh {s3_path} {input_path} {ancestry}', shell=True)
-
-
 def get_metadata(data_path: str) -> Dict:
     with open(f'{data_path}/raw/metadata', 'r') as f:
         metadata = json.load(f)
     return metadata
 
 
-def get_var_to_rs_map(ancestry: str, genome_build: str, build_type: str) -> Dict:
-    var_to_rs = {}
-    check_snpmap(ancestry, genome_build, build_type)
-    with open(f'{input_path}/snpmap/sumstats.{build_type}.{genome_build}.{ancestry}.snpmap', 'r') as f:
-        for full_row in f.readlines():
-            var_id, rs_id = full_row.strip().split('\t')
-            var_to_rs[var_id] = rs_id
-    return var_to_rs
-
-
-def get_p_value(line: Dict, col_map: Dict) -> float:
-    return float(line[col_map['pValue']])
+# vectorized valid_line of the magma and pigean sumstats, which key variants by chromosome and position only
+def position_valid_mask(columns: Dict, col_map: Dict, effective_n: Optional[float], size: int) -> (npt.NDArray, npt.NDArray, npt.NDArray):
+    valid = np.ones(size, dtype=bool)
+    for column in ['chromosome', 'position']:
+        valid &= make_sumstats.present(columns, column, size)
+    p_value_column = make_sumstats.get_column(columns, 'pValue', size)
+    valid &= np.fromiter((value is not None and value != '' for value in p_value_column), dtype=bool, count=size)
+    valid &= effective_n is not None or ('n' in col_map and make_sumstats.present(columns, 'n', size))
 
-
-def get_beta(line: Dict, col_map: Dict) -> float:
-    if 'beta' in col_map:
-        return float(line[col_map['beta']])
-    else:
-        return math.log(float(line[col_map['oddsRatio']]))
+    p_values, parsed = make_sumstats.to_float(p_value_column)
+    with np.errstate(invalid='ignore'):
+        return valid & parsed & (p_values > 0) & (p_values <= 1), valid & ~parsed, p_values
 
 
-def get_n(line: Dict, col_map: Dict, effective_n: Optional[float]) -> float:
+def get_position_ns(columns: Dict, effective_n: Optional[float], idxs: npt.NDArray) -> (List, npt.NDArray):
     if effective_n is not None:
-        return effective_n
-    else:
-        return float(line[col_map['n']])
-
-
-def p_to_z(p: float, beta: float) -> float:
-    return np.sqrt(chi2.isf(p, 1)) * (-1)**(beta < 0)
-
-
-def valid_line(line: Dict, col_map: Dict, effective_n: Optional[float]) -> bool:
-    return all([line.get(col_map[column]) is not None for column in var_id_columns]) and \
-           col_map['pValue'] in line and line[col_map['pValue']] != '' and \
-           (('beta' in col_map and col_map['beta'] in line) or ('oddsRatio' in col_map and col_map['oddsRatio'] in line)) and \
-           (('n' in col_map and col_map['n'] in line) or effective_n is not None) and \
-           0 < float(line[col_map['pValue']]) <= 1
-
-
-def stream_to_data(file_path: str, var_to_rs_map: Dict, var_to_rs_flipped: Dict, metadata: Dict) -> (List, Dict):
-    out = []
-    counts = {'all': 0, 'flipped': 0, 'error': 0}
+        return [effective_n] * len(idxs), np.ones(len(idxs), dtype=bool)
+    ns, parsed = make_sumstats.to_float([columns['n'][idx] for idx in idxs.tolist()])
+    return ns.tolist(), parsed
+
+
+# (rsID, P, N) rows of the magma sumstats for a chunk
+def get_magma_chunk_data(columns: Dict, col_map: Dict, effective_n: Optional[float], size: int,
+                         rs_map: Dict, counts: Dict) -> List:
+    counts['all'] += size
+    valid, error, p_values = position_valid_mask(columns, col_map, effective_n, size)
+    valid_idxs = np.flatnonzero(valid)
+    chromosomes, positions = ([column[idx] for idx in valid_idxs.tolist()] for column in
+                              (make_sumstats.get_column(columns, c, 0) for c in ['chromosome', 'position']))
+    rs_ids = [rs_map.get(var_id) for var_id in zip(chromosomes, positions)]
+    mapped = np.array([rs_id is not None for rs_id in rs_ids], dtype=bool)
+
+    idxs = valid_idxs[mapped]
+    ns, n_parsed = get_position_ns(columns, effective_n, idxs)
+    counts['error'] += int(np.sum(error)) + int(np.sum(~n_parsed))
+    return list(compress(zip(compress(rs_ids, mapped), p_values[idxs].tolist(), ns), n_parsed))
+
+
+# CHROM, POS, P, N lines of the pigean sumstats for a chunk
+def get_pigean_chunk_lines(columns: Dict, col_map: Dict, effective_n: Optional[float], size: int, counts: Dict) -> str:
+    counts['all'] += size
+    valid, error, p_values = position_valid_mask(columns, col_map, effective_n, size)
+    valid_idxs = np.flatnonzero(valid)
+    ns, n_parsed = get_position_ns(columns, effective_n, valid_idxs)
+    idxs = valid_idxs[n_parsed]
+    counts['translated'] += len(idxs)
+    counts['skipped'] += size - len(valid_idxs) - int(np.sum(error))
+    counts['error'] += int(np.sum(error)) + int(np.sum(~n_parsed))
+    chromosomes, positions = ([column[idx] for idx in idxs.tolist()] for column in
+                              (make_sumstats.get_column(columns, c, 0) for c in ['chromosome', 'position']))
+    return ''.join(f'{chromosome}\t{position}\t{p_value}\t{n}\n' for chromosome, position, p_value, n in
+                   zip(chromosomes, positions, p_values[idxs].tolist(), compress(ns, n_parsed)))
+
+
+# Munges the raw file once for sldsc, magma and pigean, the pigean sumstats are written as the file is read
+def stream_to_methods(data_path: str, var_to_rs_index: make_sumstats.VariantIndex, rs_map: Dict,
+                      metadata: Dict) -> (List, List, Dict):
+    sldsc_data, magma_data = [], []
+    counts = {
+        'sldsc': {'all': 0, 'flipped': 0, 'error': 0},
+        'magma': {'all': 0, 'error': 0},
+        'pigean': {'all': 0, 'translated': 0, 'skipped': 0, 'error': 0}
+    }
     effective_n = metadata.get('effective_n')
     col_map = metadata['col_map']
     separator = metadata['separator']
-    with gzip.open(file_path, 'rt') as f_in:
-        header = f_in.readline().strip().split(separator)
-        for json_string in f_in:
-            line = dict(zip(header, json_string.strip().split(separator)))
-            counts['all'] += 1
-            if valid_line(line, col_map, effective_n):
-                chromosome, position, reference, alt = (line[col_map[c]] for c in var_id_columns)
-                var_id = f'{chromosome}:{position}:{reference.upper()}:{alt.upper()}'
-                if var_id in var_to_rs_map or var_id in var_to_rs_flipped:
-                    flipped = var_id in var_to_rs_flipped
-                    rs_id = var_to_rs_flipped[var_id] if flipped else var_to_rs_map[var_id]
-                    try:
-                        p_value = float(line[col_map['pValue']])
-                        beta = get_beta(line, col_map) * (1 - 2 * flipped)
-                        n = get_n(line, col_map, effective_n)
-                        out.append((rs_id, p_to_z(p_value, beta), n))
-                        counts['flipped'] += flipped
-                    except ValueError:  # pValue, beta, or n not a value that can be converted to a float, skip
-                        counts['error'] += 1
-    counts['translated'] = len(out)
-    return out, counts
-
-
-def filter_data_to_dict(data: List) -> Dict:
-    N90 = np.quantile([a[2] for a in data], 0.9)
-    return {d[0]: (d[1], d[2]) for d in data if d[2] >= N90 / 1.5}
-
-
-def save_to_file(data_path: str, ancestry: str, data: Dict, metadata: Dict) -> None:
+    os.makedirs(f'{data_path}/pigean/sumstats/', exist_ok=True)
+    with gzip.open(f'{data_path}/pigean/sumstats/pigean.sumstats.gz', 'wt') as f_out, \
+            reader.open_gzip(f'{data_path}/raw/{metadata["file"]}') as f_in:
+        f_out.write('CHROM\tPOS\tP\tN\n')
+        column_idxs = make_sumstats.get_column_idxs(f_in.readline().strip().split(separator), col_map)
+        for size, columns in make_sumstats.read_chunks(f_in, separator, column_idxs):
+            sldsc_data.extend(make_sumstats.get_chunk_data(columns, col_map, effective_n, size, var_to_rs_index, counts['sldsc']))
+            magma_data.extend(get_magma_chunk_data(columns, col_map, effective_n, size, rs_map, counts['magma']))
+            f_out.write(get_pigean_chunk_lines(columns, col_map, effective_n, size, counts['pigean']))
+    counts['sldsc']['translated'] = len(sldsc_data)
+    counts['magma']['final'] = len(magma_data)
+    return sldsc_data, magma_data, counts
+
+
+def save_metadata(data_path: str, metadata: Dict) -> None:
     os.makedirs(f'{data_path}/sldsc/sumstats/', exist_ok=True)
-    out_file = f'{data_path}/sldsc/sumstats/sldsc.sumstats.gz'
-    with_data = 0
-    with gzip.open(out_file, 'wt') as f:
-        f.write('SNP\tZ\tN\n')
-        for rs_id in ld_rs_iter(ancestry):
-            if rs_id in data:
-                with_data += 1
-                f.write('{}\t{}\t{}\n'.format(rs_id, round(data[rs_id][0], 3), data[rs_id][1]))
-            else:
-                f.write(f'{rs_id}\t\t\n')
-    metadata['counts']['final'] = with_data
     with open(f'{data_path}/sldsc/sumstats/metadata', 'w') as f:
         json.dump(metadata, f)
 
 
-def ld_rs_iter(ancestry: str) -> str:
-    check_weights(ancestry)
-    for chromosome in range(1, 23):
-        with gzip.open(weights_path(ancestry, chromosome), 'rt') as f:
-            _ = f.readline()
-            for line in f:
-                yield line.strip().split('\t')[1]
+# Same layout as the magma sumstats method so that the magma genes step can use it directly
+def save_magma_to_file(data_path: str, data: List, metadata: Dict) -> None:
+    os.makedirs(f'{data_path}/magma/sumstats/', exist_ok=True)
+    with open(f'{data_path}/magma/sumstats/magma.sumstats.csv', 'w') as f:
+        f.write('SNP\tP\tN\n')
+        for start in range(0, len(data), make_sumstats.CHUNK_SIZE):
+            f.write(''.join(f'{rs_id}\t{p}\t{n}\n' for rs_id, p, n in data[start:start + make_sumstats.CHUNK_SIZE]))
+    with open(f'{data_path}/magma/sumstats/metadata', 'w') as f:
+        json.dump(metadata, f)
+
+
+def save_pigean_metadata(data_path: str, metadata: Dict) -> None:
+    with open(f'{data_path}/pigean/sumstats/metadata', 'w') as f:
+        json.dump(metadata, f)
 
 
 def main():
@@ -144,21 +131,36 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--dir', default=None, required=True, type=str)
     parser.add_argument('--method', default=None, required=True, type=str)
-    data_path = parser.parse_args().dir
+    args = parser.parse_args()
+    data_path = args.dir
+    method = args.method
 
     metadata = get_metadata(data_path)
     file = metadata['file']
     ancestry = metadata['ancestry']
     genome_build = metadata['genome_build']
 
-    var_to_rs_map = get_var_to_rs_map(ancestry, genome_build, 'standard')
-    var_to_rs_flipped = get_var_to_rs_map(ancestry, genome_build, 'flipped')
-    data, counts = stream_to_data(f'{data_path}/raw/{file}', var_to_rs_map, var_to_rs_flipped, metadata)
+    probe_index = make_sumstats.get_probe_index(ancestry, genome_build)
+    metadata['preflight'] = make_sumstats.preflight(f'{data_path}/raw/{file}', metadata, probe_index)
+    if not metadata['preflight']['passed']:
+        save_metadata(data_path, metadata)
+        return
+
+    var_to_rs_index = make_sumstats.get_var_to_rs_index(ancestry, genome_build)
+    if method == 'munge':
+        rs_map = magma_snpmap.get_rs_map(genome_build)
+        data, magma_data, method_counts = stream_to_methods(data_path, var_to_rs_index, rs_map, metadata)
+        save_magma_to_file(data_path, magma_data, {**metadata, 'counts': method_counts['magma']})
+        save_pigean_metadata(data_path, {**metadata, 'counts': method_counts['pigean']})
+        counts = method_counts['sldsc']
+    else:
+        data, counts = make_sumstats.stream_to_data(f'{data_path}/raw/{file}', var_to_rs_index, metadata,
+                                                    make_sumstats.MUNGE_PROCESSES)
     metadata['counts'] = counts
     if len(data) > 0:
-        data_dict = filter_data_to_dict(data)
+        data_dict = make_sumstats.filter_data_to_dict(data)
         metadata['counts']['pass_filter'] = len(data_dict)
-        save_to_file(data_path, ancestry, data_dict, metadata)
+        save_metadata(data_path, make_sumstats.save_to_file(data_path, ancestry, data_dict, metadata))
 
 
 if __name__ == '__main__':
@@ -0,0 +1 @@
+../sldsc/make_sumstats.py
\ No newline at end of file
@@ -0,0 +1 @@
+../sldsc/reader.py
\ No newline at end of file
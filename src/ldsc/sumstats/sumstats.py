@@ -0,0 +1 @@
+../sldsc/sumstats.py
\ No newline at end of file
@@ -0,0 +1 @@
+../sldsc/tsv.py
\ No newline at end of file
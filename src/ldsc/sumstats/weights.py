@@ -0,0 +1 @@
+../sldsc/weights.py
\ No newline at end of file
@@ -1,7 +1,7 @@
 #!/bin/bash
 
 if [[ ! $# -eq 3 ]]; then
-  echo "Usage: snpmap.bootstrap.sh <data_dir> <destination_dir> <genome_build>"
+  echo "Usage: magma_snpmap.bootstrap.sh <data_dir> <destination_dir> <genome_build>"
   exit 1
 fi
 DATA_DIR=$1
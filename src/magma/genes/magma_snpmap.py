@@ -0,0 +1,23 @@
+import os
+import subprocess
+from typing import Dict
+
+input_path = os.environ.get('INPUT_PATH')
+s3_path = os.environ.get('S3_BUCKET')
+
+
+def check_snpmap(genome_build: str) -> None:
+    if not os.path.exists(f'{input_path}/snpmap/sumstats.{genome_build}.snpmap'):
+        cmd = f'./bootstrap/magma_snpmap.bootstrap.sh {s3_path} {input_path} {genome_build}'
+        subprocess.check_call(cmd, shell=True)
+
+
+# (chromosome, position) -> rsID of the magma snpmap
+def get_rs_map(genome_build: str) -> Dict:
+    check_snpmap(genome_build)
+    rs_map = {}
+    with open(f'{input_path}/snpmap/sumstats.{genome_build}.snpmap', 'r') as f:
+        for line in f:
+            chromosome, position, rs_id = line.strip().split('\t')
+            rs_map[(chromosome, position)] = rs_id
+    return rs_map
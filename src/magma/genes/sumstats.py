@@ -1,27 +1,10 @@
-import gzip
+import json
 import os
-import subprocess
 from typing import List, Dict, Optional
 
-var_id_columns = ['chromosome', 'position']
-input_path = os.environ.get('INPUT_PATH')
-s3_path = os.environ.get('S3_BUCKET')
-
-
-def check_snpmap(genome_build: str) -> None:
-    if not os.path.exists(f'{input_path}/snpmap/sumstats.{genome_build}.snpmap'):
-        cmd = f'./bootstrap/snpmap.bootstrap.sh {s3_path} {input_path} {genome_build}'
-        subprocess.check_call(cmd, shell=True)
-
+import magma_snpmap, reader
 
-def get_rs_map(genome_build: str) -> Dict:
-    check_snpmap(genome_build)
-    rs_map = {}
-    with open(f'{input_path}/snpmap/sumstats.{genome_build}.snpmap', 'r') as f:
-        for line in f:
-            chromosome, position, rs_id = line.strip().split('\t')
-            rs_map[(chromosome, position)] = rs_id
-    return rs_map
+var_id_columns = ['chromosome', 'position']
 
 
 def get_p_value(line: Dict, col_map: Dict) -> float:
@@ -48,7 +31,7 @@ def stream_to_data(file_path: str, rs_map: Dict, metadata: Dict) -> (List, Dict)
     effective_n = metadata.get('effective_n')
     col_map = metadata['col_map']
     separator = metadata['separator']
-    with gzip.open(file_path, 'rt') as f_in:
+    with reader.open_gzip(file_path) as f_in:
         header = f_in.readline().strip().split(separator)
         for json_string in f_in:
             line = dict(zip(header, json_string.strip().split(separator)))
@@ -76,12 +59,23 @@ def save_to_file(data_path: str, data: List) -> None:
             f.write('{}\t{}\t{}\n'.format(rs_id, p, n))
 
 
+# counts of the sumstats written by the single pass munging (ldsc/sumstats with --method=munge), if present
+def get_munged_counts(data_path: str) -> Optional[Dict]:
+    if os.path.exists(f'{data_path}/magma/sumstats/metadata') and \
+            os.path.exists(f'{data_path}/magma/sumstats/magma.sumstats.csv'):
+        with open(f'{data_path}/magma/sumstats/metadata', 'r') as f:
+            return json.load(f)['counts']
+    return None
+
+
 def main(data_path: str, metadata: Dict) -> Dict:
     file = metadata['file']
     genome_build = metadata['genome_build']
 
-    rs_map = get_rs_map(genome_build)
-    data, counts = stream_to_data(f'{data_path}/raw/{file}', rs_map, metadata)
+    counts = get_munged_counts(data_path)
+    if counts is None:
+        rs_map = magma_snpmap.get_rs_map(genome_build)
+        data, counts = stream_to_data(f'{data_path}/raw/{file}', rs_map, metadata)
+        save_to_file(data_path, data)
     metadata['counts'] = counts
-    save_to_file(data_path, data)
     return metadata
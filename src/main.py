@@ -15,13 +15,19 @@ def get_config(method: str) -> Dict:
 
 
 def download(username: str, dataset: str, tmp_dir: str, config: Dict) -> None:
-    path = f'{s3_bucket}/userdata/{username}/{config["dataset_type"]}/{dataset}/{config["download_from"]}/'
-    subprocess.check_call(f'aws s3 cp "{path}" {tmp_dir}/{config["download_from"]}/ --recursive', shell=True)
+    download_from = config['download_from'] if isinstance(config['download_from'], list) else [config['download_from']]
+    for directory in download_from:  # a prefix with no objects (e.g. sumstats not munged yet) copies nothing
+        path = f'{s3_bucket}/userdata/{username}/{config["dataset_type"]}/{dataset}/{directory}/'
+        subprocess.check_call(f'aws s3 cp "{path}" {tmp_dir}/{directory}/ --recursive', shell=True)
 
 
 def upload(username: str, dataset: str, tmp_dir: str, config: Dict) -> None:
-    path = f'{s3_bucket}/userdata/{username}/{config["dataset_type"]}/{dataset}/{config["upload_to"]}/'
-    subprocess.check_call(f'aws s3 cp {tmp_dir}/{config["upload_to"]}/ "{path}" --recursive', shell=True)
+    upload_to = config['upload_to'] if isinstance(config['upload_to'], list) else [config['upload_to']]
+    for directory in upload_to:
+        if not os.path.isdir(f'{tmp_dir}/{directory}'):  # e.g. the magma and pigean sumstats when the munge preflight fails
+            continue
+        path = f'{s3_bucket}/userdata/{username}/{config["dataset_type"]}/{dataset}/{directory}/'
+        subprocess.check_call(f'aws s3 cp {tmp_dir}/{directory}/ "{path}" --recursive', shell=True)
 
 
 def main():
@@ -1,7 +1,10 @@
 import gzip
+import json
 import os
 from typing import Dict, Optional
 
+import reader
+
 var_id_columns = ['chromosome', 'position']
 input_path = os.environ.get('INPUT_PATH')
 s3_path = os.environ.get('S3_BUCKET')
@@ -33,7 +36,7 @@ def stream_to_sumstats(data_path: str, file: str, metadata: Dict) -> Dict:
     separator = metadata['separator']
     with gzip.open(f'{data_path}/pigean/sumstats/pigean.sumstats.gz', 'wt') as f_out:
         f_out.write('CHROM\tPOS\tP\tN\n')
-        with gzip.open(f'{data_path}/raw/{file}', 'rt') as f_in:
+        with reader.open_gzip(f'{data_path}/raw/{file}') as f_in:
             header = f_in.readline().strip().split(separator)
             for json_string in f_in:
                 line = dict(zip(header, json_string.strip().split(separator)))
@@ -52,8 +55,19 @@ def stream_to_sumstats(data_path: str, file: str, metadata: Dict) -> Dict:
     return counts
 
 
+# counts of the sumstats written by the single pass munging (ldsc/sumstats with --method=munge), if present
+def get_munged_counts(data_path: str) -> Optional[Dict]:
+    if os.path.exists(f'{data_path}/pigean/sumstats/metadata') and \
+            os.path.exists(f'{data_path}/pigean/sumstats/pigean.sumstats.gz'):
+        with open(f'{data_path}/pigean/sumstats/metadata', 'r') as f:
+            return json.load(f)['counts']
+    return None
+
+
 def main(data_path: str, metadata: Dict) -> Dict:
     file = metadata['file']
-    counts = stream_to_sumstats(data_path, file, metadata)
+    counts = get_munged_counts(data_path)
+    if counts is None:
+        counts = stream_to_sumstats(data_path, file, metadata)
     metadata['counts'] = counts
     return metadata
@@ -0,0 +1,102 @@
+import argparse
+import glob
+import numpy as np
+import os
+import re
+import shutil
+import struct
+import tempfile
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED, ZIP_STORED, ZIP64_LIMIT
+
+PAGE_SIZE = 4096
+PADDING_EXTRA_ID = 0xD935  # extra field id used by zipalign for padding, ignored by zip readers
+LOCAL_HEADER = struct.Struct('<4s2B4HL2L2H')
+ZIP64_LOCAL_EXTRA_SIZE = 20  # added to the local header by zipfile when a member may exceed 4GB
+LD_MEMBER = re.compile(r'(?:.*/)?[a-z]+_ld(?:\.[^/]*)?\.npy')  # baseline_ld[.*].npy and tissue_ld.*.npy
+
+
+def get_npy_header_size(file_path: str) -> int:
+    with open(file_path, 'rb') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            np.lib.format.read_array_header_1_0(f)
+        else:
+            np.lib.format.read_array_header_2_0(f)
+        return f.tell()
+
+
+# Padding extra field that puts the start of the array data in a .npy member at a page boundary in the zip file
+def get_padding_extra(data_offset: int) -> bytes:
+    padding = (-(data_offset + 4) % PAGE_SIZE) + 4
+    return struct.pack('<HH', PADDING_EXTRA_ID, padding - 4) + bytes(padding - 4)
+
+
+# .npy members are stored uncompressed and aligned so they can be memory mapped in place, everything else is deflated
+def add_member(output_zip: ZipFile, file_path: str, member: str) -> None:
+    info = ZipInfo.from_file(file_path, member)
+    if member.endswith('.npy'):
+        info.compress_type = ZIP_STORED
+        zip64_size = ZIP64_LOCAL_EXTRA_SIZE if info.file_size * 1.05 > ZIP64_LIMIT else 0
+        data_offset = output_zip.fp.tell() + LOCAL_HEADER.size + len(member.encode()) + zip64_size + \
+            get_npy_header_size(file_path)
+        info.extra = get_padding_extra(data_offset)
+    else:
+        info.compress_type = ZIP_DEFLATED
+    with open(file_path, 'rb') as f_in, output_zip.open(info, 'w') as f_out:
+        shutil.copyfileobj(f_in, f_out, 1 << 24)
+
+
+def check_alignment(zip_path: str) -> None:
+    with ZipFile(zip_path) as input_zip:
+        for info in input_zip.infolist():
+            if info.compress_type == ZIP_STORED and info.filename.endswith('.npy'):
+                input_zip.fp.seek(info.header_offset)
+                header = LOCAL_HEADER.unpack(input_zip.fp.read(LOCAL_HEADER.size))
+                input_zip.fp.seek(info.header_offset + LOCAL_HEADER.size + header[-2] + header[-1])
+                version = np.lib.format.read_magic(input_zip.fp)
+                if version == (1, 0):
+                    np.lib.format.read_array_header_1_0(input_zip.fp)
+                else:
+                    np.lib.format.read_array_header_2_0(input_zip.fp)
+                if input_zip.fp.tell() % PAGE_SIZE != 0:
+                    raise ValueError(f'{info.filename} is not page aligned')
+
+
+# LD arrays are converted to float32 in a temporary file, for the methods' LD_DTYPE=float32 mode
+def add_float32_member(output_zip: ZipFile, file_path: str, member: str) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        np.save(f'{tmp_dir}/ld.npy', np.load(file_path).astype(np.float32))
+        add_member(output_zip, f'{tmp_dir}/ld.npy', member)
+
+
+def make_bundle(input_dir: str, zip_path: str, ld_float32: bool = False) -> None:
+    file_paths = sorted(file_path for file_path in glob.glob(f'{input_dir}/**/*', recursive=True) if os.path.isfile(file_path))
+    fd, tmp_path = tempfile.mkstemp(suffix='.zip', dir=os.path.dirname(os.path.abspath(zip_path)))
+    os.close(fd)
+    try:
+        with ZipFile(tmp_path, 'w') as output_zip:
+            for file_path in file_paths:
+                member = os.path.relpath(file_path, input_dir).replace(os.sep, '/')
+                if ld_float32 and LD_MEMBER.fullmatch(member):
+                    add_float32_member(output_zip, file_path, member)
+                else:
+                    add_member(output_zip, file_path, member)
+        check_alignment(tmp_path)
+        os.replace(tmp_path, zip_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+# e.g. python3 make_input_bundle.py --input-dir ../sldsc_inputs/inputs/EUR --output ../sldsc_inputs/inputs/sldsc_inputs.EUR.zip
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input-dir', default=None, required=True, type=str)
+    parser.add_argument('--output', default=None, required=True, type=str)
+    parser.add_argument('--ld-float32', action='store_true')
+    args = parser.parse_args()
+    make_bundle(args.input_dir, args.output, args.ld_float32)
+
+
+if __name__ == '__main__':
+    main()
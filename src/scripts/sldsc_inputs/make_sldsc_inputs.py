@@ -6,6 +6,8 @@ import os
 import re
 from typing import List
 
+import tsv
+
 
 def baseline_path(ancestry: str, chromosome: int) -> str:
     return f'baseline/{ancestry}/baselineLD.{chromosome}.l2.ldscore.gz'
@@ -55,23 +57,11 @@ def get_tissue_parameter_snps(tissue: str, ancestry: str) -> npt.NDArray:
 
 
 def get_baseline_ld_score(ancestry: str) -> npt.NDArray:
-    output = []
-    for chromosome in range(1, 23):
-        with gzip.open(baseline_path(ancestry, chromosome), 'rt') as f:
-            _ = f.readline()  # unused header
-            for line in f:
-                output.append(list(map(float, line.strip().split('\t')[3:])))
-    return np.array(output)
+    return np.vstack([tsv.read_matrix(baseline_path(ancestry, chromosome), 3) for chromosome in range(1, 23)])
 
 
 def get_tissue_ld_score(tissue: str, ancestry: str) -> npt.NDArray:
-    output = []
-    for chromosome in range(1, 23):
-        with gzip.open(tissue_path(tissue, ancestry, chromosome), 'rt') as f:
-            _ = f.readline()  # unused header
-            for line in f:
-                output.append(list(map(float, line.strip().split('\t')[3:])))
-    return np.array(output)
+    return np.vstack([tsv.read_matrix(tissue_path(tissue, ancestry, chromosome), 3) for chromosome in range(1, 23)])
 
 def save_baseline_data(ancestry: str, ld: npt.NDArray, variables: List, parameter_snps: npt.NDArray) -> None:
     os.makedirs(f'inputs/{ancestry}/baseline/', exist_ok=True)
@@ -0,0 +1 @@
+../../ldsc/sldsc/tsv.py
\ No newline at end of file
@@ -0,0 +1 @@
+../../ldsc/sldsc/make_sumstats.py
\ No newline at end of file
@@ -1,7 +1,10 @@
+import numpy as np
 import os
 import re
 import subprocess
 
+import make_sumstats
+
 group_to_num = {('A', 'C'): 0, ('T', 'G'): 0,
                 ('C', 'A'): 1, ('G', 'T'): 1,
                 ('A', 'G'): 2, ('T', 'C'): 2,
@@ -70,6 +73,26 @@ def make_snpmap(build_type, genome_build, ancestry, hapmap_set, g1000_pos, g1000
                     f.write(f'{g1000_pos[rs_id]}:{var_id}\t{rs_id}\n')
 
 
+# Standard and flipped var IDs in one binary snpmap, written by make_sumstats (linked from src/ldsc/sldsc), which reads it
+# back for the munging. The flipped rsID wins any collision, and the probe snpmap for the munging preflight only has the
+# keys at positions divisible by make_sumstats.PROBE_MODULUS
+def make_binary_snpmap(genome_build, ancestry, hapmap_set, g1000_pos, g1000_map, g1000_flipped, rs_ids):
+    var_ids, var_rs_ids, flipped = [], [], []
+    for is_flipped, var_id_map in [(False, g1000_map), (True, g1000_flipped)]:
+        for rs_id in rs_ids:
+            if rs_id in hapmap_set and rs_id in g1000_pos and rs_id in var_id_map:
+                for var_id in var_id_map[rs_id]:
+                    var_ids.append(f'{g1000_pos[rs_id]}:{var_id}')
+                    var_rs_ids.append(rs_id)
+                    flipped.append(is_flipped)
+    keys, encodable = make_sumstats.encode_var_ids(var_ids)
+    index = make_sumstats.make_var_to_rs_index(keys[encodable], np.array(var_rs_ids, dtype=str)[encodable],
+                                               np.array(flipped, dtype=bool)[encodable])
+    make_sumstats.save_var_to_rs_index(f'data/snpmap/sumstats.binary.{genome_build}.{ancestry}.snpmap', index)
+    make_sumstats.save_var_to_rs_index(f'data/snpmap/sumstats.probe.{genome_build}.{ancestry}.snpmap',
+                                       make_sumstats.make_probe_index(index))
+
+
 def main():
     hapmap_set = get_hapmap_set()
     for ancestry in ['AFR', 'AMR', 'EAS', 'EUR', 'SAS']:
@@ -79,6 +102,8 @@ def main():
         make_snpmap('standard','GRCh38', ancestry, hapmap_set, hg38_g1000_pos, g1000_map, rs_ids)
         make_snpmap('flipped','GRCh37', ancestry, hapmap_set, g1000_pos, g1000_flipped, rs_ids)
         make_snpmap('flipped','GRCh38', ancestry, hapmap_set, hg38_g1000_pos, g1000_flipped, rs_ids)
+        make_binary_snpmap('GRCh37', ancestry, hapmap_set, g1000_pos, g1000_map, g1000_flipped, rs_ids)
+        make_binary_snpmap('GRCh38', ancestry, hapmap_set, hg38_g1000_pos, g1000_map, g1000_flipped, rs_ids)
 
 
 if __name__ == '__main__':
@@ -0,0 +1 @@
+../../ldsc/sldsc/reader.py
\ No newline at end of file
@@ -0,0 +1 @@
+../../ldsc/sldsc/sumstats.py
\ No newline at end of file
@@ -0,0 +1 @@
+../../ldsc/sldsc/weights.py
\ No newline at end of file
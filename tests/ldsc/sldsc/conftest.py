@@ -0,0 +1,5 @@
+import os
+import sys
+
+# sldsc modules import their siblings as top level modules, as when run from src/ldsc/sldsc
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', 'src', 'ldsc', 'sldsc'))
@@ -0,0 +1,71 @@
+import numpy as np
+import os
+import pickle
+import tempfile
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
+
+import pytest
+
+import bundle
+
+
+def write_zip(arrays: dict, compression: int) -> str:
+    fd, zip_path = tempfile.mkstemp(suffix='.zip')
+    os.close(fd)
+    with ZipFile(zip_path, 'w', compression) as output_zip:
+        output_zip.writestr('version', '1.0.0')  # shifts the .npy members off any alignment
+        for member, array in arrays.items():
+            with output_zip.open(member, 'w') as f:
+                np.save(f, array)
+    return zip_path
+
+
+@pytest.mark.parametrize('compression', [ZIP_STORED, ZIP_DEFLATED])
+def test_load_npy(compression) -> None:
+    arrays = {
+        'baseline/baseline_ld.npy': np.random.default_rng(0).random((100, 7)),
+        'baseline/overlap.npy': np.asfortranarray(np.arange(12, dtype=np.int64).reshape(3, 4)),
+        'tissue/empty.npy': np.zeros((0, 3)),
+        'tissue/names.npy': np.array(['a', 'bb'])
+    }
+    zip_path = write_zip(arrays, compression)
+    with ZipFile(zip_path) as input_zip:
+        for member, expected in arrays.items():
+            array = bundle.load_npy(input_zip, member)
+            assert array.dtype == expected.dtype and array.shape == expected.shape
+            assert np.array_equal(array, expected)
+            assert isinstance(array, np.memmap) == (compression == ZIP_STORED and expected.size > 0)
+    os.remove(zip_path)
+
+
+def test_input_bundle() -> None:
+    arrays = {
+        'baseline/baseline_ld.EUR.npy': np.ones((10, 2)),
+        'overlap/overlap.baseline.EUR.npy': np.ones((2, 2)),
+        'tissue/tissue_ld.a___b.c.EUR.npy': np.ones((10, 1)),
+        'tissue/tissue_parameter_snps.a___b.c.EUR.npy': np.ones((1, 1)),
+        'phenotypes/T2D/y.npy': np.arange(10.0),
+        'phenotypes/BMI/y.npy': np.arange(30.0)
+    }
+    zip_path = write_zip(arrays, ZIP_DEFLATED)
+    with bundle.InputBundle(zip_path, cache_size=200) as input_bundle:
+        assert input_bundle.read_line('version') == '1.0.0'
+        assert input_bundle.index.baseline == ['baseline/baseline_ld.EUR.npy']
+        assert input_bundle.index.overlap == ['overlap/overlap.baseline.EUR.npy']
+        assert input_bundle.index.tissues == {'a___b.c': ['tissue/tissue_ld.a___b.c.EUR.npy',
+                                                          'tissue/tissue_parameter_snps.a___b.c.EUR.npy']}
+        assert list(input_bundle.index.phenotypes) == ['T2D', 'BMI']
+
+        t2d = input_bundle.load_npy('phenotypes/T2D/y.npy')
+        assert not t2d.flags.writeable
+        assert input_bundle.load_npy('phenotypes/T2D/y.npy') is t2d
+        input_bundle.load_npy('baseline/baseline_ld.EUR.npy')  # 160 bytes, evicts the 80 bytes of T2D
+        assert list(input_bundle.cache) == ['baseline/baseline_ld.EUR.npy'] and input_bundle.cached_size == 160
+        input_bundle.load_npy('phenotypes/BMI/y.npy')  # larger than the cache, not kept
+        assert list(input_bundle.cache) == ['baseline/baseline_ld.EUR.npy']
+
+        reopened = pickle.loads(pickle.dumps(input_bundle))  # as sent to a worker process
+        assert reopened.cache_size == 200 and len(reopened.cache) == 0
+        assert np.array_equal(reopened.load_npy('phenotypes/BMI/y.npy'), arrays['phenotypes/BMI/y.npy'])
+        reopened.close()
+    os.remove(zip_path)
@@ -2,7 +2,8 @@ import numpy as np
 from numpy import typing as npt
 import pytest
 from typing import List
-from src.ldsc.sldsc import ldsc
+
+import ldsc
 
 
 def get_xtx_xty(xys: List[List]) -> (npt.NDArray, npt.NDArray):
@@ -124,3 +125,52 @@ def test_integrated_h2() -> None:
     assert pytest.approx(h2[1]['heritability']) == 25.0
     assert pytest.approx(h2[1]['enrichment']) == 2.0
     assert pytest.approx(h2[1]['pValue']) == 0.095466
+
+
+def test_p_values() -> None:
+    p_values = ldsc.get_p_values(np.array([1.0, -1.0, 1.0]), np.array([0.5, 0.5, 0.0]), 10)
+    assert p_values[0] == pytest.approx(0.073388, abs=1e-6)
+    assert p_values[1] == p_values[0]
+    assert np.isnan(p_values[2])
+
+
+def test_h2_batch() -> None:
+    xtx1, xty1 = get_xtx_xty([[1.0, 1.0, 5.0], [1.0, 2.0, 8.0], [2.0, 1.0, 7.0]])
+    xtx2, xty2 = get_xtx_xty([[1.0, 1.0, 10.0], [1.0, 2.0, 16.0], [2.0, 1.0, 14.0]])
+    xtx, xty = np.array([xtx1, xtx2]), np.array([xty1, xty2])
+    overlap_matrix = np.array([[100, 50], [50, 100]])
+    parameter_snps = [np.array([[2.0], [4.0]]), np.array([[3.0], [1.0]])]
+    h2 = ldsc.get_h2_batch(np.array([xtx, xtx[::-1]]), np.array([xty, xty[::-1]]), np.array([overlap_matrix, overlap_matrix]),
+                           np.array(parameter_snps), np.array([0.32, 0.5]), 2.0)
+    assert len(h2) == 2
+    for tissue_h2, expected_h2 in zip(h2, [ldsc.get_h2(xtx, xty, overlap_matrix, parameter_snps[0], 0.32, 2.0),
+                                           ldsc.get_h2(xtx[::-1], xty[::-1], overlap_matrix, parameter_snps[1], 0.5, 2.0)]):
+        for value, expected_value in zip(tissue_h2, expected_h2):
+            assert value == pytest.approx(expected_value)
+
+
+@pytest.mark.parametrize('baseline_rows', [True, False])
+def test_h2_schur(baseline_rows) -> None:
+    rng = np.random.default_rng(0)
+    baseline_x, tissue_x = rng.random((400, 3)), rng.random((400, 2))
+    y = baseline_x.dot([[1.0], [2.0], [0.5]]) + tissue_x.dot([[0.5], [1.0]]) + rng.random((400, 1))
+    separators = np.linspace(0, 400, 21).astype(int)
+    base_x = np.hstack((baseline_x, np.ones((400, 1))))
+    x = np.hstack((baseline_x, tissue_x, np.ones((400, 1))))
+
+    def get_blocks(x1: npt.NDArray, x2: npt.NDArray) -> npt.NDArray:
+        return np.array([x1[a:b].T.dot(x2[a:b]) for a, b in zip(separators[:-1], separators[1:])])
+
+    overlap_matrix = np.diag([1000.0, 200.0, 300.0, 100.0, 150.0])
+    overlap_matrix[0, :] = overlap_matrix[:, 0] = overlap_matrix.diagonal()
+    overlap_matrix[3, 1] = overlap_matrix[1, 3] = 50.0
+    parameter_snps = overlap_matrix.diagonal().reshape(-1, 1)
+    expected_h2 = ldsc.get_h2(get_blocks(x, x), get_blocks(x, y), overlap_matrix, parameter_snps, 2000.0, 10.0)
+
+    baseline_solves = ldsc.get_baseline_solves(get_blocks(base_x, base_x), get_blocks(base_x, y))
+    h2 = ldsc.get_h2_schur(baseline_solves, np.array([get_blocks(base_x, tissue_x)]), np.array([get_blocks(tissue_x, tissue_x)]),
+                           np.array([get_blocks(tissue_x, y)]), np.array([overlap_matrix]), np.array([parameter_snps]),
+                           np.array([2000.0]), 10.0, baseline_rows)[0]
+    assert len(h2) == (5 if baseline_rows else 2)
+    for value, expected_value in zip(h2, expected_h2 if baseline_rows else expected_h2[3:]):
+        assert value == pytest.approx(expected_value, rel=1e-9, abs=1e-9)  # the all SNP row has a roundoff se
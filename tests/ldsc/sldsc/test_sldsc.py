@@ -0,0 +1,106 @@
+from contextlib import closing
+import numpy as np
+import os
+import pytest
+import time
+
+import sldsc
+
+
+def get_tissue_inputs(tissue: str, trait_inputs: sldsc.TraitInputs) -> sldsc.TissueInputs:
+    if tissue == 'bad':
+        raise ValueError(tissue)
+    return sldsc.TissueInputs(tissue, [], trait_inputs.idxs, np.zeros((1, 1)), np.zeros((1, 1)), 0.0)
+
+
+def test_prefetch_tissue_inputs(monkeypatch) -> None:
+    monkeypatch.setattr(sldsc, 'get_tissue_inputs', get_tissue_inputs)
+    monkeypatch.setattr(sldsc, 'PREFETCH_MEMORY', 16)  # two tissues of one column queued at a time
+    trait_inputs = sldsc.TraitInputs(None, 'EUR', np.arange(1), [], np.zeros((1, 1)))
+    tissues = [f'a___{i}' for i in range(10)]
+    assert [tissue_inputs.tissue for tissue_inputs in sldsc.prefetch_tissue_inputs(tissues, trait_inputs)] == tissues
+
+    with closing(sldsc.prefetch_tissue_inputs(tissues, trait_inputs)) as loaded:  # closing early stops the loader
+        assert next(loaded).tissue == 'a___0'
+
+    with pytest.raises(ValueError):
+        list(sldsc.prefetch_tissue_inputs(['a___0', 'bad', 'a___1'], trait_inputs))
+
+
+def test_prefetch_memory(monkeypatch) -> None:
+    monkeypatch.setattr(sldsc, 'PREFETCH_MEMORY', 32)  # one tissue of four columns, or four of one column
+    columns = [4, 1, 4, 4, 1, 1, 1, 1, 4, 4]
+    loaded = []
+
+    def get_inputs(tissue: str) -> sldsc.TissueInputs:
+        loaded.append(tissue)
+        return sldsc.TissueInputs(tissue, [], np.zeros((1, columns[int(tissue)])), np.zeros((1, 1)), np.zeros((1, 1)), 0.0)
+
+    tissues = [str(i) for i in range(len(columns))]
+    for consumed, tissue_inputs in enumerate(sldsc.prefetch_tissues(get_inputs, tissues), 1):
+        assert tissue_inputs.tissue == tissues[consumed - 1]
+        time.sleep(0.05)  # lets the loader fill the queue
+        waiting = sum(8 * columns[int(tissue)] for tissue in loaded[consumed:])
+        assert waiting <= 32 + 32  # the queue, and the tissue loaded next waiting for room
+
+
+def test_regress_trait_batches(monkeypatch) -> None:
+    rng = np.random.default_rng(0)
+    ld_snps, baseline_parameter_snps = 400, np.array([[1e6], [2e5], [3e5]])
+    tissue_lds = {'a___0': rng.random((ld_snps, 1)), 'a___1': rng.random((ld_snps, 1)), 'b___2': rng.random((ld_snps, 2))}
+
+    def load_tissue_inputs(tissue: str, trait_inputs: sldsc.TraitInputs) -> sldsc.TissueInputs:
+        tissue_ld = tissue_lds[tissue]
+        parameter_snps = np.vstack((trait_inputs.baseline_parameter_snps, np.full((tissue_ld.shape[1], 1), 5e4)))
+        overlap_matrix = np.diag(parameter_snps[:, 0])
+        overlap_matrix[0, :], overlap_matrix[:, 0] = parameter_snps[:, 0], parameter_snps[:, 0]
+        variables = trait_inputs.baseline_variables + [f'tissue___{tissue}_{i}' for i in range(tissue_ld.shape[1])]
+        return sldsc.TissueInputs(tissue, variables, tissue_ld, overlap_matrix, parameter_snps, 2e6)
+
+    monkeypatch.setattr(sldsc, 'load_tissue_inputs', load_tissue_inputs)
+    baseline_ld = np.hstack((50 + rng.random((ld_snps, 1)) * 20, rng.random((ld_snps, 2)) * 10))
+    designs, trait_inputs = [], []
+    for snps in [300, 350]:
+        idxs = np.sort(rng.choice(ld_snps, snps, replace=False))
+        chisq, sample_size = 1 + rng.chisquare(1, (snps, 1)), np.full((snps, 1), 1e5)
+        designs.append(sldsc.get_trait_design(baseline_ld, idxs, 1 + rng.random((snps, 1)), chisq, sample_size,
+                                              baseline_parameter_snps))
+        trait_inputs.append(sldsc.TraitInputs(None, 'EUR', idxs, ['baseline___0', 'baseline___1', 'baseline___2'],
+                                              baseline_parameter_snps))
+
+    batches = [['a___0', 'a___1'], ['b___2']]
+    results = sldsc.regress_trait_batches(designs, trait_inputs, batches)
+    assert len(results) == 2
+    for design, inputs, trait_results in zip(designs, trait_inputs, results):
+        assert repr(trait_results) == repr(sldsc.regress_tissue_batches(design, inputs, batches))
+
+
+def test_sldsc_batch_skips(monkeypatch, tmp_path) -> None:
+    datasets = {'passed': {'passed': True}, 'failed': {'passed': False}, 'empty': {'passed': True}, 'old': None}
+    data_paths, metadatas = [], []
+    for name, preflight in datasets.items():
+        os.makedirs(tmp_path / name / 'sldsc' / 'sumstats')
+        if name in ['passed', 'old']:
+            (tmp_path / name / 'sldsc' / 'sumstats' / 'sldsc.sumstats.gz').touch()
+        data_paths.append(str(tmp_path / name))
+        metadatas.append({'ancestry': 'EUR'} if preflight is None else {'ancestry': 'EUR', 'preflight': preflight})
+
+    regressed = []
+
+    def regress_batch_traits(ancestry: str, batch_paths: list, batch_metadatas: list) -> None:
+        regressed.extend(batch_paths)
+        for metadata in batch_metadatas:
+            metadata['version'] = '1.0.0'
+
+    monkeypatch.setattr(sldsc, 'regress_batch_traits', regress_batch_traits)
+    metadatas = sldsc.sldsc_batch(data_paths, metadatas)
+    assert regressed == [str(tmp_path / 'passed'), str(tmp_path / 'old')]
+    assert [metadata.get('skipped') for metadata in metadatas] == [None, 'preflight failed', 'no sumstats', None]
+    assert [metadata.get('version') for metadata in metadatas] == ['1.0.0', None, None, '1.0.0']
+
+
+def test_make_shared_dir(monkeypatch, tmp_path) -> None:
+    monkeypatch.setattr(sldsc, 'SHARED_MEMORY_PATH', str(tmp_path / 'shm'))
+    os.makedirs(tmp_path / 'shm')
+    assert os.path.dirname(sldsc.make_shared_dir(str(tmp_path), 1)) == str(tmp_path / 'shm')
+    assert sldsc.make_shared_dir(str(tmp_path), 1 << 62) is None  # no room in either location
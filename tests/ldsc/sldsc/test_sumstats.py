@@ -0,0 +1,20 @@
+import numpy as np
+from tempfile import TemporaryDirectory
+
+import sumstats
+from make_sumstats import write_binary_sumstats
+
+
+def test_binary_sumstats() -> None:
+    tmp = TemporaryDirectory()
+    z = np.array([np.nan, 1.5, -2.0, np.nan, 3.0])
+    n = np.array([np.nan, 1000.0, 2000.0, np.nan, 3000.0])
+    has_data = np.array([False, True, True, False, True])
+    write_binary_sumstats(f'{tmp.name}/sldsc.sumstats.bin', z, n, has_data)
+    chisq, sample_size, idxs = sumstats.load_binary_sumstats_from(f'{tmp.name}/sldsc.sumstats.bin')
+    assert chisq.shape == (3, 1)
+    assert sample_size.shape == (3, 1)
+    assert chisq[:, 0].tolist() == [2.25, 4.0, 9.0]
+    assert sample_size[:, 0].tolist() == [1000.0, 2000.0, 3000.0]
+    assert idxs.tolist() == [1, 2, 4]
+    tmp.cleanup()
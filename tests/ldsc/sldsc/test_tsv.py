@@ -0,0 +1,43 @@
+import gzip
+import numpy as np
+import pytest
+from tempfile import TemporaryDirectory
+
+import tsv
+
+
+def write_file(file_path: str, text: str) -> str:
+    with gzip.open(file_path, 'wt') if file_path.endswith('.gz') else open(file_path, 'w', newline='') as f:
+        f.write(text)
+    return file_path
+
+
+@pytest.mark.parametrize('read_size', [7, 1 << 24])
+def test_read_columns(read_size, monkeypatch) -> None:
+    monkeypatch.setattr(tsv, 'READ_SIZE', read_size)
+    tmp = TemporaryDirectory()
+    file_path = write_file(f'{tmp.name}/weights.gz', 'CHR\tSNP\tBP\tL2\n1\trs1\t5\t0.5\n\n1\trs2\t6\t\n1\trs3\t7\t1e-3')
+    rsids, l2 = tsv.read_columns(file_path, [1, 3], ['S', float], min_fields=2)
+    assert rsids.tolist() == [b'rs1', b'rs2', b'rs3']
+    assert np.array_equal(l2, [0.5, np.nan, 0.001], equal_nan=True)
+
+    file_path = write_file(f'{tmp.name}/g1000.bim', '1\trs1\t0.1\t100\tA\tC\r\n1\trs2\t0.2\t200\tG\tT\r\n')
+    rsids, cm, bp = tsv.read_columns(file_path, [1, 2, 3], [str, float, int], header=False)
+    assert rsids.tolist() == ['rs1', 'rs2'] and cm.tolist() == [0.1, 0.2] and bp.tolist() == [100, 200]
+    tmp.cleanup()
+
+
+@pytest.mark.parametrize('read_size', [7, 1 << 24])
+def test_read_matrix(read_size, monkeypatch) -> None:
+    monkeypatch.setattr(tsv, 'READ_SIZE', read_size)
+    tmp = TemporaryDirectory()
+    file_path = write_file(f'{tmp.name}/ld.gz', 'CHR\tSNP\tBP\tA\tB\n1\trs1\t5\t0.5\t1\n1\trs2\t6\t\t2\n1\trs3\t7\t3\tnan\n')
+    assert np.array_equal(tsv.read_matrix(file_path, 3), [[0.5, 1.0], [np.nan, 2.0], [3.0, np.nan]], equal_nan=True)
+
+    file_path = write_file(f'{tmp.name}/empty.gz', 'CHR\tSNP\tBP\tA\n')
+    assert tsv.read_matrix(file_path, 3).shape == (0, 1)
+
+    file_path = write_file(f'{tmp.name}/bad.gz', 'CHR\tSNP\tBP\tA\n1\trs1\t5\tx\n')
+    with pytest.raises(ValueError):
+        tsv.read_matrix(file_path, 3)
+    tmp.cleanup()
@@ -0,0 +1,56 @@
+import gzip
+import numpy as np
+import os
+from tempfile import TemporaryDirectory
+import pytest
+
+import weights
+
+
+def make_weights(data_path: str) -> None:
+    os.makedirs(f'{data_path}/weights/EUR', exist_ok=True)
+    for chromosome in range(1, 23):
+        with gzip.open(weights.weights_path(data_path, 'EUR', chromosome), 'wt') as f:
+            f.write('CHR\tSNP\tBP\tL2\n')
+            for i in range(3):
+                f.write(f'{chromosome}\trs{30 - i}_{chromosome}\t{i}\t{chromosome + i / 10}\n')
+
+
+def test_input_weights() -> None:
+    tmp = TemporaryDirectory()
+    make_weights(tmp.name)
+    input_weights = weights.get_input_weights(tmp.name, 'EUR')
+    assert input_weights.shape == (66, 1)
+    assert input_weights[0][0] == 1.0
+    assert input_weights[65][0] == 22.2
+    assert os.path.exists(weights.weights_index_path(tmp.name, 'EUR'))
+
+    # cached binary weights are read without the gzipped files
+    for chromosome in range(1, 23):
+        os.remove(weights.weights_path(tmp.name, 'EUR', chromosome))
+    assert np.array_equal(weights.get_input_weights(tmp.name, 'EUR'), input_weights)
+    tmp.cleanup()
+
+
+def test_rows() -> None:
+    tmp = TemporaryDirectory()
+    make_weights(tmp.name)
+    index = weights.get_weights_index(tmp.name, 'EUR')
+    assert weights.get_rows(index, ['rs30_1', 'rs28_1', 'rs29_22', 'rs1', 'rs30_']).tolist() == [0, 2, 64, -1, -1]
+    tmp.cleanup()
+
+
+def test_save_weights_index(monkeypatch) -> None:
+    tmp = TemporaryDirectory()
+    file_path = f'{tmp.name}/weights.EUR.ldweights'
+    rs_ids, input_weights = np.array([b'rs2', b'rs1']), np.array([1.0, 2.0])
+    weights.save_weights_index(file_path, rs_ids, input_weights)
+    assert os.listdir(tmp.name) == ['weights.EUR.ldweights']  # written through a temporary file in the same directory
+
+    def fail_replace(src: str, dst: str) -> None:
+        raise OSError('replace failed')
+    monkeypatch.setattr(weights.os, 'replace', fail_replace)
+    with pytest.raises(OSError):
+        weights.save_weights_index(f'{tmp.name}/other.ldweights', rs_ids, input_weights)
+    assert os.listdir(tmp.name) == ['weights.EUR.ldweights']  # the temporary file is removed on failure
+    tmp.cleanup()
@@ -1,6 +1,7 @@
 import numpy as np
 import pytest
-from src.ldsc.sldsc import xtx_xty
+
+import xtx_xty
 
 
 def test_weights() -> None:
@@ -35,6 +36,37 @@ def test_xtx() -> None:
             assert xtx_blocks[1, i, j] == pytest.approx(block_2_start[j] + block_2_addition[j] * i)
 
 
+def test_block_xtx() -> None:
+    x = np.random.default_rng(0).random((103, 5))
+    y = np.random.default_rng(1).random((103, 1))
+    separators = xtx_xty.get_separators(x.shape[0], 10)
+    expected_xtx = np.stack([x[a:b].T.dot(x[a:b]) for a, b in zip(separators[:-1], separators[1:])])
+    assert np.array_equal(xtx_xty.get_xtx(x, separators), expected_xtx)
+
+    expected_xty = np.stack([x[a:b].T.dot(y[a:b]) for a, b in zip(separators[:-1], separators[1:])])
+    assert np.array_equal(xtx_xty.get_xty(x, y, separators), expected_xty)
+
+
+def test_group_xtx_xty() -> None:
+    rng = np.random.default_rng(0)
+    base_x, group_ld, y = rng.random((103, 5)), rng.random((103, 4)), rng.random((103, 1))
+    weights, n = rng.random((103, 1)), rng.integers(1000, 2000, (103, 1))
+    separators = xtx_xty.get_separators(103, 10)
+    base_xtx = xtx_xty.get_xtx(base_x, separators)
+    base_xty = xtx_xty.get_xty(base_x, y, separators)
+    columns = [(0, 1), (1, 3), (3, 4)]
+    tissue_lds = [group_ld[:, start:end] for start, end in columns]
+    group_products = xtx_xty.get_group_xtx_xty(base_x, y, tissue_lds, weights, n, separators)
+    assert [tissue_xtx.shape for tissue_xtx in group_products[1]] == [(10, 1, 1), (10, 2, 2), (10, 1, 1)]
+
+    for (start, end), tissue_terms in zip(columns, xtx_xty.split_group_xtx_xty(*group_products, columns)):
+        xtx, xty = xtx_xty.assemble_tissue_xtx_xty(base_xtx, base_xty, *tissue_terms)
+        tissue_x = xtx_xty.get_x(group_ld[:, start:end], weights, n)
+        x = np.hstack((base_x[:, :-1], tissue_x, base_x[:, -1:]))
+        assert np.allclose(xtx, xtx_xty.get_xtx(x, separators), rtol=1e-12)
+        assert np.allclose(xty, xtx_xty.get_xty(x, y, separators), rtol=1e-12)
+
+
 def test_x() -> None:
     ld_matrix = np.array([[0.1, 0.2, 0.3], [0.4, 0.5, 0.6], [0.7, 0.8, 0.9]])
     weights = np.array([[1.0], [0.9], [0.8]])
@@ -68,3 +100,47 @@ def test_separators():
     max_blocks = 11
     separators = xtx_xty.get_separators(snps, max_blocks)
     assert separators == [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+
+
+def test_streamed_xtx_xty(monkeypatch) -> None:
+    monkeypatch.setattr(xtx_xty, 'CHUNK_ROWS', 7)
+    rng = np.random.default_rng(0)
+    baseline_ld, annotation_ld = rng.random((150, 4)), rng.random((150, 1))
+    idxs = rng.choice(150, 103, replace=False)
+    weights, n, y = rng.random((103, 1)), rng.random((103, 1)) * 1000, rng.random((103, 1))
+    separators = xtx_xty.get_separators(103, 10)
+
+    x = np.hstack((xtx_xty.get_x(baseline_ld[idxs, :], weights, n), xtx_xty.get_x(annotation_ld[idxs, :], weights, n),
+                   xtx_xty.get_intercept(103, weights)))
+    design_x = np.empty(x.shape)
+    xtx_xty.gather_ld(design_x, [baseline_ld, annotation_ld], idxs)
+    xtx_xty.scale_x(design_x, weights, n, np.mean(n))
+    assert np.array_equal(design_x, x)
+    xtx, xty = xtx_xty.get_streamed_xtx_xty([baseline_ld, annotation_ld], idxs, weights, n, y, separators)
+    assert np.array_equal(xtx, xtx_xty.get_xtx(x, separators))
+    assert np.array_equal(xty, xtx_xty.get_xty(x, y, separators))
+
+
+def test_float32_xtx_xty() -> None:
+    rng = np.random.default_rng(0)
+    ld, idxs = rng.random((150, 4)), rng.choice(150, 103, replace=False)
+    weights, n, y = rng.random((103, 1)), rng.random((103, 1)) * 1000, rng.random((103, 1))
+    separators = xtx_xty.get_separators(103, 10)
+    xtx, xty = xtx_xty.get_streamed_xtx_xty([ld], idxs, weights, n, y, separators)
+    xtx_32, xty_32 = xtx_xty.get_streamed_xtx_xty([ld], idxs, weights, n, y, separators, dtype=np.dtype(np.float32))
+    assert xtx_32.dtype == np.float64 and not np.array_equal(xtx_32, xtx)
+    assert np.allclose(xtx_32, xtx, rtol=1e-5) and np.allclose(xty_32, xty, rtol=1e-5)
+
+    assert xtx_xty.get_spot_check_difference([ld], idxs, weights, n, y, xtx, xty, separators, [0, 9]) == 0
+    assert 0 < xtx_xty.get_spot_check_difference([ld], idxs, weights, n, y, xtx_32, xty_32, separators, [0, 9]) < 1e-5
+
+
+def test_float32_block_accumulation() -> None:
+    rng = np.random.default_rng(0)
+    x, y = rng.random((1200000, 3)).astype(np.float32), rng.random((1200000, 1))
+    separators = [0, 1100000, 1200000]  # a block as large as a jackknife block of the full SNP set
+    expected_x = x.astype(np.float64)
+    for actual, expected in [(xtx_xty.get_xtx(x, separators), xtx_xty.get_xtx(expected_x, separators)),
+                             (xtx_xty.get_xty(x, y, separators), xtx_xty.get_xty(expected_x, y, separators))]:
+        assert actual.dtype == np.float64
+        assert np.allclose(actual, expected, rtol=1e-12, atol=0)
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# sumstats modules import their siblings (some symlinked from src/ldsc/sldsc) as top level modules, as when run from
+# src/ldsc/sumstats
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', 'src', 'ldsc', 'sumstats'))
@@ -0,0 +1,57 @@
+import gzip
+import os
+import struct
+import tempfile
+import zlib
+
+import pytest
+import reader
+from reader import open_gzip
+
+
+def bgzf_compress(data: bytes, block_size: int) -> bytes:
+    blocks = []
+    for start in range(0, len(data), block_size):
+        chunk = data[start:start + block_size]
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        deflated = compressor.compress(chunk) + compressor.flush()
+        header = b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00'
+        blocks.append(header + struct.pack('<H', len(header) + len(deflated) + 8 + 1) + deflated +
+                      struct.pack('<II', zlib.crc32(chunk), len(chunk)))
+    blocks.append(bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000'))  # EOF block
+    return b''.join(blocks)
+
+
+def get_text() -> str:
+    return 'chromosome\tposition\tpValue\n' + ''.join(f'{i % 22 + 1}\t{i}\t0.{i}\r\n' for i in range(10000))
+
+
+def write_file(data: bytes) -> str:
+    fd, file_path = tempfile.mkstemp(suffix='.gz')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    return file_path
+
+
+@pytest.mark.parametrize('compress', [
+    lambda data: gzip.compress(data),
+    lambda data: gzip.compress(data[:1000]) + gzip.compress(data[1000:]),
+    lambda data: bgzf_compress(data, 997)
+])
+def test_open_gzip(compress, monkeypatch) -> None:
+    monkeypatch.setattr(reader, 'BGZF_BATCH_BLOCKS', 3)
+    monkeypatch.setattr(reader, 'QUEUE_SIZE', 2)
+    file_path = write_file(compress(get_text().encode()))
+    with open_gzip(file_path) as f_in, gzip.open(file_path, 'rt') as f_expected:
+        assert list(f_in) == list(f_expected)
+    with open_gzip(file_path) as f_in:  # closing before the end stops the producer
+        assert next(f_in) == 'chromosome\tposition\tpValue\n'
+    os.remove(file_path)
+
+
+def test_open_truncated_gzip() -> None:
+    file_path = write_file(gzip.compress(get_text().encode())[:-100])
+    with pytest.raises(EOFError):
+        with open_gzip(file_path) as f_in:
+            list(f_in)
+    os.remove(file_path)
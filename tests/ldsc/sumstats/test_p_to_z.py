@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+from make_sumstats import p_to_z, p_to_z_batch, parse_log_p
+
+
+def test_p_to_z_batch() -> None:
+    p_values = np.array([1E-5, 2E-5, 0.5, 1.0, 1E-300])
+    betas = np.array([2.0, -2.1, -0.1, 3.0, 1.0])
+    zs = p_to_z_batch(p_values, betas)
+    for i in range(len(p_values)):
+        assert zs[i] == pytest.approx(p_to_z(p_values[i], betas[i]))
+
+
+def test_p_to_z_batch_log_space() -> None:
+    p_values = np.array([1E-250, 1E-301, 1E-305])
+    betas = np.array([1.0, -1.0, 1.0])
+    zs = p_to_z_batch(p_values, betas)
+    for i in range(len(p_values)):
+        assert zs[i] == pytest.approx(p_to_z(p_values[i], betas[i]))
+
+    # underflows a float, z from the asymptotic sqrt(-2 * log(p)) is within a small correction
+    zs = p_to_z_batch(np.array([0.0]), np.array([-1.0]), np.array([parse_log_p('1E-400')]))
+    assert zs[0] == pytest.approx(-42.8264, abs=1E-4)
+
+
+def test_parse_log_p() -> None:
+    assert parse_log_p('1E-400') == pytest.approx(-400 * np.log(10))
+    assert parse_log_p('2.5e-1000') == pytest.approx(np.log(2.5) - 1000 * np.log(10))
+    assert parse_log_p('0') == -np.inf
+    assert parse_log_p('-1E-400') == -np.inf
+    assert parse_log_p('NA') == -np.inf
@@ -1,7 +1,15 @@
 import gzip
+import os
 from tempfile import TemporaryDirectory
 from typing import Dict, List
-from src.ldsc.sumstats.main import stream_to_data, p_to_z
+import numpy as np
+
+import make_sumstats
+import sumstats
+import weights
+from make_sumstats import stream_to_data, p_to_z, encode_variants, flip_alleles, lookup_rs_idxs, var_to_rs_index_from, VariantIndex, \
+    open_var_to_rs_index, save_var_to_rs_index, make_probe_index, preflight
+from main import stream_to_methods
 
 
 def get_header():
@@ -16,15 +24,19 @@ def get_metadata(sep: str) -> Dict:
 
 
 def get_var_to_rs_map() -> Dict:
-    return {'1:1:A:B': 'rs_1', '1:2:B:A': 'rs_2', '1:3:C:D': 'rs_3'}
+    return {'1:1:A:C': 'rs_1', '1:2:C:A': 'rs_2', '1:3:G:T': 'rs_3'}
 
 
 def get_flipped_var_to_rs_map() -> Dict:
-    return {'1:4:D:C': 'rs_4', '1:5:E:F': 'rs_5', '1:6:F:E': 'rs_6'}
+    return {'1:4:T:G': 'rs_4', '1:5:A:G': 'rs_5', '1:6:G:A': 'rs_6'}
+
+
+def get_var_to_rs_index() -> VariantIndex:
+    return var_to_rs_index_from(get_var_to_rs_map(), get_flipped_var_to_rs_map())
 
 
 def default_line() -> Dict:
-    return {'chromosome': '1', 'position': 1, 'reference': 'A', 'alt': 'B', 'pValue': 1E-5, 'beta': 2.0, 'n': 10000.0}
+    return {'chromosome': '1', 'position': 1, 'reference': 'A', 'alt': 'C', 'pValue': 1E-5, 'beta': 2.0, 'n': 10000.0}
 
 
 def get_line(overrides: Dict) -> Dict:
@@ -46,12 +58,12 @@ def valid_lines() -> List:
     return [
         get_line({'position': position, 'reference': reference, 'alt': alt, 'pValue':  pValue, 'beta': beta, 'n': n})
         for position, reference, alt, pValue, beta, n in [
-            (1, 'A', 'B', 1E-5, 2.0, 10000.0),
-            (2, 'B', 'A', 2E-5, 2.1, 11000.0),
-            (3, 'C', 'D', 3E-5, 2.2, 12000.0),
-            (4, 'D', 'C', 4E-5, 2.3, 13000.0),
-            (5, 'E', 'F', 5E-5, 2.4, 14000.0),
-            (6, 'F', 'E', 6E-5, 2.5, 15000.0)
+            (1, 'A', 'C', 1E-5, 2.0, 10000.0),
+            (2, 'C', 'A', 2E-5, 2.1, 11000.0),
+            (3, 'G', 'T', 3E-5, 2.2, 12000.0),
+            (4, 'T', 'G', 4E-5, 2.3, 13000.0),
+            (5, 'A', 'G', 5E-5, 2.4, 14000.0),
+            (6, 'G', 'A', 6E-5, 2.5, 15000.0)
         ]
     ]
 
@@ -60,7 +72,7 @@ def test_valid_csv_stream() -> None:
     metadata = get_metadata(',')
     lines = valid_lines()
     tmp = make_file(lines)
-    out, count = stream_to_data(f'{tmp.name}/test.csv.gz', get_var_to_rs_map(), get_flipped_var_to_rs_map(), metadata)
+    out, count = stream_to_data(f'{tmp.name}/test.csv.gz', get_var_to_rs_index(), metadata)
     assert count['all'] == 6
     assert count['error'] == 0
     assert count['flipped'] == 3
@@ -74,6 +86,29 @@ def test_valid_csv_stream() -> None:
     tmp.cleanup()
 
 
+def test_stream_to_methods() -> None:
+    metadata = get_metadata(',')
+    lines = valid_lines()
+    lines[0]['chromosome'] = '2'
+    lines[2]['pValue'] = 'x'
+    lines[3]['pValue'] = 2.0
+    tmp = make_file(lines)
+    os.makedirs(f'{tmp.name}/raw')
+    os.rename(f'{tmp.name}/test.csv.gz', f'{tmp.name}/raw/test.csv.gz')
+    metadata['file'] = 'test.csv.gz'
+    rs_map = {('1', '2'): 'rs_2', ('1', '3'): 'rs_3', ('1', '5'): 'rs_5'}
+    sldsc_data, magma_data, counts = stream_to_methods(tmp.name, get_var_to_rs_index(), rs_map, metadata)
+    assert (sldsc_data, counts['sldsc']) == stream_to_data(f'{tmp.name}/raw/test.csv.gz', get_var_to_rs_index(), metadata)
+    assert magma_data == [('rs_2', 2E-5, 11000.0), ('rs_5', 5E-5, 14000.0)]
+    assert counts['magma'] == {'all': 6, 'error': 1, 'final': 2}
+    assert counts['pigean'] == {'all': 6, 'translated': 4, 'skipped': 1, 'error': 1}
+    with gzip.open(f'{tmp.name}/pigean/sumstats/pigean.sumstats.gz', 'rt') as f:
+        assert f.readline() == 'CHROM\tPOS\tP\tN\n'
+        assert f.readline() == '2\t1\t1e-05\t10000.0\n'
+        assert len(f.readlines()) == 3
+    tmp.cleanup()
+
+
 def test_skipped_csv_stream() -> None:
     metadata = get_metadata(',')
     lines = valid_lines()
@@ -82,7 +117,7 @@ def test_skipped_csv_stream() -> None:
     lines[4]['reference'] = 'fake'
     lines[5]['alt'] = 'fake'
     tmp = make_file(lines)
-    out, count = stream_to_data(f'{tmp.name}/test.csv.gz', get_var_to_rs_map(), get_flipped_var_to_rs_map(), metadata)
+    out, count = stream_to_data(f'{tmp.name}/test.csv.gz', get_var_to_rs_index(), metadata)
     assert count['all'] == 6
     assert count['error'] == 0
     assert count['flipped'] == 1
@@ -98,7 +133,7 @@ def test_error_csv_stream() -> None:
         line = get_line({header: ''})
         lines.append(line)
     tmp = make_file(lines)
-    out, count = stream_to_data(f'{tmp.name}/test.csv.gz', get_var_to_rs_map(), get_flipped_var_to_rs_map(), metadata)
+    out, count = stream_to_data(f'{tmp.name}/test.csv.gz', get_var_to_rs_index(), metadata)
     assert count['all'] == 6 + len(headers)
     assert count['error'] == 2  # beta and n fail to cast in translation
     assert count['flipped'] == 3
@@ -110,7 +145,7 @@ def test_tsv() -> None:
     metadata = get_metadata('\t')
     lines = valid_lines()
     tmp = make_file(lines, '\t')
-    out, count = stream_to_data(f'{tmp.name}/test.csv.gz', get_var_to_rs_map(), get_flipped_var_to_rs_map(), metadata)
+    out, count = stream_to_data(f'{tmp.name}/test.csv.gz', get_var_to_rs_index(), metadata)
     assert count['all'] == 6
     assert count['error'] == 0
     assert count['flipped'] == 3
@@ -121,8 +156,140 @@ def test_not_a_csv() -> None:
     metadata = get_metadata(',')
     lines = valid_lines()
     tmp = make_file(lines, '\t')
-    out, count = stream_to_data(f'{tmp.name}/test.csv.gz', get_var_to_rs_map(), get_flipped_var_to_rs_map(), metadata)
+    out, count = stream_to_data(f'{tmp.name}/test.csv.gz', get_var_to_rs_index(), metadata)
     assert count['all'] == 6
     assert count['error'] == 0
     assert count['flipped'] == 0
     assert count['translated'] == 0
+
+
+def test_chunked_stream(monkeypatch) -> None:
+    monkeypatch.setattr(make_sumstats, 'CHUNK_SIZE', 4)
+    metadata = get_metadata(',')
+    lines = valid_lines()
+    lines.append(get_line({'beta': ''}))
+    tmp = make_file(lines)
+    out, count = stream_to_data(f'{tmp.name}/test.csv.gz', get_var_to_rs_index(), metadata)
+    assert count['all'] == 7
+    assert count['error'] == 1
+    assert count['flipped'] == 3
+    assert count['translated'] == 6
+    assert out[3] == ('rs_4', p_to_z(4E-5, -2.3), 13000.0)
+    assert out[5] == ('rs_6', p_to_z(6E-5, -2.5), 15000.0)
+    tmp.cleanup()
+
+
+def test_parallel_stream(monkeypatch) -> None:
+    monkeypatch.setattr(make_sumstats, 'CHUNK_SIZE', 2)
+    metadata = get_metadata(',')
+    lines = valid_lines() + valid_lines()
+    lines[1]['beta'] = ''
+    lines[8]['pValue'] = 'x'
+    lines[10]['chromosome'] = '2'
+    tmp = make_file(lines)
+    out, count = stream_to_data(f'{tmp.name}/test.csv.gz', get_var_to_rs_index(), metadata)
+    assert stream_to_data(f'{tmp.name}/test.csv.gz', get_var_to_rs_index(), metadata, 3) == (out, count)
+    assert count['all'] == 12
+    assert count['error'] == 2
+    assert count['translated'] == 9
+    tmp.cleanup()
+
+
+def test_short_rows_stream() -> None:
+    metadata = get_metadata('\t')
+    tmp = TemporaryDirectory()
+    with gzip.open(f'{tmp.name}/test.csv.gz', 'wt') as f:
+        f.write('\t'.join(get_header()) + '\n')
+        f.write('1\t1\tA\tC\t1E-5\t2.0\t10000.0\n')
+        f.write('1\t2\tC\tA\t2E-5\t2.1\t\n')  # trailing empty n is stripped and so missing
+        f.write('1\t3\tG\n')
+    out, count = stream_to_data(f'{tmp.name}/test.csv.gz', get_var_to_rs_index(), metadata)
+    assert count['all'] == 3
+    assert count['error'] == 0
+    assert count['translated'] == 1
+    assert out[0] == ('rs_1', p_to_z(1E-5, 2.0), 10000.0)
+    tmp.cleanup()
+
+
+def test_effective_n_sumstats() -> None:
+    tmp = make_file(valid_lines())
+    metadata = {**get_metadata(','), 'effective_n': 10000}
+    out, count = stream_to_data(f'{tmp.name}/test.csv.gz', get_var_to_rs_index(), metadata)
+    assert [type(n) for _, _, n in out] == [int] * 6
+
+    weights.save_weights_index(f'{tmp.name}/test.ldweights', np.array([b'rs_1', b'rs_7', b'rs_2']), np.ones(3))
+    index = weights.open_weights_index(f'{tmp.name}/test.ldweights')
+    z, n, has_data = make_sumstats.get_aligned_data(index, make_sumstats.filter_data_to_dict(out))
+    z = make_sumstats.get_rounded_z(z, has_data)
+    make_sumstats.write_sumstats(f'{tmp.name}/sldsc.sumstats.gz', index.rs_ids, z, n, has_data)
+    with gzip.open(f'{tmp.name}/sldsc.sumstats.gz', 'rt') as f:
+        assert [line.split('\t')[2] for line in f.read().splitlines()] == ['N', '10000', '', '10000']
+    make_sumstats.write_binary_sumstats(f'{tmp.name}/sldsc.sumstats.bin', z, n, has_data)
+    assert sumstats.load_binary_sumstats_from(f'{tmp.name}/sldsc.sumstats.bin')[1][:, 0].tolist() == [10000.0, 10000.0]
+    tmp.cleanup()
+
+
+def test_var_to_rs_index() -> None:
+    index = var_to_rs_index_from({'1:1:A:C': 'rs_1', '1:1:T:G': 'rs_1', '22:100:G:A': 'rs_2', 'X:5:C:T': 'rs_3', '1:2:AT:C': 'rs_4'},
+                                 {'1:1:C:A': 'rs_1', '22:100:G:A': 'rs_5'})
+    assert len(index.keys) == 5  # multi-base alleles are not in the snpmap
+    keys, encodable = encode_variants(['1', '22', '1', 'chr1', '1', 'X', '1'], ['1', '100', '01', '1', '1', '5', '1'],
+                                      ['a', 'G', 'A', 'A', 'A', 'C', 'C'], ['c', 'A', 'C', 'C', 'G', 'T', 'A'])
+    rs_idxs, flipped = lookup_rs_idxs(index, keys, encodable)
+    assert [index.rs_ids[idx] if idx >= 0 else None for idx in rs_idxs] == ['rs_1', 'rs_5', None, None, None, 'rs_3', 'rs_1']
+    assert flipped.tolist() == [False, True, False, False, False, False, True]
+
+
+def test_flip_alleles() -> None:
+    keys, _ = encode_variants(['1', '2'], ['10', '20'], ['A', 'G'], ['C', 'T'])
+    flipped_keys, _ = encode_variants(['1', '2'], ['10', '20'], ['C', 'T'], ['A', 'G'])
+    assert flip_alleles(keys).tolist() == flipped_keys.tolist()
+    assert flip_alleles(flipped_keys).tolist() == keys.tolist()
+
+
+def test_binary_var_to_rs_index() -> None:
+    tmp = TemporaryDirectory()
+    index = get_var_to_rs_index()
+    save_var_to_rs_index(f'{tmp.name}/test.snpmap', index)
+    binary_index = open_var_to_rs_index(f'{tmp.name}/test.snpmap')
+    assert binary_index.keys.tolist() == index.keys.tolist()
+    assert binary_index.flipped.tolist() == index.flipped.tolist()
+    assert binary_index.rs_ids[binary_index.rs_idxs].astype(str).tolist() == index.rs_ids[index.rs_idxs].tolist()
+
+    data_tmp = make_file(valid_lines())
+    out, count = stream_to_data(f'{data_tmp.name}/test.csv.gz', binary_index, get_metadata(','))
+    assert stream_to_data(f'{data_tmp.name}/test.csv.gz', binary_index, get_metadata(','), 2) == (out, count)
+    assert count['flipped'] == 3
+    assert count['translated'] == 6
+    assert out[3] == ('rs_4', p_to_z(4E-5, -2.3), 13000.0)
+    data_tmp.cleanup()
+    tmp.cleanup()
+
+
+def test_preflight() -> None:
+    metadata = get_metadata(',')
+    lines = valid_lines() * 20
+    tmp = make_file(lines)
+    probe_index = make_probe_index(get_var_to_rs_index())
+    result = preflight(f'{tmp.name}/test.csv.gz', metadata, probe_index)
+    assert result['passed']
+    assert result['parse_rates'] == {'pValue': 1.0, 'beta': 1.0, 'n': 1.0}
+    assert result['snpmap_probed'] == 0 and result['snpmap_hit_rate'] is None
+
+    result = preflight(f'{tmp.name}/test.csv.gz', get_metadata('\t'), probe_index)
+    assert not result['passed'] and result['reason'] == 'separator'
+
+    metadata['col_map']['pValue'] = 'p'
+    result = preflight(f'{tmp.name}/test.csv.gz', metadata, probe_index)
+    assert result['reason'] == 'missing_columns' and result['missing_columns'] == ['pValue']
+    tmp.cleanup()
+
+    tmp = make_file([get_line({'position': 64 * i, 'beta': 'x' if i % 3 != 0 else 1.0}) for i in range(1, 151)])
+    result = preflight(f'{tmp.name}/test.csv.gz', get_metadata(','), None)
+    assert result['reason'] == 'unparseable_columns' and result['parse_rates']['beta'] == 50 / 150
+    tmp.cleanup()
+
+    tmp = make_file([get_line({'position': 64 * i}) for i in range(1, 151)])
+    result = preflight(f'{tmp.name}/test.csv.gz', get_metadata(','), probe_index)
+    assert result['reason'] == 'snpmap_hit_rate' and result['snpmap_probed'] == 150 and result['snpmap_hit_rate'] == 0.0
+    tmp.cleanup()
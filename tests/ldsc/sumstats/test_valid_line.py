@@ -1,5 +1,5 @@
 from typing import Dict
-from src.ldsc.sumstats.main import valid_line, var_id_columns
+from make_sumstats import valid_line, var_id_columns
 
 
 def get_valid_line_data() -> (Dict, Dict):
@@ -0,0 +1,61 @@
+import importlib.util
+import json
+import os
+import shlex
+import shutil
+import sys
+
+import pytest
+
+src = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+
+def load_module(name: str, file_path: str):
+    spec = importlib.util.spec_from_file_location(name, file_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def write_bucket(bucket: str) -> None:
+    dataset_path = f'{bucket}/userdata/user/genetic/dataset'
+    os.makedirs(f'{dataset_path}/raw')
+    with open(f'{dataset_path}/raw/metadata', 'w') as f:  # the raw file itself is not there, it must not be read
+        json.dump({'file': 'gwas.tsv.gz', 'genome_build': 'GRCh37', 'separator': '\t', 'col_map': {}}, f)
+    counts = {'all': 3, 'error': 0, 'translated': 2, 'final': 2}
+    for method, file in [('magma', 'magma.sumstats.csv'), ('pigean', 'pigean.sumstats.gz')]:
+        os.makedirs(f'{dataset_path}/{method}/sumstats')
+        with open(f'{dataset_path}/{method}/sumstats/{file}', 'w') as f:
+            f.write('')
+        with open(f'{dataset_path}/{method}/sumstats/metadata', 'w') as f:
+            json.dump({'counts': counts}, f)
+
+
+# src/main.py for the magma and pigean jobs, with aws copying from a local bucket and the method's sumstats step run in
+# place of its main.py, which must pick up the munged sumstats downloaded with the raw data
+@pytest.mark.parametrize('method', ['magma', 'pigean'])
+def test_reuse_munged_sumstats(method, tmp_path, monkeypatch) -> None:
+    bucket = str(tmp_path / 'bucket')
+    write_bucket(bucket)
+    monkeypatch.setenv('S3_BUCKET', bucket)
+    monkeypatch.setenv('INPUT_PATH', str(tmp_path / 'inputs'))
+    monkeypatch.chdir(src)
+    job_main = load_module('job_main', f'{src}/main.py')
+    results = []
+
+    def check_call(cmd, shell: bool = False, cwd: str = None) -> None:
+        if shell:  # aws s3 cp <from> <to> --recursive, a missing prefix copies nothing
+            _, _, _, from_path, to_path, _ = shlex.split(cmd)
+            if os.path.isdir(from_path):
+                shutil.copytree(from_path, to_path, dirs_exist_ok=True)
+        else:
+            data_path = cmd[2][len('--dir='):]
+            monkeypatch.syspath_prepend(f'{src}/{cwd}')
+            sumstats = load_module(f'{method}_sumstats', f'{src}/{cwd}/sumstats.py')
+            with open(f'{data_path}/raw/metadata', 'r') as f:
+                results.append(sumstats.main(data_path, json.load(f)))
+
+    monkeypatch.setattr(job_main.subprocess, 'check_call', check_call)
+    monkeypatch.setattr(sys, 'argv', ['main.py', '--username=user', '--dataset=dataset', f'--method={method}'])
+    job_main.main()
+    assert results[0]['counts'] == {'all': 3, 'error': 0, 'translated': 2, 'final': 2}